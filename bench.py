@@ -0,0 +1,188 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import route_engine
+import route_graph
+from datagen import generate_inputs
+
+# ==================== 基准测试 ====================
+# 按规模档位生成模拟数据，分别计时 PART A / PART B / PART C，记录各阶段的峰值内存与候选记录数，
+# 并与原始逐行实现（engine="reference"，PART C 见 _reference_optimal）的结果核对。结果保存为 JSON，便于比较不同版本的性能。
+#
+#   python bench.py                       # 运行全部档位，结果写入 bench_results/
+#   python bench.py --tiers small medium --output before.json
+
+# 各档位的 generate_inputs 参数；reference 为是否与逐行实现核对（逐行实现在大档位上很慢），
+# graph 为是否与费用图实现（route_graph）核对。
+# blank 档位的价格列有部分留空，用于核对剪枝与费用图对空值费用的处理（结果应与不剪枝时相同）
+TIERS = {
+    "small":  {"params": dict(n_mines=50, n_rail_ports=5, n_seaports=5, n_terminals=3,
+                              n_unload_ports=5, n_unload_terminals=3), "reference": True, "graph": True},
+    "blank":  {"params": dict(n_mines=200, n_rail_ports=5, n_seaports=5, n_terminals=3,
+                              n_unload_ports=5, n_unload_terminals=3, blank_rate=0.1), "reference": True,
+              "graph": True},
+    "medium": {"params": dict(n_mines=500, n_rail_ports=10, n_seaports=10, n_terminals=4,
+                              n_unload_ports=10, n_unload_terminals=4), "reference": False, "graph": False},
+    "large":  {"params": dict(n_mines=2000, n_rail_ports=20, n_seaports=20, n_terminals=4,
+                              n_unload_ports=30, n_unload_terminals=5), "reference": False, "graph": False},
+    "xlarge": {"params": dict(n_mines=10000, n_rail_ports=40, n_seaports=30, n_terminals=5,
+                              n_unload_ports=40, n_unload_terminals=5), "reference": False, "graph": False},
+}
+
+
+def _stages(tables, prune):
+    """依次执行 PART A / B / C，逐个产出 (阶段名, 函数)，函数返回该阶段的输出表。"""
+    df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao = tables
+    out = {}
+    yield "PART A", lambda: out.setdefault("m2s", route_engine.compute_mine_to_sea(df_caigoujia, df_qianzhi))
+    yield "PART B", lambda: out.setdefault("final", route_engine.compute_candidates(
+        out["m2s"], df_gangkou, df_haiyun, df_duandao, prune=prune))
+    yield "PART C", lambda: out.setdefault("optimal", route_engine.select_optimal(out["final"]))
+
+
+def _measure(tables, prune, repeat, memory):
+    """计时取 repeat 次中最快的一次；memory=True 时另跑一遍（开启 tracemalloc）记录各阶段峰值内存。"""
+    stages = {}
+    result = None
+    for _ in range(repeat):
+        for name, run in _stages(tables, prune):
+            start = time.perf_counter()
+            result = run()
+            elapsed = time.perf_counter() - start
+            stage = stages.setdefault(name, {"seconds": elapsed, "rows": len(result)})
+            stage["seconds"] = min(stage["seconds"], elapsed)
+    if memory:
+        # tracemalloc 本身开销较大，因此与计时分开运行
+        tracemalloc.start()
+        try:
+            for name, run in _stages(tables, prune):
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+                run()
+                stages[name]["peak_mib"] = round((tracemalloc.get_traced_memory()[1] - base) / 2 ** 20, 2)
+        finally:
+            tracemalloc.stop()
+    for stage in stages.values():
+        stage["seconds"] = round(stage["seconds"], 4)
+    return stages, result
+
+
+def _reference_optimal(df_final):
+    """
+    核对用的 PART C，不经过 route_engine.select_optimal：即原始实现的“按总费用排序后每组取第一条”，
+    改为稳定排序（空值视为无穷大，同价时原顺序在前）并取整行，再按分组键、总费用依次稳定排序输出。
+    """
+    parts = []
+    for flag, keys in (("否", ["矿山", "卸货码头"]), ("是", ["发货港", "卸货码头"])):
+        df = df_final[df_final["是否平仓价发货"]==flag]
+        cost = pd.to_numeric(df["总费用"], errors="coerce").fillna(np.inf)
+        df = df.iloc[np.argsort(cost.to_numpy(dtype=float), kind="stable")]
+        parts.append(df.groupby(keys, sort=False).head(1).sort_values(keys, kind="stable"))
+    df_opt = pd.concat(parts, ignore_index=True).sort_values("总费用", kind="stable")
+    return df_opt[route_engine.OUTPUT_COLUMNS]
+
+
+def _equivalent(expected, actual):
+    """按行顺序与数值核对两个结果表（不比较 dtype：逐行实现输出的列多为 object）。"""
+    try:
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual.reset_index(drop=True),
+                                      check_dtype=False)
+    except AssertionError as e:
+        return False, str(e).splitlines()[0]
+    return True, None
+
+
+def run_tier(name, params, reference=False, graph=False, repeat=1, memory=True, seed=0):
+    """运行一个档位，返回该档位的测量结果。"""
+    tables = generate_inputs(seed=seed, **params)
+    record = {"tier": name, "params": dict(params, seed=seed), "input_rows": {
+        key: len(df) for key, df in zip(["采购价", "前置运输", "港口基础信息", "海运费", "短倒费"], tables)}}
+    for mode, prune in (("pruned", True), ("unpruned", False)):
+        stages, result = _measure(tables, prune, repeat, memory)
+        record[mode] = {"stages": stages, "total_seconds": round(sum(s["seconds"] for s in stages.values()), 4)}
+        if mode == "pruned":
+            optimal = result
+        else:
+            ok, message = _equivalent(result, optimal)
+            record["pruned"]["matches_unpruned"] = ok
+            if message:
+                record["pruned"]["mismatch"] = message
+    if reference:
+        df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao = tables
+        start = time.perf_counter()
+        m2s = route_engine.compute_mine_to_sea(df_caigoujia, df_qianzhi, engine="reference")
+        expected = _reference_optimal(route_engine.compute_candidates(
+            m2s, df_gangkou, df_haiyun, df_duandao, engine="reference"))
+        ok, message = _equivalent(expected, optimal)
+        record["reference"] = {"seconds": round(time.perf_counter() - start, 4), "matches": ok}
+        if message:
+            record["reference"]["mismatch"] = message
+    if graph:
+        df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao = tables
+        start = time.perf_counter()
+        result = route_graph.solve_routes(route_graph.build_route_graph(
+            df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao))
+        ok, message = _equivalent(optimal, result)
+        record["graph"] = {"seconds": round(time.perf_counter() - start, 4), "matches": ok}
+        if message:
+            record["graph"]["mismatch"] = message
+    return record
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路径规划基准测试")
+    parser.add_argument("--tiers", nargs="+", default=list(TIERS), choices=list(TIERS))
+    parser.add_argument("--repeat", type=int, default=3, help="每个阶段计时的重复次数（取最快一次）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="不记录峰值内存")
+    parser.add_argument("--no-reference", action="store_true", help="不与逐行实现核对")
+    parser.add_argument("--no-graph", action="store_true", help="不与费用图实现核对")
+    parser.add_argument("--output", help="结果 JSON 路径，默认 bench_results/<时间>.json")
+    args = parser.parse_args()
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "commit": _git_commit(),
+        "python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+        "tiers": [],
+    }
+    failed = False
+    for name in args.tiers:
+        tier = TIERS[name]
+        record = run_tier(name, tier["params"], reference=tier["reference"] and not args.no_reference,
+                          graph=tier["graph"] and not args.no_graph,
+                          repeat=args.repeat, memory=not args.no_memory, seed=args.seed)
+        report["tiers"].append(record)
+        failed |= not record["pruned"]["matches_unpruned"] or not all(
+            record.get(check, {}).get("matches", True) for check in ("reference", "graph"))
+        stages = record["pruned"]["stages"]
+        print("{:<7} A {:>8.4f}s  B {:>8.4f}s ({} 行)  C {:>8.4f}s ({} 行)  unpruned B {} 行  reference {}  graph {}".format(
+            name, stages["PART A"]["seconds"], stages["PART B"]["seconds"], stages["PART B"]["rows"],
+            stages["PART C"]["seconds"], stages["PART C"]["rows"], record["unpruned"]["stages"]["PART B"]["rows"],
+            *(record[check]["matches"] if check in record else "-" for check in ("reference", "graph"))))
+
+    output = args.output or os.path.join("bench_results", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print("结果已保存到", output)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
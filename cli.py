@@ -0,0 +1,119 @@
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# ==================== 命令行批量运算 ====================
+# 不经过 Web 层，对多个输入目录（如各地区、各月份）并发运行 process_files，按所选格式写出结果并打印各次运算的耗时。
+# 启动时只导入标准库：pandas、route_engine、export 等在各运算进程中才导入，供定时任务调用时启动快。
+#
+#   python cli.py data/华南-202609 data/华东-202609 --output-dir results --format csv --jobs 4
+#
+# 每个目录中按文件名识别五个输入文件（文件名包含表名即可，如“路径规划-采购价.xlsx”），
+# 结果写为 <输出目录>/路径规划-输出-<目录名>.<格式>。任一目录运算失败时退出码为 1。
+
+# 表名，顺序同 route_engine.load_inputs 的参数
+INPUT_TABLES = ("采购价", "前置运输", "港口基础信息", "海运费", "短倒费")
+INPUT_SUFFIXES = (".xlsx", ".xls")
+# 同 export.EXPORT_FORMATS 与 route_engine.ENGINES（此处不导入，避免启动时导入 pandas）
+OUTPUT_FORMATS = ("xlsx", "csv", "parquet")
+ENGINES = ("vectorized", "reference", "graph", "sql")
+
+
+def find_inputs(folder):
+    """在目录中找出五个输入文件，顺序同 INPUT_TABLES；缺少或有多个候选文件时抛出 ValueError。"""
+    names = [name for name in sorted(os.listdir(folder))
+             if name.lower().endswith(INPUT_SUFFIXES) and not name.startswith("~$")]
+    files = []
+    for table in INPUT_TABLES:
+        matched = [name for name in names if table in name]
+        if len(matched) != 1:
+            raise ValueError(folder + " 中" + ("缺少" if not matched else "有多个") + "“" + table + "”输入文件"
+                             + ("" if not matched else ": " + "、".join(matched)))
+        files.append(os.path.join(folder, matched[0]))
+    return files
+
+
+def run_one(name, files, output, fmt, options):
+    """在运算进程中运行一个目录：运算、导出，返回各阶段耗时；失败时返回错误信息而不抛出。"""
+    # 各运算进程第一次运行时才导入，导入时间不计入运算耗时
+    import metrics
+    from export import export_result
+    from route_engine import process_files
+    started = time.perf_counter()
+    try:
+        recorder = metrics.StageRecorder()
+        df = process_files(*files, progress=recorder, **options)
+        with recorder.timed("导出 " + fmt) as timer:
+            export_result(df, output, fmt)
+            timer.rows = len(df)
+    except Exception as e:
+        return {"name": name, "status": "failed", "error": str(e) or type(e).__name__,
+                "seconds": round(time.perf_counter() - started, 4)}
+    return {"name": name, "status": "done", "output": output, "rows": len(df),
+            "seconds": round(time.perf_counter() - started, 4), "stages": recorder.summary()}
+
+
+def _format_run(run):
+    """一次运算的单行摘要。"""
+    if run["status"] != "done":
+        return "{}  失败  {:.2f}s  {}".format(run["name"], run["seconds"], run["error"])
+    stages = "  ".join("{} {:.2f}s".format(stage["stage"], stage["wall_seconds"]) for stage in run["stages"])
+    return "{}  完成  {:.2f}s  {} 行  {}  -> {}".format(run["name"], run["seconds"], run["rows"], stages, run["output"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="路径规划批量运算（不启动 Web 服务）")
+    parser.add_argument("folders", nargs="+", help="输入目录，每个目录包含五个输入文件")
+    parser.add_argument("--output-dir", default="results", help="结果目录，默认 results")
+    parser.add_argument("--format", default="xlsx", choices=OUTPUT_FORMATS, help="结果格式，默认 xlsx")
+    parser.add_argument("--jobs", type=int, default=None, help="同时运算的目录数，默认为 CPU 核数与目录数中较小者")
+    parser.add_argument("--top-k", type=int, default=1, help="每组保留的记录条数")
+    parser.add_argument("--engine", default="vectorized", choices=ENGINES, help="运算实现，默认 vectorized")
+    parser.add_argument("--workers", type=int, default=None, help="单个目录内部的并行进程数（仅 vectorized 实现）")
+    parser.add_argument("--json", action="store_true", help="每次运算输出一行 JSON（含各阶段明细）")
+    args = parser.parse_args(argv)
+    # 在运算前检查，避免算完才在导出或运算进程中报错；只查找 pyarrow 而不导入
+    if args.format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        parser.error("导出 parquet 需要安装 pyarrow")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers 必须为正整数")
+    if args.workers is not None and args.workers > 1 and args.engine != "vectorized":
+        parser.error("--workers 仅适用于 vectorized 实现")
+
+    runs = {}
+    for folder in args.folders:
+        name = os.path.basename(os.path.normpath(folder))
+        if name in runs:
+            parser.error("输入目录名重复（结果文件按目录名命名）: " + name)
+        try:
+            runs[name] = find_inputs(folder)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+    jobs = args.jobs if args.jobs is not None else min(len(runs), os.cpu_count() or 1)
+    if jobs < 1:
+        parser.error("--jobs 必须为正整数")
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {"engine": args.engine, "top_k": args.top_k, "workers": args.workers}
+
+    started = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(run_one, name, files,
+                                   os.path.join(args.output_dir, "路径规划-输出-" + name + "." + args.format),
+                                   args.format, options)
+                   for name, files in runs.items()]
+        for future in as_completed(futures):
+            run = future.result()
+            failed += run["status"] != "done"
+            print(json.dumps(run, ensure_ascii=False) if args.json else _format_run(run), flush=True)
+    if not args.json:
+        print("共 {} 个目录，失败 {} 个，总耗时 {:.2f}s".format(len(runs), failed, time.perf_counter() - started))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
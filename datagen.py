@@ -0,0 +1,131 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# ==================== 模拟数据生成 ====================
+# 生成互相一致的五张输入表（采购价、前置运输、港口基础信息、海运费、短倒费），用于基准测试与核对：
+# 前置运输、海运费、短倒费中引用的矿山、铁路港、海港、码头都在对应的表中存在。
+# 同一组参数与随机种子总是生成相同的数据。
+
+# 与页面上传时使用的文件名一致，顺序与 route_engine.load_inputs 的参数顺序一致
+INPUT_FILES = [
+    "路径规划-采购价.xlsx",
+    "路径规划-前置运输.xlsx",
+    "路径规划-港口基础信息.xlsx",
+    "路径规划-海运费.xlsx",
+    "路径规划-短倒费.xlsx",
+]
+
+UNLOAD_WAYS = ["火车堆场", "火车直卸", "汽运堆场", "汽运直卸", None]
+TRANSPORT_WAYS = ["汽运", "铁路"]
+
+
+def generate_inputs(n_mines=100, n_rail_ports=10, n_seaports=10, n_terminals=3, n_unload_ports=10,
+                    n_unload_terminals=3, ship_sizes=(3, 5, 7, 10), seed=0, blank_rate=0):
+    """
+    生成一组输入表，返回 (df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao)。
+    n_terminals 为每个海港（发货港）的码头数，n_unload_terminals 为每个卸货港的码头数，
+    ship_sizes 为海运船吨数（万吨）的可选值；码头的最大吨位从 ship_sizes 及更大的吨位中抽取。
+    blank_rate 为各价格列（采购价、运输价格、码头费、海运费、附加价格）中留空的比例，用于核对空值的处理。
+    """
+    rng = np.random.default_rng(seed)
+    mines = ["矿山" + str(i) for i in range(n_mines)]
+    rails = ["铁路港" + str(i) for i in range(n_rail_ports)]
+    seas = ["海港" + str(i) for i in range(n_seaports)]
+    ship_sizes = np.asarray(ship_sizes)
+    tonnages = np.concatenate([ship_sizes, [ship_sizes.max() * 1.5]])
+
+    df_caigoujia = pd.DataFrame({"矿山": mines, "采购价": rng.integers(300, 600, n_mines)})
+
+    # 前置运输：矿山直达海港、矿山→铁路港、铁路港→海港，每个矿山 0~2 条直达、0~2 条到铁路港
+    legs = []
+    for mine in mines:
+        for sea in rng.choice(seas, size=min(rng.integers(0, 3), n_seaports), replace=False):
+            legs.append([mine, "矿山", sea, "海港", TRANSPORT_WAYS[rng.integers(0, 2)], int(rng.integers(10, 80))])
+        for rail in rng.choice(rails, size=min(rng.integers(0, 3), n_rail_ports), replace=False):
+            legs.append([mine, "矿山", rail, "铁路港", TRANSPORT_WAYS[rng.integers(0, 2)], int(rng.integers(5, 40))])
+    for rail in rails:
+        for sea in rng.choice(seas, size=min(rng.integers(1, 3), n_seaports), replace=False):
+            legs.append([rail, "铁路港", sea, "海港", TRANSPORT_WAYS[rng.integers(0, 2)], int(rng.integers(5, 40))])
+    df_qianzhi = pd.DataFrame(legs, columns=["起点", "起点类型", "终点", "终点类型", "运输方式", "运输价格"])
+    df_qianzhi = df_qianzhi.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+    # 港口基础信息：发货港码头（部分有平仓价）与卸货港码头
+    ports = []
+    for sea in seas:
+        for t in range(n_terminals):
+            pcj = int(rng.integers(500, 800)) if rng.random() < 0.3 else 0
+            ports.append([sea, sea + "-" + str(t) + "码头", "发货港", float(rng.choice(tonnages)), pcj,
+                          int(rng.integers(5, 30)), UNLOAD_WAYS[rng.integers(0, len(UNLOAD_WAYS))]])
+    unload_terminals = []
+    for u in range(n_unload_ports):
+        port = "卸货港" + str(u)
+        for t in range(n_unload_terminals):
+            terminal = port + "-" + str(t) + "码头"
+            unload_terminals.append((port, terminal))
+            ports.append([port, terminal, "卸货港", float(rng.choice(tonnages)), None, int(rng.integers(5, 30)), None])
+    df_gangkou = pd.DataFrame(ports, columns=["港口名称", "码头名称", "港口类型", "最大吨位（万吨)", "平仓价", "码头费", "卸运方式"])
+
+    # 海运费：每个发货码头约一半的卸货码头有航线，每条航线 1~2 种船型；约 15% 的记录不指定发货码头（适用于该港所有码头）
+    routes = []
+    for sea in seas:
+        for t in range(n_terminals):
+            for port, terminal in unload_terminals:
+                if rng.random() < 0.5:
+                    continue
+                n_ships = min(int(rng.integers(1, 3)), len(ship_sizes))
+                for ship in rng.choice(ship_sizes, size=n_ships, replace=False):
+                    matou = None if rng.random() < 0.15 else sea + "-" + str(t) + "码头"
+                    routes.append([sea, matou, port, terminal, int(ship), int(rng.integers(20, 60))])
+    df_haiyun = pd.DataFrame(routes, columns=["发货港", "发货码头", "卸货港", "卸货码头", "海运船吨数", "海运费"])
+
+    # 短倒费：每个卸货码头 0~2 个附加终点
+    extras = []
+    for port, terminal in unload_terminals:
+        for k in range(rng.integers(0, 3)):
+            extras.append([terminal, terminal + "终端" + str(k), int(rng.integers(1, 20))])
+    df_duandao = pd.DataFrame(extras, columns=["卸货码头", "附加终点", "附加价格"])
+
+    # 价格留空：使用单独的随机数序列，blank_rate=0 时生成的数据与不留空时相同
+    if blank_rate:
+        rng = np.random.default_rng([seed, 1])
+        for df, col in ((df_caigoujia, "采购价"), (df_qianzhi, "运输价格"), (df_gangkou, "码头费"),
+                        (df_haiyun, "海运费"), (df_duandao, "附加价格")):
+            df[col] = df[col].astype(float).mask(rng.random(len(df)) < blank_rate)
+    return df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao
+
+
+def write_inputs(folder, tables):
+    """将 generate_inputs 的结果写为 folder 下的五个 Excel 文件，返回文件路径列表。"""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for filename, df in zip(INPUT_FILES, tables):
+        path = os.path.join(folder, filename)
+        df.to_excel(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成路径规划模拟输入数据")
+    parser.add_argument("folder", help="输出目录")
+    parser.add_argument("--mines", type=int, default=100)
+    parser.add_argument("--rail-ports", type=int, default=10)
+    parser.add_argument("--seaports", type=int, default=10)
+    parser.add_argument("--terminals", type=int, default=3, help="每个海港的码头数")
+    parser.add_argument("--unload-ports", type=int, default=10)
+    parser.add_argument("--unload-terminals", type=int, default=3, help="每个卸货港的码头数")
+    parser.add_argument("--ship-sizes", type=lambda s: [int(x) for x in s.split(",")], default=[3, 5, 7, 10],
+                        help="海运船吨数，逗号分隔")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--blank-rate", type=float, default=0, help="价格列中留空的比例")
+    args = parser.parse_args()
+    tables = generate_inputs(args.mines, args.rail_ports, args.seaports, args.terminals, args.unload_ports,
+                             args.unload_terminals, args.ship_sizes, args.seed, args.blank_rate)
+    for path, df in zip(write_inputs(args.folder, tables), tables):
+        print(path, len(df))
+
+
+if __name__ == "__main__":
+    main()
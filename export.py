@@ -0,0 +1,120 @@
+import math
+import os
+import numpy as np
+import pandas as pd
+
+# ==================== 结果导出 ====================
+# 按需把结果表写成 xlsx / csv / parquet。各格式都按 chunk_rows 行一块顺序写出，
+# 不会在内存中生成整表的副本（xlsx 使用 openpyxl 的 write_only 模式，内存占用与行数无关）。
+
+EXPORT_FORMATS = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/octet-stream",
+}
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+def _chunks(df, chunk_rows):
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows]
+
+
+def _cell(value):
+    """openpyxl 不接受 NaN，也不识别 pandas 的缺失值，统一写为空单元格。"""
+    if value is None or value is pd.NA or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _write_xlsx(df, filepath, chunk_rows):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([str(col) for col in df.columns])
+    for chunk in _chunks(df, chunk_rows):
+        for row in chunk.itertuples(index=False, name=None):
+            ws.append([_cell(value) for value in row])
+    wb.save(filepath)
+
+
+def _write_csv(df, filepath, chunk_rows):
+    # utf-8-sig 便于 Excel 直接打开中文 CSV
+    with open(filepath, "w", encoding="utf-8-sig", newline="") as f:
+        if df.empty:
+            df.to_csv(f, index=False)
+        for i, chunk in enumerate(_chunks(df, chunk_rows)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+
+
+def _column_kinds(df):
+    """
+    确定各列在 parquet 中的类型：数值列保持不变；object 列中非空值（空字符串视为空值）都是数值时写为浮点，
+    否则写为字符串。整表统一判定，保证各块的 schema 一致。
+    """
+    kinds = {}
+    for col in df.columns:
+        if df[col].dtype != object:
+            kinds[col] = None
+            continue
+        values = df[col].replace("", np.nan)
+        numeric = pd.to_numeric(values, errors="coerce")
+        kinds[col] = "float" if numeric.notna().sum() == values.notna().sum() else "str"
+    return kinds
+
+
+def _parquet_chunk(chunk, kinds):
+    columns = {}
+    for col, kind in kinds.items():
+        values = chunk[col]
+        if kind == "float":
+            values = pd.to_numeric(values.replace("", np.nan), errors="coerce").astype(float)
+        elif kind == "str":
+            values = values.astype(object).where(values.notna(), None).map(lambda v: v if v is None else str(v))
+        columns[str(col)] = values
+    return pd.DataFrame(columns)
+
+
+def _write_parquet(df, filepath, chunk_rows):
+    if not HAS_PARQUET:
+        raise ValueError("导出 parquet 需要安装 pyarrow")
+    kinds = _column_kinds(df)
+    fields = []
+    for col, kind in kinds.items():
+        if kind == "float":
+            dtype = pyarrow.float64()
+        elif kind == "str":
+            dtype = pyarrow.string()
+        else:
+            dtype = pyarrow.Schema.from_pandas(df[[col]].iloc[:0], preserve_index=False).field(0).type
+        fields.append(pyarrow.field(str(col), dtype))
+    schema = pyarrow.schema(fields)
+    with pyarrow.parquet.ParquetWriter(filepath, schema) as writer:
+        for chunk in _chunks(df, chunk_rows):
+            writer.write_table(pyarrow.Table.from_pandas(_parquet_chunk(chunk, kinds), schema=schema,
+                                                         preserve_index=False))
+
+
+_WRITERS = {"xlsx": _write_xlsx, "csv": _write_csv, "parquet": _write_parquet}
+
+
+def export_result(df, filepath, fmt="xlsx", chunk_rows=10000):
+    """将结果表按 fmt 格式写入 filepath（先写临时文件再改名，并发下载同一结果时不会读到半个文件）。"""
+    if fmt not in _WRITERS:
+        raise ValueError("不支持的导出格式: " + str(fmt))
+    tmp = filepath + ".tmp-" + str(os.getpid()) + "-" + str(id(df))
+    try:
+        _WRITERS[fmt](df, tmp, chunk_rows)
+        os.replace(tmp, filepath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return filepath
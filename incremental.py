@@ -0,0 +1,398 @@
+import threading
+import numpy as np
+import pandas as pd
+from route_engine import (NON_PING_KEYS, PING_KEYS, RANK_COLUMN, NAME_COLUMNS, load_inputs, name_dtype,
+                          encode_names, decode_names, _mine_to_sea_routes, _mine_to_sea_frame,
+                          _candidates_vectorized, _group_best, _assemble_optimal, _check_top_k, _first_min,
+                          _group_codes)
+
+# ==================== 行级增量更新 ====================
+# 对五张输入表逐行插入、修改、删除后，只重新计算受影响的分组，并替换到已有的最优结果中。
+# 非平仓分组【矿山, 卸货码头】与平仓分组【发货港, 卸货码头】彼此独立，一条变更只会影响以下分组：
+#   采购价       ：该矿山的全部非平仓分组；该矿山的矿山→海港组合所到海港的平仓分组（首条可用路线的先后决定同价取舍）
+#   前置运输     ：经过该运输段的矿山，范围同上
+#   港口基础信息 ：发货码头 → 到该港的矿山、以该港为发货港的平仓分组（只限该港有海运费的卸货码头）；
+#                  卸货码头 → 该卸货码头的全部分组
+#   海运费       ：到该发货港的矿山与该卸货码头；平仓分组（发货港, 卸货码头）
+#   短倒费       ：该卸货码头的全部分组
+# 受影响范围记为（名称集合, 卸货码头集合）的矩形，None 表示不限。每个矩形只取相关的输入行用剪枝实现重新计算，
+# 输入行的相对顺序不变，因此同价时的取舍与完整运算相同，替换后的结果与对更新后的输入调用 process_files 一致。
+#
+# 变更格式：
+#   {"table": "海运费", "op": "update", "where": {"发货港": "某港", "卸货码头": "某码头"}, "values": {"海运费": 52}}
+#   {"table": "短倒费", "op": "insert", "values": {"卸货码头": "某码头", "附加终点": "某地", "附加价格": 8}}
+#   {"table": "采购价", "op": "delete", "where": {"矿山": "某矿"}}
+# where 为 {列名: 取值或取值列表}（同 scenario.py），update 与 delete 必须至少匹配一行。
+
+# 可更新的输入表，顺序同 load_inputs
+DELTA_TABLES = ("采购价", "前置运输", "港口基础信息", "海运费", "短倒费")
+DELTA_OPS = ("insert", "update", "delete")
+# 读取时即转为数值的列（见 route_engine._read_gangkou / _read_haiyun），写入的取值同样转换
+_NUMERIC_COLUMNS = {"港口基础信息": "最大吨位（万吨)", "海运费": "海运船吨数"}
+
+
+def parse_changes(changes):
+    """校验变更列表的格式，返回 [{"table", "op", "where", "values"}]；格式错误时抛出 ValueError。列名在应用时校验。"""
+    if not isinstance(changes, list) or not changes:
+        raise ValueError("changes 必须为非空列表")
+    parsed = []
+    for n, change in enumerate(changes):
+        label = "第 " + str(n + 1) + " 条变更"
+        if not isinstance(change, dict):
+            raise ValueError(label + "格式错误")
+        if change.get("table") not in DELTA_TABLES:
+            raise ValueError(label + "的 table 必须为 " + "、".join(DELTA_TABLES) + " 之一: " + str(change.get("table")))
+        if change.get("op") not in DELTA_OPS:
+            raise ValueError(label + "的 op 必须为 " + "、".join(DELTA_OPS) + " 之一: " + str(change.get("op")))
+        where = change.get("where") or {}
+        values = change.get("values") or {}
+        if not isinstance(where, dict) or not isinstance(values, dict):
+            raise ValueError(label + "的 where 与 values 必须为 {列名: 取值}")
+        if change["op"] != "insert" and not where:
+            raise ValueError(label + "缺少 where 条件")
+        if change["op"] != "delete" and not values:
+            raise ValueError(label + "缺少 values")
+        parsed.append({"table": change["table"], "op": change["op"], "where": where, "values": values})
+    return parsed
+
+
+def _name_set(df, col):
+    """表中某列的全部非空名称（列不存在时为空集）。"""
+    if col not in df.columns:
+        return set()
+    return set(df[col].dropna())
+
+
+def _in_rects(df, keys, rects):
+    """各行的分组键是否落在任一矩形内。"""
+    mask = np.zeros(len(df), dtype=bool)
+    for first, second in rects:
+        inside = np.ones(len(df), dtype=bool)
+        if first is not None:
+            inside &= df[keys[0]].isin(list(first)).to_numpy()
+        if second is not None:
+            inside &= df[keys[1]].isin(list(second)).to_numpy()
+        mask |= inside
+    return mask
+
+
+def _merge_rects(rects):
+    """合并第一维相同（再合并第二维相同）的矩形，减少重新计算的次数；空矩形直接去掉。"""
+    rects = [(first, second) for first, second in rects if (first is None or first) and (second is None or second)]
+    for axis in (0, 1):
+        merged = {}
+        for rect in rects:
+            key, other = rect[axis], rect[1 - axis]
+            if key in merged:
+                other = None if merged[key] is None or other is None else merged[key] | other
+            merged[key] = other
+        rects = [(key, other) if axis == 0 else (other, key) for key, other in merged.items()]
+    return rects
+
+
+def _concat(frames, like):
+    """合并非空的表；全部为空时返回 like 的空表（避免空表改变各列类型）。"""
+    frames = [df for df in frames if df is not None and len(df)]
+    if not frames:
+        return like.iloc[:0]
+    return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+
+def _inferred(df):
+    """
+    只含一类取值（数值或字符串）的 object 列转为对应类型。分组重新计算时候选记录中还有另一种记录（平仓 / 非平仓），
+    采购价、平仓价等列为 object；完整运算中只有一种记录时这些列为数值或字符串类型，合并后两者一致。
+    """
+    columns = {}
+    for col in df.columns:
+        if df[col].dtype == object:
+            inferred = df[col].infer_objects()
+            if inferred.dtype != object:
+                columns[col] = inferred
+    return df.assign(**columns) if columns else df
+
+
+class _GroupRows:
+    """
+    一种记录（非平仓或平仓）各分组的最优记录。重新计算的记录追加在后，被替换的记录只标记删除，
+    frame() 读取时才合并为一张表，每次变更不必复制全部记录。
+    """
+    # 追加的块数超过该值时合并一次
+    MAX_FRAMES = 32
+
+    def __init__(self, keys, df, like):
+        self.keys = keys
+        self._like = like.iloc[:0]
+        self._frames, self._alive = [], []
+        self.add(df)
+
+    def copy(self):
+        rows = _GroupRows(self.keys, None, self._like)
+        rows._frames, rows._alive = list(self._frames), list(self._alive)
+        return rows
+
+    def add(self, df):
+        if df is not None and len(df):
+            self._frames.append(df)
+            self._alive.append(np.ones(len(df), dtype=bool))
+            if len(self._frames) > self.MAX_FRAMES:
+                self.frame()
+
+    def remove(self, rects):
+        """标记删除分组键落在 rects 内的记录，返回被删除的记录。"""
+        removed = []
+        for n, df in enumerate(self._frames):
+            hit = self._alive[n] & _in_rects(df, self.keys, rects)
+            if hit.any():
+                removed.append(df[hit])
+                self._alive[n] = self._alive[n] & ~hit
+        return _concat(removed, self._like)
+
+    def frame(self):
+        """全部有效记录合并为一张表（顺序不定），并以合并后的表替换原有的各块。"""
+        df = _concat([df if alive.all() else df[alive] for df, alive in zip(self._frames, self._alive)], self._like)
+        self._frames, self._alive = [], []
+        self.add(df)
+        return df
+
+    def recode(self, dtype):
+        self._frames = encode_names(dtype, *self._frames)
+        self._like = encode_names(dtype, self._like)[0]
+
+
+class IncrementalRoutes:
+    """
+    维护一组输入与其最优路线结果，apply 逐行更新输入并只重新计算受影响的分组（规则见本模块开头）。
+    输入表内部按共享名称表编码，result 返回解码后的结果，与 process_files(top_k=top_k) 的输出相同。
+    df_result 为已有的同一输入的 process_files 结果（如结果缓存中的结果），传入时不再完整计算。
+    """
+
+    def __init__(self, df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao, top_k=1, df_result=None):
+        _check_top_k(top_k)
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        inputs = [df.reset_index(drop=True) for df in (df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao)]
+        self._dtype = name_dtype(*inputs)
+        self._tables = dict(zip(DELTA_TABLES, encode_names(self._dtype, *inputs)))
+        self._m2s = self._mine_to_sea(self._tables["采购价"])
+        empty = _assemble_optimal([], top_k)
+        if df_result is None:
+            self._non = _GroupRows(NON_PING_KEYS, self._non_ping_best(None, None), empty)
+            self._ping = _GroupRows(PING_KEYS, self._ping_best(None, None), empty)
+        else:
+            encoded = encode_names(self._dtype, df_result)[0]
+            self._non = _GroupRows(NON_PING_KEYS, encoded[encoded["是否平仓价发货"]=="否"], empty)
+            self._ping = _GroupRows(PING_KEYS, encoded[encoded["是否平仓价发货"]=="是"], empty)
+        self._result = df_result
+
+    @property
+    def result(self):
+        """当前的最优结果；各分组在内部不保持顺序，变更后首次读取时才排序、解码生成完整结果。"""
+        with self._lock:
+            if self._result is None:
+                parts = [_inferred(self._sorted(rows.frame(), rows.keys)) for rows in (self._non, self._ping)]
+                self._result = decode_names(_assemble_optimal(parts, self.top_k))
+            return self._result
+
+    def inputs(self):
+        """当前（已应用全部变更的）五张输入表，顺序同 load_inputs。"""
+        return [decode_names(self._tables[name]) for name in DELTA_TABLES]
+
+    def apply(self, changes):
+        """
+        依次应用变更（格式见 parse_changes），只重新计算受影响的分组。任一条变更有误时抛出 ValueError，状态不变。
+        返回 {"removed": 受影响分组原有的记录, "added": 这些分组重新计算后的记录}，更新后的完整结果见 result。
+        """
+        changes = parse_changes(changes)
+        with self._lock:
+            saved = (self._dtype, dict(self._tables), self._m2s, self._non, self._ping)
+            self._non, self._ping = self._non.copy(), self._ping.copy()
+            try:
+                removed, added = self._apply(changes)
+            except Exception:
+                self._dtype, self._tables, self._m2s, self._non, self._ping = saved
+                raise
+            self._result = None
+        return {"removed": decode_names(removed), "added": decode_names(added)}
+
+    # ---------------- 应用变更 ----------------
+    def _apply(self, changes):
+        self._extend_names(changes)
+        edits = [self._edit(change) for change in changes]
+
+        # 采购价、前置运输的变更：重新计算涉及的采购价行的矿山→海港组合
+        cai, qz = self._tables["采购价"], self._tables["前置运输"]
+        rows, mines = set(), set()
+        for (table, old, new) in edits:
+            if table == "采购价":
+                rows |= set(old.index) | set(new.index)
+                mines |= _name_set(old, "矿山") | _name_set(new, "矿山")
+            elif table == "前置运输":
+                starts = _name_set(old, "起点") | _name_set(new, "起点")
+                via = pd.concat([qz, old])
+                starts |= set(via["起点"][via["终点"].isin(list(starts))].dropna())
+                rows |= set(cai.index[cai["矿山"].isin(list(starts)).to_numpy()])
+                mines |= starts
+        non_rects, ping_rects = [], []
+        if rows:
+            ports = self._splice_mine_to_sea(rows)
+            non_rects.append((frozenset(mines), None))
+            ping_rects.append((frozenset(ports), None))
+
+        # 港口基础信息、海运费、短倒费的变更
+        hy = self._tables["海运费"]
+        for (table, old, new) in edits:
+            changed = pd.concat([old, new])
+            if table == "港口基础信息":
+                for port in _name_set(changed[changed["港口类型"]=="发货港"], "港口名称"):
+                    terminals = frozenset(hy["卸货码头"][hy["发货港"]==port].dropna())
+                    non_rects.append((self._mines_to({port}), terminals))
+                    ping_rects.append((frozenset([port]), terminals))
+                terminals = frozenset(_name_set(changed[changed["港口类型"]=="卸货港"], "码头名称"))
+                non_rects.append((None, terminals))
+                ping_rects.append((None, terminals))
+            elif table == "海运费":
+                for port, terminal in set(zip(changed["发货港"], changed["卸货码头"])):
+                    if pd.notna(port) and pd.notna(terminal):
+                        non_rects.append((self._mines_to({port}), frozenset([terminal])))
+                        ping_rects.append((frozenset([port]), frozenset([terminal])))
+            elif table == "短倒费":
+                terminals = frozenset(_name_set(changed, "卸货码头"))
+                non_rects.append((None, terminals))
+                ping_rects.append((None, terminals))
+
+        removed_non, added_non = self._patch(self._non, _merge_rects(non_rects), self._non_ping_best)
+        removed_ping, added_ping = self._patch(self._ping, _merge_rects(ping_rects), self._ping_best)
+        return _concat([removed_non, removed_ping], removed_non), _concat([added_non, added_ping], added_non)
+
+    def _extend_names(self, changes):
+        """变更写入了名称表中没有的名称时，扩充名称表并把各表重新对应到新的名称表。"""
+        names = {value for change in changes for col, value in change["values"].items()
+                 if col in NAME_COLUMNS and isinstance(value, str)}
+        if names <= set(self._dtype.categories):
+            return
+        self._dtype = pd.CategoricalDtype(sorted(set(self._dtype.categories) | names))
+        tables = encode_names(self._dtype, *(self._tables[name] for name in DELTA_TABLES))
+        self._tables = dict(zip(DELTA_TABLES, tables))
+        self._m2s = encode_names(self._dtype, self._m2s)[0]
+        self._non.recode(self._dtype)
+        self._ping.recode(self._dtype)
+
+    def _edit(self, change):
+        """对一张表应用一条变更，返回 (表名, 变更前的行, 变更后的行)。"""
+        name, df = change["table"], self._tables[change["table"]]
+        unknown = [col for col in list(change["where"]) + list(change["values"]) if col not in df.columns]
+        if unknown:
+            raise ValueError(name + " 中不存在列: " + "、".join(unknown))
+        values = {col: self._cell(name, df[col], col, value) for col, value in change["values"].items()}
+        if change["op"] == "insert":
+            start = int(df.index.max()) + 1 if len(df) else 0
+            row = pd.DataFrame({col: pd.Series([values.get(col, np.nan)], index=[start], dtype=(
+                df[col].dtype if isinstance(df[col].dtype, pd.CategoricalDtype) else None)) for col in df.columns})
+            self._tables[name] = pd.concat([df, row])
+            return name, df.iloc[:0], row
+        mask = np.ones(len(df), dtype=bool)
+        for col, wanted in change["where"].items():
+            mask &= df[col].isin(wanted if isinstance(wanted, list) else [wanted]).to_numpy()
+        if not mask.any():
+            raise ValueError(name + " 中没有满足条件的行: " + str(change["where"]))
+        if change["op"] == "delete":
+            self._tables[name] = df[~mask]
+            return name, df[mask], df.iloc[:0]
+        self._tables[name] = df.assign(**{col: df[col].where(~mask, value) for col, value in values.items()})
+        return name, df[mask], self._tables[name][mask]
+
+    @staticmethod
+    def _cell(table, column, col, value):
+        """校验并转换写入的取值：名称列只接受字符串，数值列只接受数值，空值为 None。"""
+        if value is None:
+            return np.nan
+        if _NUMERIC_COLUMNS.get(table) == col:
+            return pd.to_numeric(value, errors="coerce")
+        if isinstance(column.dtype, pd.CategoricalDtype) and not isinstance(value, str):
+            raise ValueError(table + " 的 " + col + " 列必须为字符串: " + str(value))
+        if column.dtype.kind in "iuf" and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(table + " 的 " + col + " 列必须为数值: " + str(value))
+        return value
+
+    # ---------------- 矿山→海港组合 ----------------
+    def _mine_to_sea(self, df_caigoujia):
+        """计算采购价各行的矿山→海港组合，"_row" 列记录来自采购价的哪一行（行标签）。"""
+        routes = _mine_to_sea_routes(df_caigoujia, self._tables["前置运输"])
+        df = _mine_to_sea_frame(routes)
+        df["_row"] = df_caigoujia.index.to_numpy()[routes["_i"].to_numpy()]
+        return df
+
+    def _splice_mine_to_sea(self, rows):
+        """重新计算采购价中行标签为 rows 的行的矿山→海港组合，按采购价的行顺序放回；返回被替换与新增的组合所到的海港。"""
+        cai, m2s = self._tables["采购价"], self._m2s
+        drop = m2s["_row"].isin(list(rows)).to_numpy()
+        fresh = self._mine_to_sea(cai[cai.index.isin(list(rows))])
+        ports = _name_set(m2s[drop], "海港") | _name_set(fresh, "海港")
+        m2s = _concat([m2s[~drop], fresh], m2s)
+        order = np.argsort(cai.index.get_indexer(m2s["_row"]), kind="stable")
+        self._m2s = m2s.iloc[order].reset_index(drop=True)
+        return ports
+
+    def _mines_to(self, ports):
+        """有矿山→海港组合到达 ports 中海港的矿山。"""
+        return frozenset(self._m2s["矿山"][self._m2s["海港"].isin(list(ports))].dropna())
+
+    # ---------------- 重新计算与替换分组 ----------------
+    def _terminal_rows(self, ports, terminals):
+        """只取发货港属于 ports、卸货码头属于 terminals 的海运费行，以及这些卸货码头的短倒费行（None 表示不限）。"""
+        hy, dd = self._tables["海运费"], self._tables["短倒费"]
+        if ports is not None:
+            hy = hy[hy["发货港"].isin(list(ports))]
+        if terminals is not None:
+            hy = hy[hy["卸货码头"].isin(list(terminals))]
+            dd = dd[dd["卸货码头"].isin(list(terminals))]
+        return hy, dd
+
+    def _best(self, df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, flag, keys):
+        df = _candidates_vectorized(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, prune=True, top_k=self.top_k)
+        df = df[df["是否平仓价发货"]==flag]
+        return _group_best(df, keys, self.top_k) if len(df) else None
+
+    def _non_ping_best(self, mines, terminals):
+        """矩形（矿山集合, 卸货码头集合）内各非平仓分组的最优记录。"""
+        m2s = self._m2s if mines is None else self._m2s[self._m2s["矿山"].isin(list(mines))]
+        # 平仓价视为 0，不生成用不到的平仓记录（候选表只有非平仓记录，各列类型也与只有这一种记录时相同）
+        df_gangkou = self._tables["港口基础信息"]
+        if "平仓价" in df_gangkou.columns:
+            df_gangkou = df_gangkou.assign(平仓价=0)
+        return self._best(m2s, df_gangkou, *self._terminal_rows(None, terminals), "否", NON_PING_KEYS)
+
+    def _ping_best(self, ports, terminals):
+        """
+        矩形（发货港集合, 卸货码头集合）内各平仓分组的最优记录。平仓记录只取决于每个【海港, 是否使用铁路】的
+        首条矿山→海港组合（决定是否生成以及生成的先后），因此只保留这些组合参与计算。
+        """
+        m2s = self._m2s if ports is None else self._m2s[self._m2s["海港"].isin(list(ports))]
+        used_rail = ((m2s["运输方式1"]=="铁路") | (m2s["运输方式2"]=="铁路")).to_numpy()
+        m2s = m2s.iloc[_first_min(_group_codes([m2s["海港"], used_rail]), np.zeros(len(m2s)))]
+        return self._best(m2s, self._tables["港口基础信息"], *self._terminal_rows(ports, terminals), "是", PING_KEYS)
+
+    def _sorted(self, df, keys):
+        """按分组键（及组内名次）排列，与 _group_best 的输出顺序相同。"""
+        return df.sort_values(keys + ([RANK_COLUMN] if self.top_k > 1 else []), kind="stable")
+
+    def _patch(self, rows, rects, compute):
+        """以各矩形重新计算的分组替换 rows 中落在矩形内的分组，返回 (被替换的记录, 新记录)。"""
+        removed = rows.remove(rects)
+        fresh = []
+        for n, (first, second) in enumerate(rects):
+            best = compute(first, second)
+            # 多个矩形重叠时，重叠部分的分组只取第一个矩形的结果
+            if best is not None and n:
+                best = best[~_in_rects(best, rows.keys, rects[:n])]
+            fresh.append(best)
+        added = _concat(fresh, removed)
+        rows.add(added)
+        return removed, added
+
+
+def load_incremental(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao, top_k=1, df_result=None):
+    """读取五个输入（Excel 文件路径或快照标识）建立 IncrementalRoutes，参数含义见 IncrementalRoutes。"""
+    inputs = load_inputs(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao)
+    return IncrementalRoutes(*inputs, top_k=top_k, df_result=df_result)
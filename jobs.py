@@ -0,0 +1,94 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# ==================== 后台运算任务 ====================
+# /process 将运算提交到有界线程池后立即返回任务编号，前端轮询任务状态。
+# max_workers 限制同时运行的任务数，max_queued 限制排队等待的任务数，超出时拒绝提交（QueueFullError）。
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """排队任务数已达上限。"""
+
+
+class JobManager:
+    """
+    有界后台任务池。submit(func, *args) 返回任务编号，func 的第一个参数为进度回调
+    progress(阶段, 状态, 行数)（与 route_engine.process_files 的 progress 参数一致）。
+    已结束的任务只保留最近 max_history 个。
+    """
+
+    def __init__(self, max_workers=2, max_queued=8, max_history=100):
+        self.max_queued = max_queued
+        self.max_history = max_history
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, func, *args, **kwargs):
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job["status"] == JOB_QUEUED)
+            if queued >= self.max_queued:
+                raise QueueFullError("排队任务已满，请稍后再试")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id, "status": JOB_QUEUED, "stage": None, "stages": OrderedDict(),
+                "error": None, "result": None,
+                "submitted_at": time.time(), "started_at": None, "finished_at": None,
+            }
+            self._trim()
+        self._executor.submit(self._run, job_id, func, args, kwargs)
+        return job_id
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in (JOB_DONE, JOB_FAILED)]
+        for job_id in finished[:max(0, len(finished) - self.max_history)]:
+            del self._jobs[job_id]
+
+    def _progress(self, job_id, stage, status, rows=None):
+        with self._lock:
+            job = self._jobs[job_id]
+            info = job["stages"].setdefault(stage, {"status": status, "rows": None})
+            info["status"] = status
+            if rows is not None:
+                info["rows"] = rows
+            job["stage"] = stage
+
+    def _run(self, job_id, func, args, kwargs):
+        with self._lock:
+            job = self._jobs[job_id]
+            job["status"] = JOB_RUNNING
+            job["started_at"] = time.time()
+        try:
+            result = func(lambda stage, status, rows=None: self._progress(job_id, stage, status, rows),
+                          *args, **kwargs)
+        except Exception as e:
+            with self._lock:
+                job["status"] = JOB_FAILED
+                job["error"] = str(e)
+                job["finished_at"] = time.time()
+            return
+        with self._lock:
+            job["status"] = JOB_DONE
+            job["result"] = result
+            job["finished_at"] = time.time()
+
+    def status(self, job_id):
+        """返回任务状态的副本（可直接序列化为 JSON）；任务不存在时返回 None。"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            info = dict(job)
+            info["stages"] = [dict(stage=name, **stage) for name, stage in job["stages"].items()]
+            return info
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
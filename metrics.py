@@ -0,0 +1,228 @@
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# ==================== 运行指标 ====================
+# 记录各阶段（读取输入、PART A/B/C、导出等）的耗时、CPU 时间、峰值内存与记录数，以及各路由的请求次数与耗时，
+# 以 Prometheus 文本格式输出（见 render_prometheus）。
+# 关闭时（环境变量 BESTLINE_METRICS=0 或 set_enabled(False)）StageRecorder 只转发进度回调、timed 不做任何计时。
+#
+# 各项指标的范围：
+# - 峰值内存为本进程的峰值常驻内存（Linux 上阶段开始时重置 VmHWM），不含多进程计算的工作进程。
+#   只在没有其他阶段正在计时时才重置，因此并发任务不会清掉彼此的峰值，但各自的峰值会包含同时运行的其他任务。
+# - CPU 时间为运行该阶段的线程的 CPU 时间，不含多进程计算（workers > 1）的工作进程，
+#   此时 "PART A–C（并行）" 等并行阶段的 CPU 时间远小于耗时，只反映主进程分发与合并的开销。
+
+ENABLED = os.environ.get("BESTLINE_METRICS", "1") != "0"
+
+_CLEAR_REFS = "/proc/self/clear_refs"
+_STATUS = "/proc/self/status"
+
+
+def set_enabled(enabled):
+    global ENABLED
+    ENABLED = bool(enabled)
+
+
+# 正在计时的阶段；为空时才重置峰值内存（计时对象随 StageRecorder 释放时自动移除）
+_ACTIVE = weakref.WeakSet()
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _reset_peak_rss():
+    """重置进程的峰值常驻内存（仅 Linux 支持），返回是否成功。"""
+    try:
+        with open(_CLEAR_REFS, "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss():
+    """进程的峰值常驻内存（字节）；无法获取时返回 None。"""
+    try:
+        with open(_STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # Linux 上 ru_maxrss 的单位为 KiB（不可重置，为进程启动以来的峰值）
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+class Registry:
+    """累计各阶段与各路由的指标，线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}     # 阶段 -> {"runs", "wall_seconds", "cpu_seconds", "rows", "peak_rss_bytes"}
+        self.requests = {}   # (路由, 方法, 状态码) -> {"count", "seconds"}
+
+    def record_stage(self, record):
+        with self._lock:
+            total = self.stages.setdefault(record["stage"], {
+                "runs": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "rows": 0, "peak_rss_bytes": 0})
+            total["runs"] += 1
+            total["wall_seconds"] += record["wall_seconds"]
+            total["cpu_seconds"] += record["cpu_seconds"]
+            total["rows"] += record["rows"] or 0
+            if record["peak_rss_bytes"] is not None:
+                total["peak_rss_bytes"] = max(total["peak_rss_bytes"], record["peak_rss_bytes"])
+
+    def record_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            total = self.requests.setdefault((endpoint, method, str(status)), {"count": 0, "seconds": 0.0})
+            total["count"] += 1
+            total["seconds"] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return ({stage: dict(values) for stage, values in self.stages.items()},
+                    {key: dict(values) for key, values in self.requests.items()})
+
+
+REGISTRY = Registry()
+
+
+class _Timer:
+    """单个阶段的计时。"""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.rows = None
+        with _ACTIVE_LOCK:
+            self._rss_reset = not _ACTIVE and _reset_peak_rss()
+            _ACTIVE.add(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+
+    def finish(self, rows=None):
+        if rows is not None:
+            self.rows = rows
+        with _ACTIVE_LOCK:
+            _ACTIVE.discard(self)
+        return {
+            "stage": self.stage,
+            "wall_seconds": time.perf_counter() - self._wall,
+            "cpu_seconds": time.thread_time() - self._cpu,
+            "peak_rss_bytes": _peak_rss(),
+            "rows": self.rows,
+        }
+
+
+class StageRecorder:
+    """
+    以 route_engine.process_files 的进度回调形式记录各阶段指标：progress(阶段, "running") 开始计时，
+    progress(阶段, "done", 行数) 结束计时并计入 registry。forward 为需要同时转发的进度回调（如后台任务的进度）。
+    summary() 返回本次运行各阶段的记录，用于任务的耗时汇总。
+    """
+
+    def __init__(self, forward=None, registry=None):
+        self.forward = forward
+        self.registry = registry or REGISTRY
+        self.records = []
+        self._running = {}
+
+    def __call__(self, stage, status, rows=None):
+        if self.forward is not None:
+            self.forward(stage, status, rows)
+        if not ENABLED:
+            return
+        if status == "running":
+            # 分块计算时同一阶段会多次报告 running，只在第一次开始计时
+            if stage not in self._running:
+                self._running[stage] = _Timer(stage)
+        elif status == "done":
+            timer = self._running.pop(stage, None)
+            if timer is None:
+                # 未报告 running 的阶段（如命中缓存）只记录行数
+                self._add({"stage": stage, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_rss_bytes": None,
+                           "rows": rows})
+            else:
+                self._add(timer.finish(rows))
+
+    def _add(self, record):
+        self.records.append(record)
+        self.registry.record_stage(record)
+
+    @contextmanager
+    def timed(self, stage):
+        """对一段代码计时，可在代码块中设置 timer.rows。"""
+        self(stage, "running")
+        timer = self._running.get(stage)
+        try:
+            yield timer if timer is not None else _NULL_TIMER
+        finally:
+            self(stage, "done", timer.rows if timer is not None else None)
+
+    def summary(self):
+        return [dict(record, wall_seconds=round(record["wall_seconds"], 4),
+                     cpu_seconds=round(record["cpu_seconds"], 4)) for record in self.records]
+
+
+class _NullTimer:
+    rows = None
+
+
+_NULL_TIMER = _NullTimer()
+
+
+@contextmanager
+def timed(stage, registry=None):
+    """对一段代码计时并计入 registry（不属于某次运算的阶段，如下载导出、上传预览）。"""
+    if not ENABLED:
+        yield _NULL_TIMER
+        return
+    recorder = StageRecorder(registry=registry)
+    with recorder.timed(stage) as timer:
+        yield timer
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def render_prometheus(registry=None, extra=None):
+    """
+    以 Prometheus 文本格式输出累计指标。extra 为 {指标名: (类型, 说明, 数值)} 形式的附加指标（如缓存计数）。
+    """
+    stages, requests = (registry or REGISTRY).snapshot()
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP " + name + " " + help_text)
+        lines.append("# TYPE " + name + " " + kind)
+        for labels, value in samples:
+            label_text = ",".join(key + "=\"" + _label(val) + "\"" for key, val in labels)
+            lines.append(name + ("{" + label_text + "}" if label_text else "") + " " + repr(float(value)))
+
+    metric("bestline_stage_runs_total", "counter", "各阶段执行次数",
+           [((("stage", stage),), values["runs"]) for stage, values in stages.items()])
+    metric("bestline_stage_wall_seconds_total", "counter", "各阶段累计耗时（秒）",
+           [((("stage", stage),), values["wall_seconds"]) for stage, values in stages.items()])
+    metric("bestline_stage_cpu_seconds_total", "counter", "各阶段累计 CPU 时间（秒，仅运行该阶段的线程，不含多进程计算的工作进程）",
+           [((("stage", stage),), values["cpu_seconds"]) for stage, values in stages.items()])
+    metric("bestline_stage_rows_total", "counter", "各阶段累计产生的记录数",
+           [((("stage", stage),), values["rows"]) for stage, values in stages.items()])
+    metric("bestline_stage_peak_rss_bytes", "gauge", "各阶段观测到的最大进程峰值常驻内存（字节，进程级，包含同时运行的其他任务）",
+           [((("stage", stage),), values["peak_rss_bytes"]) for stage, values in stages.items()])
+    metric("bestline_http_requests_total", "counter", "各路由请求次数",
+           [((("endpoint", key[0]), ("method", key[1]), ("status", key[2])), values["count"])
+            for key, values in requests.items()])
+    metric("bestline_http_request_seconds_total", "counter", "各路由累计处理时间（秒）",
+           [((("endpoint", key[0]), ("method", key[1]), ("status", key[2])), values["seconds"])
+            for key, values in requests.items()])
+    for name, (kind, help_text, value) in (extra or {}).items():
+        metric(name, kind, help_text, [((), value)])
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,21 @@
 import os
-import math
-import pandas as pd
-from flask import Flask, request, render_template_string, session, send_from_directory
+from flask import Flask, request, render_template_string, session, send_from_directory, g, Response
 import tempfile
 import json
+import threading
+from collections import OrderedDict
+from route_engine import process_files
+from concurrent.futures import ThreadPoolExecutor
+from snapshot import SNAPSHOT_FOLDER, build_snapshot, preview_table, register_upload, save_stream
+from result_cache import ResultCache, StageCache, cache_key, derived_key
+from jobs import JOB_DONE, JOB_FAILED, JobManager, QueueFullError
+from result_view import DEFAULT_PAGE_SIZE, FILTER_COLUMNS, filter_options, query_result
+from export import EXPORT_FORMATS, HAS_PARQUET, export_result
+from scenario import parse_scenarios, process_scenarios
+from route_index import RouteIndexStore, build_route_index
+from incremental import load_incremental, parse_changes
+import time
+import metrics
 
 # 设置上传及结果保存目录
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
@@ -14,358 +26,64 @@ os.makedirs(RESULT_FOLDER, exist_ok=True)
 app = Flask(__name__)
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 app.config["RESULT_FOLDER"] = RESULT_FOLDER
+# 结果目录中保留的导出文件数（按最近下载时间淘汰）
+app.config["RESULT_FILES"] = 32
+# 下载表单中提供的格式；未安装 pyarrow 时不提供 Parquet
+DOWNLOAD_FORMATS = [("xlsx", "Excel (xlsx)"), ("csv", "CSV")] + ([("parquet", "Parquet")] if HAS_PARQUET else [])
+app.config["SNAPSHOT_FOLDER"] = SNAPSHOT_FOLDER
+# 上传预览只读取前若干行
+app.config["PREVIEW_ROWS"] = 50
 app.secret_key = "your_secret_key_here"  # 请替换为安全的密钥
 
-# ==================== 业务逻辑函数 ====================
-def process_files(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao):
-    """
-    业务逻辑说明：
-    1. 从“路径规划-采购价.xlsx”和“路径规划-前置运输.xlsx”中计算出各矿山到海港的“到海港价格”
-       （支持矿山直达海港以及经铁路港中转）。
-    2. 再结合“路径规划-港口基础信息.xlsx”、“路径规划-海运费.xlsx”和“路径规划-短倒费.xlsx”，计算
-       各发货港/发货码头到卸货港/卸货码头组合的费用：
-         - 非平仓模式：总费用 = 到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
-         - 平仓模式：总费用 = 平仓价 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
-       注意：无论矿山直达还是中转，发货相关费用均根据匹配到的候选发货港记录填入（即“发货港”、“发货码头”、“卸运方式”等）。
-    3. 输出时：
-         - 对非平仓记录（“是否平仓价发货”为“否”），以【矿山, 卸货码头】为分组，仅保留总费用最低的一条；
-         - 对平仓记录（“是否平仓价发货”为“是”），以【发货港, 卸货码头】为分组，仅保留总费用最低的一条。
-    """
-    # 读取各个 Excel 文件
-    df_caigoujia = pd.read_excel(file_caigoujia)
-    df_qianzhi   = pd.read_excel(file_qianzhi)
-    df_gangkou   = pd.read_excel(file_gangkou)
-    df_gangkou["最大吨位（万吨)"] = pd.to_numeric(df_gangkou["最大吨位（万吨)"], errors="coerce")
-    df_haiyun    = pd.read_excel(file_haiyun)
-    df_haiyun["海运船吨数"] = pd.to_numeric(df_haiyun["海运船吨数"], errors="coerce")
-    df_duandao   = pd.read_excel(file_duandao)
-
-    # ---------------- 输出列顺序 ----------------
-    # 注意：根据要求，“卸货码头”在“卸货港”之后
-    output_columns = [
-        "采购价", "矿山",
-        "运输方式1", "汽运价格", "铁路港", "运输方式2", "铁路价格",
-        "海港", "到海港价格",
-        "平仓价", "是否平仓价发货",
-        "发货港", "发货码头", "卸运方式", "发货码头费",
-        "卸货港", "卸货码头", "卸货码头费",
-        "海运船吨数", "海运费",
-        "附加终点", "附加费用",
-        "总费用"
-    ]
-
-    def has_rail_in_route(*ways):
-        return any(w == "铁路" for w in ways)
-
-    # ---------------- PART A: 计算矿山→海港组合（得“到海港价格”） ----------------
-    results_mine_to_sea = []
-    for _, row_mine in df_caigoujia.iterrows():
-        mine_name  = row_mine["矿山"]
-        mine_price = row_mine["采购价"]
-        # 筛选：起点为该矿山，且起点类型为“矿山”
-        df_start = df_qianzhi[(df_qianzhi["起点"] == mine_name) & (df_qianzhi["起点类型"]=="矿山")]
-        if df_start.empty:
-            continue
-        for _, r1 in df_start.iterrows():
-            end_point = r1["终点"]
-            end_type  = r1["终点类型"]
-            way1      = r1["运输方式"]
-            price1    = r1["运输价格"]
-            qiyun_price = 0
-            tielu_price = 0
-            if way1 == "汽运":
-                qiyun_price = price1
-            elif way1 == "铁路":
-                tielu_price = price1
-            # 矿山直达海港
-            if end_type == "海港":
-                to_sea_price = mine_price + qiyun_price + tielu_price
-                results_mine_to_sea.append({
-                    "采购价": mine_price,
-                    "矿山": mine_name,
-                    "运输方式1": way1,
-                    "汽运价格": qiyun_price,
-                    "铁路港": "",
-                    "运输方式2": "",
-                    "铁路价格": tielu_price,
-                    "海港": end_point,
-                    "到海港价格": to_sea_price,
-                    "平仓价": "",
-                    "是否平仓价发货": "否",
-                    "发货港": "",
-                    "发货码头": "",
-                    "卸运方式": "",
-                    "发货码头费": 0,
-                    "卸货港": "",
-                    "卸货码头": "",
-                    "卸货码头费": 0,
-                    "海运船吨数": 0,
-                    "海运费": 0,
-                    "附加终点": "",
-                    "附加费用": 0,
-                    "总费用": to_sea_price
-                })
-            # 矿山经过铁路港到海港
-            elif end_type == "铁路港":
-                df_port2sea = df_qianzhi[
-                    (df_qianzhi["起点"]==end_point) &
-                    (df_qianzhi["起点类型"]=="铁路港") &
-                    (df_qianzhi["终点类型"]=="海港")
-                ]
-                if df_port2sea.empty:
-                    continue
-                for _, r2 in df_port2sea.iterrows():
-                    way2   = r2["运输方式"]
-                    price2 = r2["运输价格"]
-                    sea2   = r2["终点"]
-                    seg_qiyun = qiyun_price
-                    seg_tielu = tielu_price
-                    if way2 == "汽运":
-                        seg_qiyun += price2
-                    elif way2 == "铁路":
-                        seg_tielu += price2
-                    to_sea_price = mine_price + seg_qiyun + seg_tielu
-                    results_mine_to_sea.append({
-                        "采购价": mine_price,
-                        "矿山": mine_name,
-                        "运输方式1": way1,
-                        "汽运价格": seg_qiyun,
-                        "铁路港": end_point,
-                        "运输方式2": way2,
-                        "铁路价格": seg_tielu,
-                        "海港": sea2,
-                        "到海港价格": to_sea_price,
-                        "平仓价": "",
-                        "是否平仓价发货": "否",
-                        "发货港": "",
-                        "发货码头": "",
-                        "卸运方式": "",
-                        "发货码头费": 0,
-                        "卸货港": "",
-                        "卸货码头": "",
-                        "卸货码头费": 0,
-                        "海运船吨数": 0,
-                        "海运费": 0,
-                        "附加终点": "",
-                        "附加费用": 0,
-                        "总费用": to_sea_price
-                    })
-    df_mine_to_sea = pd.DataFrame(results_mine_to_sea)
-
-    # ---------------- PART B: 结合港口信息、海运费与短倒费 ----------------
-    final_results = []
-    # 将港口基础信息拆分为发货港部分与卸货港部分
-    df_gangkou_fahuo  = df_gangkou[df_gangkou["港口类型"]=="发货港"]
-    df_gangkou_xiehuo = df_gangkou[df_gangkou["港口类型"]=="卸货港"]
-
-    # 根据运输情况：若使用铁路则只考虑火车堆场/火车直卸；否则只考虑汽运堆场/汽运直卸
-    rail_unload_ways = {"火车堆场", "火车直卸"}
-    road_unload_ways = {"汽运堆场", "汽运直卸"}
-
-    for _, row_ms in df_mine_to_sea.iterrows():
-        mine_price   = row_ms["采购价"]
-        mine_name    = row_ms["矿山"]
-        way1         = row_ms["运输方式1"]
-        qiyun_price  = row_ms["汽运价格"]
-        rail_port    = row_ms["铁路港"]
-        way2         = row_ms["运输方式2"]
-        tielu_price  = row_ms["铁路价格"]
-        seaport      = row_ms["海港"]
-        price_to_sea = row_ms["到海港价格"]
-
-        used_rail = (way1=="铁路" or way2=="铁路")
-        # 从发货港信息中，匹配港口名称等于 seaport 的候选记录
-        df_fahuo_candidates = df_gangkou_fahuo[df_gangkou_fahuo["港口名称"]==seaport]
-        if df_fahuo_candidates.empty:
-            continue
-
-        for _, row_fahuo in df_fahuo_candidates.iterrows():
-            fahuo_matou = row_fahuo["码头名称"]
-            fahuo_tonnage = row_fahuo.get("最大吨位（万吨)", math.inf)
-            fahuo_pcj = row_fahuo.get("平仓价", 0)
-            fahuo_fee = row_fahuo.get("码头费", 0)
-            fahuo_unload_way = row_fahuo.get("卸运方式", None)
-            if pd.notna(fahuo_unload_way) and fahuo_unload_way.strip() != "":
-                if used_rail:
-                    if fahuo_unload_way not in rail_unload_ways:
-                        continue
-                else:
-                    if fahuo_unload_way not in road_unload_ways:
-                        continue
-
-            # 无论如何都将发货港信息填入输出，计算发货码头费
-            df_haiyun_candidates = df_haiyun[
-                (df_haiyun["发货港"]==seaport) &
-                ((df_haiyun["发货码头"]==fahuo_matou) | (df_haiyun["发货码头"].isna()))
-            ]
-            if df_haiyun_candidates.empty:
-                continue
-
-            for _, row_hai in df_haiyun_candidates.iterrows():
-                xiehuo_gang = row_hai["卸货港"]
-                xiehuo_matou = row_hai["卸货码头"]
-                ship_tonnage = row_hai["海运船吨数"]
-                haiyun_fee = row_hai["海运费"]
-                if pd.isna(ship_tonnage):
-                    continue
-
-                df_xiehuo_candidates = df_gangkou_xiehuo[
-                    (df_gangkou_xiehuo["港口名称"]==xiehuo_gang) &
-                    (df_gangkou_xiehuo["码头名称"]==xiehuo_matou)
-                ]
-                if df_xiehuo_candidates.empty:
-                    continue
+# 运算结果缓存：相同的五个输入文件与运算选项直接返回已有结果
+RESULT_CACHE_FOLDER = os.path.join(os.getcwd(), "cache")
+result_cache = ResultCache(max_entries=16, max_bytes=256 * 1024 * 1024, folder=RESULT_CACHE_FOLDER)
+# 分阶段缓存：只更换部分输入文件时，未受影响的阶段（PART A / 海运组合）直接复用
+stage_cache = StageCache(max_entries=32, max_bytes=256 * 1024 * 1024)
 
-                for _, row_xh in df_xiehuo_candidates.iterrows():
-                    xiehuo_fee = row_xh.get("码头费", 0)
-                    xiehuo_tonnage = row_xh.get("最大吨位（万吨)", math.inf)
-                    if pd.isna(fahuo_tonnage) or pd.isna(xiehuo_tonnage):
-                        continue
-                    if ship_tonnage > fahuo_tonnage or ship_tonnage > xiehuo_tonnage:
-                        continue
+# 后台运算任务：同时运行的任务数与排队上限
+app.config["JOB_WORKERS"] = 2
+app.config["JOB_QUEUE_DEPTH"] = 8
+job_manager = JobManager(max_workers=app.config["JOB_WORKERS"], max_queued=app.config["JOB_QUEUE_DEPTH"])
+# 单个任务内部的并行进程数（大于 1 时按矿山分块多进程计算，结果不变）
+app.config["PROCESS_WORKERS"] = 1
+# 最近一次运算结果的路线索引，供 /route 点查询；批量查询的条数上限
+route_index_store = RouteIndexStore()
+app.config["ROUTE_BATCH_LIMIT"] = 1000
+# 行级增量更新：最近若干个结果键对应的输入文件与选项，以及最近使用的若干个增量会话（结果键 -> IncrementalRoutes）
+app.config["DELTA_SOURCES"] = 64
+app.config["DELTA_SESSIONS"] = 4
+delta_sources = OrderedDict()
+delta_sessions = OrderedDict()
+delta_lock = threading.Lock()
+# 上传后在后台把 Excel 转为快照，不阻塞上传请求
+snapshot_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
 
-                    # -------------- 处理“短倒费.xlsx” --------------
-                    df_duan = df_duandao[df_duandao["卸货码头"]==xiehuo_matou]
-                    if df_duan.empty:
-                        add_target = ""
-                        add_price  = 0
-                        # 模式 A（非平仓）：总费用 = 到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
-                        totalA = price_to_sea + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
-                        rowA = {
-                            "采购价": mine_price,
-                            "矿山": mine_name,
-                            "运输方式1": way1,
-                            "汽运价格": qiyun_price,
-                            "铁路港": rail_port,
-                            "运输方式2": way2,
-                            "铁路价格": tielu_price,
-                            "海港": seaport,
-                            "到海港价格": price_to_sea,
-                            "平仓价": "",
-                            "是否平仓价发货": "否",
-                            "发货港": seaport,
-                            "发货码头": fahuo_matou,
-                            "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
-                            "发货码头费": fahuo_fee,
-                            "卸货港": xiehuo_gang,
-                            "卸货码头": xiehuo_matou,
-                            "卸货码头费": xiehuo_fee,
-                            "海运船吨数": ship_tonnage,
-                            "海运费": haiyun_fee,
-                            "附加终点": add_target,
-                            "附加费用": add_price,
-                            "总费用": totalA
-                        }
-                        final_results.append(rowA)
-                        if pd.notna(fahuo_pcj) and fahuo_pcj != 0:
-                            totalB = fahuo_pcj + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
-                            rowB = {
-                                "采购价": "",
-                                "矿山": "",
-                                "运输方式1": "",
-                                "汽运价格": 0,
-                                "铁路港": "",
-                                "运输方式2": "",
-                                "铁路价格": 0,
-                                "海港": "",
-                                "到海港价格": "",
-                                "平仓价": fahuo_pcj,
-                                "是否平仓价发货": "是",
-                                "发货港": seaport,
-                                "发货码头": fahuo_matou,
-                                "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
-                                "发货码头费": fahuo_fee,
-                                "卸货港": xiehuo_gang,
-                                "卸货码头": xiehuo_matou,
-                                "卸货码头费": xiehuo_fee,
-                                "海运船吨数": ship_tonnage,
-                                "海运费": haiyun_fee,
-                                "附加终点": add_target,
-                                "附加费用": add_price,
-                                "总费用": totalB
-                            }
-                            final_results.append(rowB)
-                    else:
-                        for _, drow in df_duan.iterrows():
-                            add_target = drow["附加终端"] if "附加终端" in drow else drow["附加终点"]
-                            add_price  = drow["附加价格"]
-                            totalA = price_to_sea + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
-                            rowA = {
-                                "采购价": mine_price,
-                                "矿山": mine_name,
-                                "运输方式1": way1,
-                                "汽运价格": qiyun_price,
-                                "铁路港": rail_port,
-                                "运输方式2": way2,
-                                "铁路价格": tielu_price,
-                                "海港": seaport,
-                                "到海港价格": price_to_sea,
-                                "平仓价": "",
-                                "是否平仓价发货": "否",
-                                "发货港": seaport,
-                                "发货码头": fahuo_matou,
-                                "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
-                                "发货码头费": fahuo_fee,
-                                "卸货港": xiehuo_gang,
-                                "卸货码头": xiehuo_matou,
-                                "卸货码头费": xiehuo_fee,
-                                "海运船吨数": ship_tonnage,
-                                "海运费": haiyun_fee,
-                                "附加终点": add_target,
-                                "附加费用": add_price,
-                                "总费用": totalA
-                            }
-                            final_results.append(rowA)
-                            if pd.notna(fahuo_pcj) and fahuo_pcj != 0:
-                                totalB = fahuo_pcj + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
-                                rowB = {
-                                    "采购价": "",
-                                    "矿山": "",
-                                    "运输方式1": "",
-                                    "汽运价格": 0,
-                                    "铁路港": "",
-                                    "运输方式2": "",
-                                    "铁路价格": 0,
-                                    "海港": "",
-                                    "到海港价格": "",
-                                    "平仓价": fahuo_pcj,
-                                    "是否平仓价发货": "是",
-                                    "发货港": seaport,
-                                    "发货码头": fahuo_matou,
-                                    "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
-                                    "发货码头费": fahuo_fee,
-                                    "卸货港": xiehuo_gang,
-                                    "卸货码头": xiehuo_matou,
-                                    "卸货码头费": xiehuo_fee,
-                                    "海运船吨数": ship_tonnage,
-                                    "海运费": haiyun_fee,
-                                    "附加终点": add_target,
-                                    "附加费用": add_price,
-                                    "总费用": totalB
-                                }
-                                final_results.append(rowB)
+# ==================== 运行指标 ====================
+@app.before_request
+def start_request_timer():
+    if metrics.ENABLED:
+        g.request_started = time.perf_counter()
 
-    df_final = pd.DataFrame(final_results, columns=output_columns)
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        metrics.REGISTRY.record_request(endpoint, request.method, response.status_code, time.perf_counter() - started)
+    return response
 
-    # ---------------- PART C：分组仅保留最优记录 ----------------
-    # 非平仓记录：以【矿山, 卸货码头】为分组依据
-    df_non = df_final[df_final["是否平仓价发货"]=="否"]
-    if not df_non.empty:
-        df_non_opt = df_non.sort_values("总费用").groupby(["矿山", "卸货码头"], as_index=False).first()
-    else:
-        df_non_opt = pd.DataFrame(columns=df_final.columns)
-    # 平仓记录：以【发货港, 卸货码头】为分组依据
-    df_ping = df_final[df_final["是否平仓价发货"]=="是"]
-    if not df_ping.empty:
-        df_ping_opt = df_ping.sort_values("总费用").groupby(["发货港", "卸货码头"], as_index=False).first()
-    else:
-        df_ping_opt = pd.DataFrame(columns=df_final.columns)
-    df_opt = pd.concat([df_non_opt, df_ping_opt], ignore_index=True)
-    df_opt = df_opt.sort_values("总费用")
-    # 重新按照 output_columns 顺序排序，确保“卸货码头”位于“卸货港”之后
-    df_opt = df_opt[output_columns]
-
-    return df_opt
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    stats = result_cache.stats()
+    extra = {
+        "bestline_result_cache_hits_total": ("counter", "结果缓存命中次数", stats["hits"]),
+        "bestline_result_cache_misses_total": ("counter", "结果缓存未命中次数", stats["misses"]),
+        "bestline_result_cache_evictions_total": ("counter", "结果缓存淘汰次数（内存与磁盘）",
+                                                  stats["memory_evictions"] + stats["disk_evictions"]),
+        "bestline_result_cache_memory_bytes": ("gauge", "结果缓存内存级占用（字节）", stats["memory_bytes"]),
+    }
+    return Response(metrics.render_prometheus(extra=extra), mimetype="text/plain; version=0.0.4; charset=utf-8")
 
 # ==================== Web 部分 ====================
 @app.route("/", methods=["GET"])
@@ -415,6 +133,7 @@ def index():
           <div id="preview_file_duandao"></div>
         </div>
         <hr>
+        <label>每组保留条数（备选路线）：<input type="number" id="top_k" min="1" value="1"></label>
         <button onclick="processFiles()">运算</button>
         <div id="process_result"></div>
         <script>
@@ -436,7 +155,8 @@ def index():
               contentType: false,
               success: function(data) {
                 $("#preview_" + fieldId).html(data.preview);
-                localStorage.setItem(fieldId, data.filepath);
+                // 优先保存快照标识，运算时直接读取快照而不再解析 Excel
+                localStorage.setItem(fieldId, data.snapshot || data.filepath);
               },
               error: function(err) {
                 alert("上传失败: " + err.responseText);
@@ -457,19 +177,44 @@ def index():
                 return;
               }
             }
+            payload.top_k = parseInt($("#top_k").val(), 10) || 1;
             $.ajax({
               url: "/process",
               type: "POST",
               contentType: "application/json",
               data: JSON.stringify(payload),
               success: function(data) {
-                $("#process_result").html(data);
+                $("#process_result").html("<p>任务已提交，排队中…</p>");
+                pollJob(data.job_id);
               },
               error: function(err) {
                 alert("运算失败: " + err.responseText);
               }
             });
           }
+          function pollJob(jobId) {
+            $.getJSON("/job_status/" + jobId, function(job) {
+              if(job.status == "done") {
+                $("#process_result").html(job.html);
+                return;
+              }
+              if(job.status == "failed") {
+                $("#process_result").html("");
+                alert("运算失败: " + job.error);
+                return;
+              }
+              var lines = [job.status == "queued" ? "排队中…" : "运算中…"];
+              for (var i = 0; i < job.stages.length; i++) {
+                var stage = job.stages[i];
+                lines.push(stage.stage + "：" + (stage.status == "done" ? "完成" : "进行中")
+                           + (stage.rows !== null ? "（" + stage.rows + " 行）" : ""));
+              }
+              $("#process_result").html("<p>" + lines.join("<br>") + "</p>");
+              setTimeout(function() { pollJob(jobId); }, 1000);
+            }).fail(function(err) {
+              alert("查询任务状态失败: " + err.responseText);
+            });
+          }
         </script>
       </body>
     </html>
@@ -482,16 +227,32 @@ def upload_file():
     fieldId = request.form.get("fieldId")
     if not file or not fieldId:
         return {"error": "缺少文件或字段参数"}, 400
-    filename = fieldId + "_" + file.filename
-    filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(filepath)
+    # 按块写盘并同时计算内容哈希，文件按内容哈希命名
+    filepath, key = save_stream(file.stream, app.config["UPLOAD_FOLDER"], os.path.basename(file.filename))
     session[fieldId] = filepath
+    snapshot = register_upload(filepath, key, app.config["SNAPSHOT_FOLDER"])
+    # 快照在后台生成；运算时若尚未生成会当场生成，内容相同的文件复用已有快照
+    snapshot_executor.submit(build_upload_snapshot, snapshot)
+    columns, row_count, dimensions = [], None, None
     try:
-        df = pd.read_excel(filepath)
-        preview_html = df.to_html(classes="table table-bordered", index=False, escape=False)
+        with metrics.timed("上传预览") as timer:
+            preview = preview_table(filepath, app.config["PREVIEW_ROWS"])
+            timer.rows = preview["row_count"]
+        columns, row_count, dimensions = preview["columns"], preview["row_count"], preview["dimensions"]
+        summary = "共 " + (str(row_count) if row_count is not None else "?") + " 行、" + str(len(columns)) + " 列"
+        if row_count is None or row_count > len(preview["df"]):
+            summary += "，以下仅显示前 " + str(len(preview["df"])) + " 行"
+        preview_html = "<p>" + summary + "</p>" + preview["df"].to_html(
+            classes="table table-bordered", index=False, escape=False)
     except Exception as e:
         preview_html = "<p>读取Excel文件出错: " + str(e) + "</p>"
-    return {"preview": preview_html, "filepath": filepath}
+    return {"preview": preview_html, "filepath": filepath, "snapshot": snapshot,
+            "columns": columns, "row_count": row_count, "dimensions": dimensions}
+
+def build_upload_snapshot(snapshot):
+    """后台生成上传文件的快照（解析 Excel），耗时计入“生成快照”阶段。"""
+    with metrics.timed("生成快照"):
+        return build_snapshot(snapshot, app.config["SNAPSHOT_FOLDER"])
 
 @app.route("/process", methods=["POST"])
 def process_endpoint():
@@ -504,54 +265,386 @@ def process_endpoint():
     if not all([file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao]):
         return "请确保所有文件均已上传", 400
     try:
-        df_result = process_files(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao)
-    except Exception as e:
-        return "处理文件时发生错误: " + str(e), 500
-    result_filepath = os.path.join(app.config["RESULT_FOLDER"], "路径规划-输出.xlsx")
-    df_result.to_excel(result_filepath, index=False)
-    session["result_file"] = result_filepath
-    result_html = '''
+        top_k = int(data.get("top_k") or 1)
+    except (TypeError, ValueError):
+        return "每组保留条数必须为正整数", 400
+    if top_k < 1:
+        return "每组保留条数必须为正整数", 400
+    sources = [file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao]
+    try:
+        job_id = job_manager.submit(run_process_job, sources, top_k)
+    except QueueFullError as e:
+        return str(e), 503
+    return {"job_id": job_id}, 202
+
+def run_process_job(progress, sources, top_k):
+    """
+    后台任务：优先使用缓存结果，否则运算并放入缓存，返回缓存键（结果文件在下载时才按所选格式生成）
+    以及各阶段的耗时汇总。
+    """
+    recorder = metrics.StageRecorder(forward=progress)
+    generation = route_index_store.next_generation()
+    key = cache_key(sources, {"top_k": top_k})
+    df_result = result_cache.get(key)
+    if df_result is None:
+        df_result = process_files(*sources, top_k=top_k, progress=recorder, stage_cache=stage_cache,
+                                  workers=app.config["PROCESS_WORKERS"])
+        result_cache.put(key, df_result)
+    else:
+        recorder("结果缓存", "done", len(df_result))
+    remember_delta_source(key, sources, top_k)
+    # 在后台线程中建好完整的索引后再整体替换，查询不受影响
+    recorder("路线索引", "running")
+    index = build_route_index(df_result, result_key=key, generation=generation)
+    route_index_store.publish(index)
+    recorder("路线索引", "done", len(index))
+    return {"result_key": key, "timings": recorder.summary()}
+
+@app.route("/scenarios", methods=["POST"])
+def scenarios_endpoint():
+    """批量情景测算：五个输入文件同 /process，scenarios 为情景列表（格式见 scenario.py），结果含“场景”列。"""
+    data = request.get_json()
+    sources = [data.get(name) for name in ("file_caigoujia", "file_qianzhi", "file_gangkou", "file_haiyun", "file_duandao")]
+    if not all(sources):
+        return "请确保所有文件均已上传", 400
+    try:
+        scenarios = parse_scenarios(data.get("scenarios"))
+    except ValueError as e:
+        return str(e), 400
+    try:
+        job_id = job_manager.submit(run_scenario_job, sources, scenarios)
+    except QueueFullError as e:
+        return str(e), 503
+    return {"job_id": job_id}, 202
+
+def run_scenario_job(progress, sources, scenarios):
+    """后台任务：与 run_process_job 相同地使用结果缓存，缓存键包含全部情景。"""
+    recorder = metrics.StageRecorder(forward=progress)
+    key = cache_key(sources, {"scenarios": scenarios})
+    df_result = result_cache.get(key)
+    if df_result is None:
+        df_result = process_scenarios(*sources, scenarios, progress=recorder)
+        result_cache.put(key, df_result)
+    else:
+        recorder("结果缓存", "done", len(df_result))
+    return {"result_key": key, "timings": recorder.summary()}
+
+@app.route("/delta", methods=["POST"])
+def delta_endpoint():
+    """
+    行级增量更新：changes 为变更列表（格式见 incremental.py），应用在 result_key（缺省为当前会话的结果）之上，
+    只重新计算受影响的分组。返回新结果的 result_key 及被替换、新增的记录数；新结果同时放入结果缓存。
+    增量会话在锁外重建与更新：取出会话后由本请求独占，同一结果的并发更新各自从输入文件重建。
+    """
+    data = request.get_json(silent=True) or {}
+    key = data.get("result_key") or session.get("result_key")
+    if not key:
+        return "请先完成一次运算", 400
+    try:
+        changes = parse_changes(data.get("changes"))
+    except ValueError as e:
+        return str(e), 400
+    with delta_lock:
+        inc = delta_sessions.pop(key, None)
+        source = delta_sources.get(key)
+        if source is not None:
+            delta_sources.move_to_end(key)
+    if inc is None:
+        if source is None:
+            return "该结果不支持增量更新，请重新运算", 404
+        sources, top_k = source
+        inc = load_incremental(*sources, top_k=top_k, df_result=result_cache.get(key, record=False))
+    started = time.perf_counter()
+    try:
+        with metrics.timed("增量更新") as timer:
+            delta = inc.apply(changes)
+            timer.rows = len(delta["added"])
+    except ValueError as e:
+        with delta_lock:
+            delta_sessions[key] = inc
+            _trim_lru(delta_sessions, app.config["DELTA_SESSIONS"])
+        return str(e), 400
+    seconds = time.perf_counter() - started
+    new_key = derived_key(key, changes)
+    result_cache.put(new_key, inc.result)
+    with delta_lock:
+        delta_sessions[new_key] = inc
+        _trim_lru(delta_sessions, app.config["DELTA_SESSIONS"])
+        # 当前索引来自被更新的结果时，只替换受影响的分组
+        index = route_index_store.current
+        if index is not None and index.result_key == key:
+            route_index_store.publish(index.patched(delta["removed"], delta["added"], result_key=new_key,
+                                                    generation=route_index_store.next_generation()))
+    session["result_key"] = new_key
+    return {"result_key": new_key, "removed": len(delta["removed"]), "added": len(delta["added"]),
+            "seconds": round(seconds, 6)}
+
+def remember_delta_source(key, sources, top_k):
+    """记下结果键对应的输入文件与选项，供之后的增量更新重建会话；只保留最近的 DELTA_SOURCES 个。"""
+    with delta_lock:
+        delta_sources[key] = (sources, top_k)
+        delta_sources.move_to_end(key)
+        _trim_lru(delta_sources, app.config["DELTA_SOURCES"])
+
+def _trim_lru(entries, limit):
+    """按最近使用顺序淘汰 OrderedDict 中超出 limit 的最早条目（调用方持有 delta_lock）。"""
+    while len(entries) > limit:
+        entries.popitem(last=False)
+
+@app.route("/job_status/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = job_manager.status(job_id)
+    if job is None:
+        return {"error": "任务不存在"}, 404
+    result = job.pop("result")
+    if job["status"] == JOB_DONE:
+        session["result_key"] = result["result_key"]
+        job["timings"] = result["timings"]
+        job["html"] = '''
       <h2>运算完成！</h2>
-      <button onclick="window.location.href='/download_result'">下载结果</button>
+      <select id="result_format">''' + "".join(
+            '<option value="' + fmt + '">' + label + '</option>' for fmt, label in DOWNLOAD_FORMATS) + '''
+      </select>
+      <button onclick="window.location.href='/download_result?format=' + $('#result_format').val()">下载结果</button>
       <button onclick="window.location.href='/view_result'">在线查看</button>
     '''
-    return result_html
+    elif job["status"] == JOB_FAILED:
+        job["error"] = "处理文件时发生错误: " + job["error"]
+    return job
 
 @app.route("/download_result", methods=["GET"])
 def download_result():
-    result_filepath = session.get("result_file")
-    if not result_filepath or not os.path.exists(result_filepath):
+    fmt = request.args.get("format", "xlsx")
+    if fmt not in EXPORT_FORMATS:
+        return "不支持的导出格式: " + fmt, 400
+    key = session.get("result_key")
+    if not key:
         return "结果文件不存在", 404
-    return send_from_directory(app.config["RESULT_FOLDER"], os.path.basename(result_filepath), as_attachment=True)
+    # 结果文件按缓存键与格式命名，首次下载时才生成，之后直接复用
+    filename = "路径规划-输出-" + key[:16] + "." + fmt
+    result_filepath = os.path.join(app.config["RESULT_FOLDER"], filename)
+    try:
+        # 更新修改时间，供 prune_result_files 按最近下载时间淘汰
+        os.utime(result_filepath)
+    except OSError:
+        df = load_session_result()
+        if df is None:
+            return "结果文件不存在", 404
+        try:
+            with metrics.timed("导出 " + fmt) as timer:
+                export_result(df, result_filepath, fmt)
+                timer.rows = len(df)
+        except ValueError as e:
+            return str(e), 400
+        prune_result_files(keep=result_filepath)
+    return send_from_directory(app.config["RESULT_FOLDER"], filename, as_attachment=True,
+                               download_name="路径规划-输出." + fmt, mimetype=EXPORT_FORMATS[fmt])
+
+def prune_result_files(keep=None):
+    """结果目录中只保留最近下载的 RESULT_FILES 个导出文件（keep 为刚生成的文件，总是保留），其余删除。"""
+    folder = app.config["RESULT_FOLDER"]
+    entries = []
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        # 正在写入的临时文件由 export_result 自行清理
+        if not name.startswith("路径规划-输出-") or ".tmp-" in name or path == keep:
+            continue
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:
+            pass
+    entries.sort(reverse=True)
+    for _, path in entries[max(app.config["RESULT_FILES"] - 1, 0):]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# ==================== 路线点查询 ====================
+def _route_lookup(index, query, limit):
+    """单条查询：{"mine", "terminal"} 查非平仓路线，{"origin", "terminal"} 查平仓路线。"""
+    if not isinstance(query, dict) or not query.get("terminal") or bool(query.get("mine")) == bool(query.get("origin")):
+        raise ValueError("查询需包含 terminal，以及 mine 或 origin 之一: " + str(query))
+    terminal = str(query["terminal"])
+    if query.get("mine"):
+        routes = index.lookup_mine(str(query["mine"]), terminal, limit)
+    else:
+        routes = index.lookup_origin(str(query["origin"]), terminal, limit)
+    return {"query": query, "found": bool(routes), "routes": routes}
+
+def _route_limit(value):
+    """返回的路线条数：1 为只返回最优路线，大于 1 时附带备选路线（不超过索引中保存的条数）。"""
+    try:
+        limit = int(value or 1)
+    except (TypeError, ValueError):
+        raise ValueError("alternatives 必须为正整数")
+    if limit < 1:
+        raise ValueError("alternatives 必须为正整数")
+    return limit
+
+@app.route("/route", methods=["GET"])
+def route_query():
+    index = route_index_store.current
+    if index is None:
+        return "尚无可用的路线索引，请先完成一次运算", 503
+    try:
+        query = {name: request.args[name] for name in ("mine", "origin", "terminal") if request.args.get(name)}
+        return _route_lookup(index, query, _route_limit(request.args.get("alternatives")))
+    except ValueError as e:
+        return str(e), 400
+
+@app.route("/route/batch", methods=["POST"])
+def route_batch_query():
+    index = route_index_store.current
+    if index is None:
+        return "尚无可用的路线索引，请先完成一次运算", 503
+    data = request.get_json(silent=True) or {}
+    queries = data.get("queries")
+    if not isinstance(queries, list) or len(queries) > app.config["ROUTE_BATCH_LIMIT"]:
+        return "queries 必须为列表，且不超过 " + str(app.config["ROUTE_BATCH_LIMIT"]) + " 条", 400
+    try:
+        limit = _route_limit(data.get("alternatives"))
+        results = [_route_lookup(index, query, limit) for query in queries]
+    except ValueError as e:
+        return str(e), 400
+    return {"result_key": index.result_key, "results": results}
+
+@app.route("/route/info", methods=["GET"])
+def route_index_info():
+    index = route_index_store.current
+    if index is None:
+        return "尚无可用的路线索引，请先完成一次运算", 503
+    return index.info()
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    stats = result_cache.stats()
+    stats["stages"] = stage_cache.stats()
+    return stats
 
 @app.route("/view_result", methods=["GET"])
 def view_result():
-    result_filepath = session.get("result_file")
-    if not result_filepath or not os.path.exists(result_filepath):
+    if load_session_result() is None:
         return "结果文件不存在", 404
-    try:
-        df = pd.read_excel(result_filepath)
-        result_table = df.to_html(classes="table table-striped", index=False, escape=False, na_rep="")
-    except Exception as e:
-        result_table = "<p>读取结果文件出错: " + str(e) + "</p>"
     html_content = '''
     <html>
       <head>
         <meta charset="utf-8">
         <title>在线查看结果</title>
         <link rel="stylesheet" href="https://stackpath.bootstrapcdn.com/bootstrap/4.5.2/css/bootstrap.min.css">
+        <script src="https://code.jquery.com/jquery-3.5.1.min.js"></script>
       </head>
       <body>
-        <div class="container mt-4">
+        <div class="container-fluid mt-4">
           <h1>运算结果</h1>
-          ''' + result_table + '''
-          <br>
+          <div id="filters" class="form-inline mb-2"></div>
+          <div class="mb-2">
+            <button onclick="gotoPage(state.page - 1)">上一页</button>
+            <span id="pager"></span>
+            <button onclick="gotoPage(state.page + 1)">下一页</button>
+          </div>
+          <table class="table table-striped table-sm">
+            <thead><tr id="header"></tr></thead>
+            <tbody id="rows"></tbody>
+          </table>
           <a href="/">返回首页</a>
         </div>
+        <script>
+          // 每次只向 /result_data 请求一页数据；点击表头切换排序列与方向
+          var state = {page: 1, page_size: 50, sort: "", order: "asc", filters: {}};
+          function escapeHtml(value) {
+            if(value === null || value === undefined) return "";
+            return String(value).replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+          }
+          function buildFilters(options) {
+            for (var col in options) {
+              var select = $("<select class='form-control mr-2'></select>").attr("data-col", col);
+              select.append($("<option value=''></option>").text(col + "（全部）"));
+              for (var i = 0; i < options[col].length; i++) {
+                select.append($("<option></option>").attr("value", options[col][i]).text(options[col][i]));
+              }
+              select.on("change", function() {
+                state.filters[$(this).attr("data-col")] = $(this).val();
+                gotoPage(1);
+              });
+              $("#filters").append(select);
+            }
+          }
+          function sortBy(col) {
+            state.order = (state.sort == col && state.order == "asc") ? "desc" : "asc";
+            state.sort = col;
+            gotoPage(1);
+          }
+          function gotoPage(page) {
+            var params = $.extend({page: Math.max(page, 1), page_size: state.page_size,
+                                   sort: state.sort, order: state.order}, state.filters);
+            if($("#filters").children().length == 0) params.options = 1;
+            $.getJSON("/result_data", params, function(data) {
+              if(data.options) buildFilters(data.options);
+              state.page = data.page;
+              var header = "";
+              for (var i = 0; i < data.columns.length; i++) {
+                var mark = data.columns[i] == state.sort ? (state.order == "asc" ? " ▲" : " ▼") : "";
+                header += "<th style='cursor:pointer' onclick='sortBy(this.dataset.col)' data-col='"
+                          + escapeHtml(data.columns[i]) + "'>" + escapeHtml(data.columns[i]) + mark + "</th>";
+              }
+              $("#header").html(header);
+              var body = [];
+              for (var r = 0; r < data.rows.length; r++) {
+                var cells = [];
+                for (var c = 0; c < data.rows[r].length; c++) cells.push("<td>" + escapeHtml(data.rows[r][c]) + "</td>");
+                body.push("<tr>" + cells.join("") + "</tr>");
+              }
+              $("#rows").html(body.join(""));
+              $("#pager").text("第 " + data.page + " / " + data.pages + " 页，共 " + data.total + " 条");
+            }).fail(function(err) {
+              alert("读取结果出错: " + err.responseText);
+            });
+          }
+          gotoPage(1);
+        </script>
       </body>
     </html>
     '''
     return render_template_string(html_content)
 
+@app.route("/result_data", methods=["GET"])
+def result_data():
+    """
+    分页返回当前结果：page、page_size 为页码与每页行数；sort 为排序列，order 为 asc/desc；
+    矿山、卸货港、卸货码头、是否平仓价发货 为筛选条件；options=1 时附带各筛选列的可选取值。
+    """
+    df = load_session_result()
+    if df is None:
+        return {"error": "结果文件不存在"}, 404
+    try:
+        page = int(request.args.get("page", 1))
+        page_size = int(request.args.get("page_size", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return {"error": "页码与每页行数必须为整数"}, 400
+    filters = {col: request.args.get(col) for col in FILTER_COLUMNS if request.args.get(col)}
+    try:
+        data = query_result(df, page=page, page_size=page_size, sort_by=request.args.get("sort") or None,
+                            ascending=request.args.get("order", "asc") != "desc", filters=filters)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    if request.args.get("options"):
+        data["options"] = filter_options(df)
+    return data
+
+def load_session_result():
+    """取当前会话的运算结果（从结果缓存的内存或磁盘级读取）；增量更新的结果已被缓存淘汰时从仍保留的增量会话重新生成；都已淘汰时返回 None。"""
+    key = session.get("result_key")
+    if not key:
+        return None
+    df = result_cache.get(key, record=False)
+    if df is None:
+        with delta_lock:
+            inc = delta_sessions.get(key)
+            if inc is not None:
+                df = inc.result
+                result_cache.put(key, df)
+    return df
+
 if __name__ == "__main__":
     app.run(debug=True, host="0.0.0.0", port=5000)
@@ -0,0 +1,231 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from snapshot import source_hash
+
+# ==================== 运算结果缓存 ====================
+# 以五个输入文件的内容哈希加运算选项作为键缓存运算结果，分内存与磁盘两级，
+# 每级都按条目数与字节数上限做 LRU 淘汰。内存中淘汰的结果仍保留在磁盘上，命中时再提升回内存。
+# 磁盘读写在锁外进行（写入先写临时文件再改名），锁只保护索引与 LRU 顺序，读写大结果时不阻塞其他请求。
+# StageCache 则按阶段缓存中间结果，只替换部分输入文件时其余阶段可以直接复用。
+
+# 结果格式版本，计入缓存键：运算结果随代码改变时（如空值费用的剪枝修正）加 1，磁盘上旧版本的结果不再命中
+RESULT_VERSION = 2
+
+
+def cache_key(sources, options=None):
+    """
+    根据输入文件内容与运算选项计算缓存键。sources 中的快照标识直接使用其中的内容哈希，
+    文件路径则计算文件内容的 SHA-256，因此同一内容无论以何种方式传入都得到相同的键。键中包含 RESULT_VERSION。
+    """
+    hashes = [source_hash(source) for source in sources]
+    payload = json.dumps({"version": RESULT_VERSION, "inputs": hashes, "options": options or {}},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def derived_key(key, changes):
+    """在已有结果（键为 key）上应用一组行级变更（见 incremental.py）后得到的结果的缓存键；版本随 key 继承。"""
+    payload = json.dumps({"base": key, "changes": changes}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    两级 LRU 结果缓存。
+    max_entries / max_bytes 限制内存级；disk_max_entries / disk_max_bytes 限制磁盘级（folder 为 None 时不使用磁盘）。
+    计数器：hits（memory_hits + disk_hits）、misses、memory_evictions、disk_evictions，见 stats()。
+    """
+
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024, folder=None,
+                 disk_max_entries=256, disk_max_bytes=2 * 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.folder = folder
+        self.disk_max_entries = disk_max_entries
+        self.disk_max_bytes = disk_max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> (DataFrame, 字节数)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()     # key -> 文件字节数
+        self._disk_bytes = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "memory_evictions": 0, "disk_evictions": 0}
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+            self._load_disk_index()
+
+    def _disk_path(self, key):
+        return os.path.join(self.folder, key + ".pkl")
+
+    def _load_disk_index(self):
+        """启动时按修改时间恢复磁盘级的 LRU 顺序。"""
+        entries = []
+        for name in os.listdir(self.folder):
+            if name.endswith(".pkl"):
+                path = os.path.join(self.folder, name)
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-len(".pkl")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    def get(self, key, record=True):
+        """返回缓存的结果；未命中时返回 None。record=False 时不计入命中/未命中计数（如在线查看时取结果）。"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                if record:
+                    self.counters["memory_hits"] += 1
+                return self._memory[key][0]
+            on_disk = key in self._disk
+            if not on_disk and record:
+                self.counters["misses"] += 1
+        if not on_disk:
+            return None
+        # 读取期间文件可能已被淘汰删除，此时按未命中处理
+        try:
+            df = pd.read_pickle(self._disk_path(key))
+            os.utime(self._disk_path(key))
+        except (OSError, ValueError, EOFError):
+            df = None
+        with self._lock:
+            if df is None:
+                if key in self._disk:
+                    self._drop_disk(key)
+                if record:
+                    self.counters["misses"] += 1
+                return None
+            if key in self._disk:
+                self._disk.move_to_end(key)
+            if record:
+                self.counters["disk_hits"] += 1
+            self._put_memory(key, df)
+            return df
+
+    def put(self, key, df):
+        with self._lock:
+            self._put_memory(key, df)
+            if self.folder is None or key in self._disk:
+                return
+        # 写入独占的临时文件后改名，并发写入同一键时互不影响，读取方也不会读到写了一半的文件
+        path = self._disk_path(key)
+        handle, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.folder)
+        os.close(handle)
+        try:
+            df.to_pickle(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        size = os.path.getsize(path)
+        with self._lock:
+            if key in self._disk:
+                self._disk_bytes -= self._disk.pop(key)
+            self._disk[key] = size
+            self._disk_bytes += size
+            self._evict_disk()
+
+    def _put_memory(self, key, df):
+        if key in self._memory:
+            self._memory_bytes -= self._memory.pop(key)[1]
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        self._memory[key] = (df, size)
+        self._memory_bytes += size
+        # 至少保留刚放入的一条，避免单个超大结果放入后立即被淘汰
+        while len(self._memory) > 1 and (len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes):
+            _, (_, old_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= old_size
+            self.counters["memory_evictions"] += 1
+
+    def _drop_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key)
+        try:
+            os.remove(self._disk_path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self):
+        while self._disk and (len(self._disk) > self.disk_max_entries or self._disk_bytes > self.disk_max_bytes):
+            self._drop_disk(next(iter(self._disk)))
+            self.counters["disk_evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats.update({
+                "memory_entries": len(self._memory), "memory_bytes": self._memory_bytes,
+                "disk_entries": len(self._disk), "disk_bytes": self._disk_bytes,
+            })
+            return stats
+
+
+def _deep_size(value):
+    """估算阶段结果占用的内存（字节）：DataFrame、数组按 memory_usage(deep=True) 计，字典、元组、列表逐项累加。"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, pd.Categorical):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return int(pd.Series(value, copy=False).memory_usage(index=False, deep=True)) if value.dtype == object \
+            else value.nbytes
+    if isinstance(value, dict):
+        return sum(_deep_size(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(_deep_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class StageCache:
+    """
+    运算各阶段中间结果的内存缓存（见 route_engine.process_files 的 stage_cache 参数）。
+    以（阶段, 该阶段所依赖输入的哈希）为键，按条目数与字节数上限做 LRU 淘汰（字节数见 _deep_size，
+    同 ResultCache 的内存级至少保留刚放入的一条）；stats() 给出各阶段的命中与未命中次数。
+    """
+
+    def __init__(self, max_entries=32, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # (阶段, 键) -> (中间结果, 字节数)
+        self._bytes = 0
+        self.counters = {}
+
+    def _count(self, stage, name):
+        counts = self.counters.setdefault(stage, {"hits": 0, "misses": 0})
+        counts[name] += 1
+
+    def get(self, stage, key):
+        with self._lock:
+            entry = self._entries.get((stage, key))
+            if entry is None:
+                self._count(stage, "misses")
+                return None
+            self._entries.move_to_end((stage, key))
+            self._count(stage, "hits")
+            return entry[0]
+
+    def put(self, stage, key, value):
+        # 估算大小（可能较慢）在锁外进行
+        size = _deep_size(value)
+        with self._lock:
+            if (stage, key) in self._entries:
+                self._bytes -= self._entries.pop((stage, key))[1]
+            self._entries[(stage, key)] = (value, size)
+            self._bytes += size
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+
+    def stats(self):
+        with self._lock:
+            return {stage: dict(counts) for stage, counts in self.counters.items()}
@@ -0,0 +1,66 @@
+import json
+import numpy as np
+import pandas as pd
+
+# ==================== 结果分页查询 ====================
+# 在线查看时按页从内存中的结果表取数据，支持按任意输出列排序，以及按矿山、卸货港、卸货码头、
+# 是否平仓价发货筛选（精确匹配）。每次只序列化一页，响应时间与结果总行数基本无关。
+
+FILTER_COLUMNS = ["场景", "矿山", "卸货港", "卸货码头", "是否平仓价发货"]
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+
+def _sort_key(series):
+    """
+    排序键：非空值均为数值时按数值排序，否则按文本排序。
+    （平仓记录的“到海港价格”等列为空字符串，与数值混在一列中，空字符串按空值处理、排在最后。）
+    """
+    values = series.replace("", np.nan) if series.dtype == object else series
+    numeric = pd.to_numeric(values, errors="coerce")
+    if numeric.notna().sum() == values.notna().sum():
+        return numeric
+    return values.astype(str).where(values.notna())
+
+
+def query_result(df, page=1, page_size=DEFAULT_PAGE_SIZE, sort_by=None, ascending=True, filters=None):
+    """
+    查询结果表的一页。filters 为 {列名: 取值}，只允许 FILTER_COLUMNS 中的列，取值为空时不筛选。
+    返回 {"columns", "rows", "total", "page", "page_size", "pages"}，rows 为该页各行的值列表（空值为 None）。
+    """
+    if page_size < 1 or page_size > MAX_PAGE_SIZE:
+        raise ValueError("每页行数必须在 1 到 " + str(MAX_PAGE_SIZE) + " 之间")
+    if sort_by is not None and sort_by not in df.columns:
+        raise ValueError("未知的排序列: " + str(sort_by))
+    rows = np.arange(len(df))
+    for col, value in (filters or {}).items():
+        if col not in FILTER_COLUMNS or col not in df.columns:
+            raise ValueError("不支持按该列筛选: " + str(col))
+        if value is None or value == "":
+            continue
+        values = df[col].to_numpy()[rows]
+        rows = rows[pd.Series(values, dtype=object).astype(str).to_numpy() == str(value)]
+    if sort_by is not None:
+        key = _sort_key(df[sort_by].iloc[rows].reset_index(drop=True))
+        rows = rows[key.sort_values(ascending=ascending, kind="stable", na_position="last").index.to_numpy()]
+
+    total = len(rows)
+    pages = max(1, -(-total // page_size))
+    page = min(max(1, page), pages)
+    df_page = df.iloc[rows[(page - 1) * page_size:page * page_size]]
+    return {
+        "columns": [str(col) for col in df.columns],
+        "rows": json.loads(df_page.to_json(orient="values", force_ascii=False)),
+        "total": total, "page": page, "page_size": page_size, "pages": pages,
+    }
+
+
+def filter_options(df):
+    """各筛选列的可选取值（去重后排序），用于页面上的下拉框。"""
+    options = {}
+    for col in FILTER_COLUMNS:
+        if col in df.columns:
+            values = df[col].dropna()
+            values = values[values.astype(str) != ""]
+            options[col] = sorted(set(values.astype(str)))
+    return options
@@ -0,0 +1,1452 @@
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from snapshot import read_table, source_hash
+
+# ==================== 路径规划运算引擎 ====================
+# 与 Web 层解耦，便于脚本直接调用以及对比不同实现的输出。
+
+# ---------------- 输出列顺序 ----------------
+# 注意：根据要求，“卸货码头”在“卸货港”之后
+OUTPUT_COLUMNS = [
+    "采购价", "矿山",
+    "运输方式1", "汽运价格", "铁路港", "运输方式2", "铁路价格",
+    "海港", "到海港价格",
+    "平仓价", "是否平仓价发货",
+    "发货港", "发货码头", "卸运方式", "发货码头费",
+    "卸货港", "卸货码头", "卸货码头费",
+    "海运船吨数", "海运费",
+    "附加终点", "附加费用",
+    "总费用"
+]
+
+# 可选的运算实现：vectorized 为基于 merge 的列式实现；reference 为原始逐行循环实现，仅用于核对结果；
+# graph 将输入编译为费用图后用多源 Dijkstra 求解，支持多于两段的前置运输（见 route_graph.py）；
+# sql 在磁盘上的 SQLite 数据库中以连接与窗口函数求解，候选记录超出内存时使用（见 route_sql.py）
+ENGINES = ("vectorized", "reference", "graph", "sql")
+
+
+def load_inputs(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao):
+    """
+    读取五张输入表，并对吨位相关列做数值转换。
+    各参数可以是 Excel 文件路径，也可以是 snapshot.create_snapshot 返回的快照标识（跳过 Excel 解析）。
+    """
+    df_caigoujia = read_table(file_caigoujia)
+    df_qianzhi   = read_table(file_qianzhi)
+    df_gangkou   = _read_gangkou(file_gangkou)
+    df_haiyun    = _read_haiyun(file_haiyun)
+    df_duandao   = read_table(file_duandao)
+    return df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao
+
+
+def _read_gangkou(source):
+    df_gangkou = read_table(source)
+    df_gangkou["最大吨位（万吨)"] = pd.to_numeric(df_gangkou["最大吨位（万吨)"], errors="coerce")
+    return df_gangkou
+
+
+def _read_haiyun(source):
+    df_haiyun = read_table(source)
+    df_haiyun["海运船吨数"] = pd.to_numeric(df_haiyun["海运船吨数"], errors="coerce")
+    return df_haiyun
+
+
+# ---------------- 名称编码 ----------------
+# vectorized 实现中，各输入表的实体名称统一编码为同一个 CategoricalDtype（一张共享的名称表）：
+# 类别为各表名称与引擎写入的固定取值排序后的并集，连接、分组、筛选都直接比较整数编码，
+# 候选记录的名称列也只保存编码；process_files 返回前再由 decode_names 还原为字符串。
+# 类别按字符串排序，因此按名称排序的结果与未编码时相同。
+NAME_COLUMNS = ["矿山", "起点", "起点类型", "终点", "终点类型", "运输方式", "港口名称", "码头名称", "港口类型",
+                "卸运方式", "发货港", "发货码头", "卸货港", "卸货码头", "附加终点", "附加终端"]
+_FIXED_NAMES = ["", "是", "否"]
+
+
+def _name_values(df):
+    """表中可编码的名称列：全部非空取值均为字符串的 NAME_COLUMNS 列。"""
+    columns = {}
+    for col in NAME_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            values = df[col].dropna().unique()
+            if all(isinstance(value, str) for value in values):
+                columns[col] = values
+    return columns
+
+
+def name_dtype(*tables):
+    """由若干输入表（或已编码的 Categorical 类型）的名称建立共享的 CategoricalDtype。"""
+    names = set(_FIXED_NAMES)
+    for table in tables:
+        if isinstance(table, pd.CategoricalDtype):
+            names.update(table.categories)
+            continue
+        for col, values in _name_values(table).items():
+            names.update(values)
+        for col in table.columns:
+            if isinstance(table[col].dtype, pd.CategoricalDtype):
+                names.update(table[col].cat.categories)
+    return pd.CategoricalDtype(sorted(names))
+
+
+def encode_names(dtype, *tables):
+    """将各表的名称列编码为 dtype（已编码的列重新对应到 dtype 的类别），返回新的表，不修改传入的表。"""
+    encoded = []
+    for table in tables:
+        columns = {}
+        for col in NAME_COLUMNS:
+            if col in table.columns and isinstance(table[col].dtype, pd.CategoricalDtype):
+                columns[col] = table[col].cat.set_categories(dtype.categories)
+        columns.update({col: table[col].astype(dtype) for col in _name_values(table)})
+        encoded.append(table.assign(**columns) if columns else table)
+    return encoded
+
+
+def decode_names(df):
+    """将编码后的名称列还原为字符串列（与未编码时的输出类型相同）。"""
+    columns = {col: pd.Series(np.asarray(df[col].array, dtype=object), index=df.index, name=col)
+               for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)}
+    return df.assign(**columns) if columns else df
+
+
+def _names(col):
+    """取出名称列的值：已编码的列返回 Categorical（只在编码上运算），否则返回 numpy 数组。"""
+    if isinstance(col, pd.Series):
+        return col.array if isinstance(col.dtype, pd.CategoricalDtype) else col.to_numpy()
+    return col
+
+
+def _constant_names(value, n, like):
+    """n 个相同的名称：like（列或数组）已编码时返回同一编码的 Categorical，否则返回 object 数组。"""
+    like = _names(like)
+    if isinstance(like, pd.Categorical):
+        return pd.Categorical.from_codes(np.full(n, like.categories.get_loc(value)), dtype=like.dtype)
+    return np.full(n, value, dtype=object)
+
+
+def _take_names(values, idx, fill):
+    """按行号取名称，行号为 -1 时取 fill。"""
+    if isinstance(values, pd.Categorical):
+        codes = np.where(idx >= 0, values.codes[np.maximum(idx, 0)], values.categories.get_loc(fill))
+        return pd.Categorical.from_codes(codes, dtype=values.dtype)
+    return np.where(idx >= 0, values[np.maximum(idx, 0)], fill)
+
+
+def _recode_ship(ship, dtype):
+    """把缓存的海运部分（_prepare_ship / _port_legs 结果中的表与名称数组）对应到 dtype 的类别。"""
+    def recode(value):
+        if isinstance(value, pd.DataFrame):
+            return encode_names(dtype, value)[0]
+        if isinstance(value, pd.Categorical):
+            return value.set_categories(dtype.categories)
+        return value
+    tables, legs = ship
+    return {key: recode(value) for key, value in tables.items()}, legs
+
+
+# ---------------- PART A: 计算矿山→海港组合（得“到海港价格”） ----------------
+def compute_mine_to_sea(df_caigoujia, df_qianzhi, engine="vectorized"):
+    """
+    计算各矿山到海港的组合（矿山直达海港，或经铁路港中转到海港）。
+    engine="vectorized" 使用 merge 实现；engine="reference" 使用原始逐行循环实现。
+    两种实现的输出（行顺序、列顺序、数值）完全一致，可直接用 DataFrame.equals 比对。
+    """
+    if engine == "reference":
+        return _mine_to_sea_reference(df_caigoujia, df_qianzhi)
+    if engine == "vectorized":
+        return _mine_to_sea_vectorized(df_caigoujia, df_qianzhi)
+    raise ValueError("未知的运算实现: " + str(engine))
+
+
+def _mine_to_sea_reference(df_caigoujia, df_qianzhi):
+    results_mine_to_sea = []
+    for _, row_mine in df_caigoujia.iterrows():
+        mine_name  = row_mine["矿山"]
+        mine_price = row_mine["采购价"]
+        # 筛选：起点为该矿山，且起点类型为“矿山”
+        df_start = df_qianzhi[(df_qianzhi["起点"] == mine_name) & (df_qianzhi["起点类型"]=="矿山")]
+        if df_start.empty:
+            continue
+        for _, r1 in df_start.iterrows():
+            end_point = r1["终点"]
+            end_type  = r1["终点类型"]
+            way1      = r1["运输方式"]
+            price1    = r1["运输价格"]
+            qiyun_price = 0
+            tielu_price = 0
+            if way1 == "汽运":
+                qiyun_price = price1
+            elif way1 == "铁路":
+                tielu_price = price1
+            # 矿山直达海港
+            if end_type == "海港":
+                to_sea_price = mine_price + qiyun_price + tielu_price
+                results_mine_to_sea.append({
+                    "采购价": mine_price,
+                    "矿山": mine_name,
+                    "运输方式1": way1,
+                    "汽运价格": qiyun_price,
+                    "铁路港": "",
+                    "运输方式2": "",
+                    "铁路价格": tielu_price,
+                    "海港": end_point,
+                    "到海港价格": to_sea_price,
+                    "平仓价": "",
+                    "是否平仓价发货": "否",
+                    "发货港": "",
+                    "发货码头": "",
+                    "卸运方式": "",
+                    "发货码头费": 0,
+                    "卸货港": "",
+                    "卸货码头": "",
+                    "卸货码头费": 0,
+                    "海运船吨数": 0,
+                    "海运费": 0,
+                    "附加终点": "",
+                    "附加费用": 0,
+                    "总费用": to_sea_price
+                })
+            # 矿山经过铁路港到海港
+            elif end_type == "铁路港":
+                df_port2sea = df_qianzhi[
+                    (df_qianzhi["起点"]==end_point) &
+                    (df_qianzhi["起点类型"]=="铁路港") &
+                    (df_qianzhi["终点类型"]=="海港")
+                ]
+                if df_port2sea.empty:
+                    continue
+                for _, r2 in df_port2sea.iterrows():
+                    way2   = r2["运输方式"]
+                    price2 = r2["运输价格"]
+                    sea2   = r2["终点"]
+                    seg_qiyun = qiyun_price
+                    seg_tielu = tielu_price
+                    if way2 == "汽运":
+                        seg_qiyun += price2
+                    elif way2 == "铁路":
+                        seg_tielu += price2
+                    to_sea_price = mine_price + seg_qiyun + seg_tielu
+                    results_mine_to_sea.append({
+                        "采购价": mine_price,
+                        "矿山": mine_name,
+                        "运输方式1": way1,
+                        "汽运价格": seg_qiyun,
+                        "铁路港": end_point,
+                        "运输方式2": way2,
+                        "铁路价格": seg_tielu,
+                        "海港": sea2,
+                        "到海港价格": to_sea_price,
+                        "平仓价": "",
+                        "是否平仓价发货": "否",
+                        "发货港": "",
+                        "发货码头": "",
+                        "卸运方式": "",
+                        "发货码头费": 0,
+                        "卸货港": "",
+                        "卸货码头": "",
+                        "卸货码头费": 0,
+                        "海运船吨数": 0,
+                        "海运费": 0,
+                        "附加终点": "",
+                        "附加费用": 0,
+                        "总费用": to_sea_price
+                    })
+    return pd.DataFrame(results_mine_to_sea)
+
+
+def _mine_to_sea_vectorized(df_caigoujia, df_qianzhi):
+    routes = _mine_to_sea_routes(df_caigoujia, df_qianzhi)
+    if routes.empty:
+        return pd.DataFrame()
+    return _mine_to_sea_frame(routes)
+
+
+def _mine_to_sea_routes(df_caigoujia, df_qianzhi):
+    """
+    PART A 的路线结构：各矿山→海港组合，以及其在采购价（_i）、前置运输（_j 为第一段，_k 为第二段，直达时为 -1）
+    中的行号，按原顺序排列。
+    """
+    # 以行号记录原始顺序，最终按（矿山行, 第一段行, 第二段行）排序，与逐行循环的输出顺序一致
+    mines = pd.DataFrame({
+        "_i": np.arange(len(df_caigoujia)),
+        "矿山": _names(df_caigoujia["矿山"]),
+        "采购价": df_caigoujia["采购价"].to_numpy(),
+    })
+    mines = mines[mines["矿山"].notna()]
+
+    legs = pd.DataFrame({
+        "_pos": np.arange(len(df_qianzhi)),
+        "起点": _names(df_qianzhi["起点"]),
+        "起点类型": _names(df_qianzhi["起点类型"]),
+        "终点": _names(df_qianzhi["终点"]),
+        "终点类型": _names(df_qianzhi["终点类型"]),
+        "运输方式": _names(df_qianzhi["运输方式"]),
+        "运输价格": df_qianzhi["运输价格"].to_numpy(),
+    })
+    legs = legs[legs["起点"].notna()]
+
+    # 第一段：矿山出发，终点为海港或铁路港
+    legs1 = legs[(legs["起点类型"]=="矿山") & legs["终点类型"].isin(["海港", "铁路港"])]
+    legs1 = legs1.drop(columns="起点类型").rename(columns={
+        "_pos": "_j", "起点": "矿山", "运输方式": "运输方式1", "运输价格": "_price1"
+    })
+    m1 = mines.merge(legs1, on="矿山", how="inner")
+    price1 = m1["_price1"].to_numpy()
+    m1["汽运价格"] = np.where((m1["运输方式1"] == "汽运").to_numpy(), price1, 0)
+    m1["铁路价格"] = np.where((m1["运输方式1"] == "铁路").to_numpy(), price1, 0)
+
+    # 矿山直达海港
+    direct = m1[m1["终点类型"]=="海港"].rename(columns={"终点": "海港"})
+    direct = direct.assign(_k=-1, 铁路港=_constant_names("", len(direct), direct["海港"]),
+                           运输方式2=_constant_names("", len(direct), direct["海港"]))
+
+    # 矿山经过铁路港到海港
+    legs2 = legs[(legs["起点类型"]=="铁路港") & (legs["终点类型"]=="海港")]
+    legs2 = legs2[["_pos", "起点", "终点", "运输方式", "运输价格"]].rename(columns={
+        "_pos": "_k", "起点": "铁路港", "终点": "海港", "运输方式": "运输方式2", "运输价格": "_price2"
+    })
+    via = m1[m1["终点类型"]=="铁路港"].drop(columns="终点类型").rename(columns={"终点": "铁路港"})
+    via = via.merge(legs2, on="铁路港", how="inner")
+    price2 = via["_price2"].to_numpy()
+    qiyun = via["汽运价格"].to_numpy()
+    tielu = via["铁路价格"].to_numpy()
+    via["汽运价格"] = np.where((via["运输方式2"] == "汽运").to_numpy(), qiyun + price2, qiyun)
+    via["铁路价格"] = np.where((via["运输方式2"] == "铁路").to_numpy(), tielu + price2, tielu)
+
+    cols = ["_i", "_j", "_k", "采购价", "矿山", "运输方式1", "汽运价格", "铁路港", "运输方式2", "铁路价格", "海港"]
+    routes = pd.concat([direct[cols], via[cols]], ignore_index=True)
+    return routes.sort_values(["_i", "_j", "_k"], kind="stable")
+
+
+def _mine_to_sea_frame(routes):
+    """由 _mine_to_sea_routes 的路线结构生成矿山→海港组合表。"""
+    # 到海港价格 = 采购价 + 汽运价格 + 铁路价格（与循环实现相同的加法顺序）
+    to_sea_price = routes["采购价"].to_numpy() + routes["汽运价格"].to_numpy() + routes["铁路价格"].to_numpy()
+    return pd.DataFrame({
+        "采购价": routes["采购价"].to_numpy(),
+        "矿山": _names(routes["矿山"]),
+        "运输方式1": _names(routes["运输方式1"]),
+        "汽运价格": routes["汽运价格"].to_numpy(),
+        "铁路港": _names(routes["铁路港"]),
+        "运输方式2": _names(routes["运输方式2"]),
+        "铁路价格": routes["铁路价格"].to_numpy(),
+        "海港": _names(routes["海港"]),
+        "到海港价格": to_sea_price,
+        "平仓价": "",
+        "是否平仓价发货": "否",
+        "发货港": "",
+        "发货码头": "",
+        "卸运方式": "",
+        "发货码头费": 0,
+        "卸货港": "",
+        "卸货码头": "",
+        "卸货码头费": 0,
+        "海运船吨数": 0,
+        "海运费": 0,
+        "附加终点": "",
+        "附加费用": 0,
+        "总费用": to_sea_price
+    })
+
+
+# ---------------- PART B: 结合港口信息、海运费与短倒费 ----------------
+# 根据运输情况：若使用铁路则只考虑火车堆场/火车直卸；否则只考虑汽运堆场/汽运直卸
+RAIL_UNLOAD_WAYS = {"火车堆场", "火车直卸"}
+ROAD_UNLOAD_WAYS = {"汽运堆场", "汽运直卸"}
+
+
+def compute_candidates(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, engine="vectorized",
+                       prune=False, pruned=None, top_k=1):
+    """
+    将矿山→海港组合与发货码头、海运费、卸货码头、短倒费逐级组合，得到全部候选记录（列为 OUTPUT_COLUMNS）。
+    engine="vectorized" 以连接（join）方式批量生成；engine="reference" 使用原始四重循环实现。
+    不剪枝时两种实现的输出（行顺序、列顺序、数值）完全一致。
+
+    prune=True（仅 vectorized）时在每一级连接之前剔除被支配的部分路径，只保留可能成为分组最优的候选：
+      - 同一【矿山, 海港, 是否使用铁路】只保留到海港价格最低的一条；
+      - 同一卸货码头只保留附加价格最低的短倒费；
+      - 同一【发货港, 铁路/汽运, 卸货码头】只保留码头费、海运费与附加费用之和最低的海运组合；
+      - 平仓记录每个海运组合只生成一条。
+    top_k > 1 时以上各项改为保留前 top_k 条。剪枝后的候选经 select_optimal(top_k=top_k) 得到的结果与不剪枝时相同。
+    传入 pruned 字典时记录各阶段剪掉的数量。
+    """
+    if engine == "reference":
+        return _candidates_reference(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao)
+    if engine == "vectorized":
+        return _candidates_vectorized(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, prune=prune, pruned=pruned,
+                                      top_k=top_k)
+    raise ValueError("未知的运算实现: " + str(engine))
+
+
+def _candidates_reference(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao):
+    final_results = []
+    # 将港口基础信息拆分为发货港部分与卸货港部分
+    df_gangkou_fahuo  = df_gangkou[df_gangkou["港口类型"]=="发货港"]
+    df_gangkou_xiehuo = df_gangkou[df_gangkou["港口类型"]=="卸货港"]
+
+    rail_unload_ways = RAIL_UNLOAD_WAYS
+    road_unload_ways = ROAD_UNLOAD_WAYS
+
+    for _, row_ms in df_mine_to_sea.iterrows():
+        mine_price   = row_ms["采购价"]
+        mine_name    = row_ms["矿山"]
+        way1         = row_ms["运输方式1"]
+        qiyun_price  = row_ms["汽运价格"]
+        rail_port    = row_ms["铁路港"]
+        way2         = row_ms["运输方式2"]
+        tielu_price  = row_ms["铁路价格"]
+        seaport      = row_ms["海港"]
+        price_to_sea = row_ms["到海港价格"]
+
+        used_rail = (way1=="铁路" or way2=="铁路")
+        # 从发货港信息中，匹配港口名称等于 seaport 的候选记录
+        df_fahuo_candidates = df_gangkou_fahuo[df_gangkou_fahuo["港口名称"]==seaport]
+        if df_fahuo_candidates.empty:
+            continue
+
+        for _, row_fahuo in df_fahuo_candidates.iterrows():
+            fahuo_matou = row_fahuo["码头名称"]
+            fahuo_tonnage = row_fahuo.get("最大吨位（万吨)", math.inf)
+            fahuo_pcj = row_fahuo.get("平仓价", 0)
+            fahuo_fee = row_fahuo.get("码头费", 0)
+            fahuo_unload_way = row_fahuo.get("卸运方式", None)
+            if pd.notna(fahuo_unload_way) and fahuo_unload_way.strip() != "":
+                if used_rail:
+                    if fahuo_unload_way not in rail_unload_ways:
+                        continue
+                else:
+                    if fahuo_unload_way not in road_unload_ways:
+                        continue
+
+            # 无论如何都将发货港信息填入输出，计算发货码头费
+            df_haiyun_candidates = df_haiyun[
+                (df_haiyun["发货港"]==seaport) &
+                ((df_haiyun["发货码头"]==fahuo_matou) | (df_haiyun["发货码头"].isna()))
+            ]
+            if df_haiyun_candidates.empty:
+                continue
+
+            for _, row_hai in df_haiyun_candidates.iterrows():
+                xiehuo_gang = row_hai["卸货港"]
+                xiehuo_matou = row_hai["卸货码头"]
+                ship_tonnage = row_hai["海运船吨数"]
+                haiyun_fee = row_hai["海运费"]
+                if pd.isna(ship_tonnage):
+                    continue
+
+                df_xiehuo_candidates = df_gangkou_xiehuo[
+                    (df_gangkou_xiehuo["港口名称"]==xiehuo_gang) &
+                    (df_gangkou_xiehuo["码头名称"]==xiehuo_matou)
+                ]
+                if df_xiehuo_candidates.empty:
+                    continue
+
+                for _, row_xh in df_xiehuo_candidates.iterrows():
+                    xiehuo_fee = row_xh.get("码头费", 0)
+                    xiehuo_tonnage = row_xh.get("最大吨位（万吨)", math.inf)
+                    if pd.isna(fahuo_tonnage) or pd.isna(xiehuo_tonnage):
+                        continue
+                    if ship_tonnage > fahuo_tonnage or ship_tonnage > xiehuo_tonnage:
+                        continue
+
+                    # -------------- 处理“短倒费.xlsx” --------------
+                    df_duan = df_duandao[df_duandao["卸货码头"]==xiehuo_matou]
+                    if df_duan.empty:
+                        add_target = ""
+                        add_price  = 0
+                        # 模式 A（非平仓）：总费用 = 到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
+                        totalA = price_to_sea + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
+                        rowA = {
+                            "采购价": mine_price,
+                            "矿山": mine_name,
+                            "运输方式1": way1,
+                            "汽运价格": qiyun_price,
+                            "铁路港": rail_port,
+                            "运输方式2": way2,
+                            "铁路价格": tielu_price,
+                            "海港": seaport,
+                            "到海港价格": price_to_sea,
+                            "平仓价": "",
+                            "是否平仓价发货": "否",
+                            "发货港": seaport,
+                            "发货码头": fahuo_matou,
+                            "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
+                            "发货码头费": fahuo_fee,
+                            "卸货港": xiehuo_gang,
+                            "卸货码头": xiehuo_matou,
+                            "卸货码头费": xiehuo_fee,
+                            "海运船吨数": ship_tonnage,
+                            "海运费": haiyun_fee,
+                            "附加终点": add_target,
+                            "附加费用": add_price,
+                            "总费用": totalA
+                        }
+                        final_results.append(rowA)
+                        if pd.notna(fahuo_pcj) and fahuo_pcj != 0:
+                            totalB = fahuo_pcj + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
+                            rowB = {
+                                "采购价": "",
+                                "矿山": "",
+                                "运输方式1": "",
+                                "汽运价格": 0,
+                                "铁路港": "",
+                                "运输方式2": "",
+                                "铁路价格": 0,
+                                "海港": "",
+                                "到海港价格": "",
+                                "平仓价": fahuo_pcj,
+                                "是否平仓价发货": "是",
+                                "发货港": seaport,
+                                "发货码头": fahuo_matou,
+                                "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
+                                "发货码头费": fahuo_fee,
+                                "卸货港": xiehuo_gang,
+                                "卸货码头": xiehuo_matou,
+                                "卸货码头费": xiehuo_fee,
+                                "海运船吨数": ship_tonnage,
+                                "海运费": haiyun_fee,
+                                "附加终点": add_target,
+                                "附加费用": add_price,
+                                "总费用": totalB
+                            }
+                            final_results.append(rowB)
+                    else:
+                        for _, drow in df_duan.iterrows():
+                            add_target = drow["附加终端"] if "附加终端" in drow else drow["附加终点"]
+                            add_price  = drow["附加价格"]
+                            totalA = price_to_sea + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
+                            rowA = {
+                                "采购价": mine_price,
+                                "矿山": mine_name,
+                                "运输方式1": way1,
+                                "汽运价格": qiyun_price,
+                                "铁路港": rail_port,
+                                "运输方式2": way2,
+                                "铁路价格": tielu_price,
+                                "海港": seaport,
+                                "到海港价格": price_to_sea,
+                                "平仓价": "",
+                                "是否平仓价发货": "否",
+                                "发货港": seaport,
+                                "发货码头": fahuo_matou,
+                                "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
+                                "发货码头费": fahuo_fee,
+                                "卸货港": xiehuo_gang,
+                                "卸货码头": xiehuo_matou,
+                                "卸货码头费": xiehuo_fee,
+                                "海运船吨数": ship_tonnage,
+                                "海运费": haiyun_fee,
+                                "附加终点": add_target,
+                                "附加费用": add_price,
+                                "总费用": totalA
+                            }
+                            final_results.append(rowA)
+                            if pd.notna(fahuo_pcj) and fahuo_pcj != 0:
+                                totalB = fahuo_pcj + fahuo_fee + xiehuo_fee + haiyun_fee + add_price
+                                rowB = {
+                                    "采购价": "",
+                                    "矿山": "",
+                                    "运输方式1": "",
+                                    "汽运价格": 0,
+                                    "铁路港": "",
+                                    "运输方式2": "",
+                                    "铁路价格": 0,
+                                    "海港": "",
+                                    "到海港价格": "",
+                                    "平仓价": fahuo_pcj,
+                                    "是否平仓价发货": "是",
+                                    "发货港": seaport,
+                                    "发货码头": fahuo_matou,
+                                    "卸运方式": fahuo_unload_way if pd.notna(fahuo_unload_way) else "",
+                                    "发货码头费": fahuo_fee,
+                                    "卸货港": xiehuo_gang,
+                                    "卸货码头": xiehuo_matou,
+                                    "卸货码头费": xiehuo_fee,
+                                    "海运船吨数": ship_tonnage,
+                                    "海运费": haiyun_fee,
+                                    "附加终点": add_target,
+                                    "附加费用": add_price,
+                                    "总费用": totalB
+                                }
+                                final_results.append(rowB)
+
+    return pd.DataFrame(final_results, columns=OUTPUT_COLUMNS)
+
+
+def _column(df, name, default):
+    """取出某列的数组；列不存在时以默认值填充（对应逐行实现中的 row.get(name, default)）。"""
+    if name in df.columns:
+        return df[name].to_numpy()
+    return np.full(len(df), default, dtype=object)
+
+
+def _key_codes(left, right):
+    """
+    将左右两侧的连接键（可为多列）编码为整数。
+    与逐行实现中的 == 比较一致：任一列为空值的键编码为 -1，不与任何键匹配。
+    """
+    n_left = len(left[0])
+    left_codes = np.zeros(n_left, dtype=np.int64)
+    right_codes = np.zeros(len(right[0]), dtype=np.int64)
+    for left_col, right_col in zip(left, right):
+        left_col, right_col = _names(left_col), _names(right_col)
+        if isinstance(left_col, pd.Categorical) and isinstance(right_col, pd.Categorical) \
+                and left_col.dtype == right_col.dtype:
+            # 同一名称表编码的两列直接使用编码（空值编码为 -1）
+            codes = np.concatenate([left_col.codes, right_col.codes]).astype(np.int64)
+        else:
+            values = np.concatenate([np.asarray(left_col, dtype=object), np.asarray(right_col, dtype=object)])
+            codes, _ = pd.factorize(values)
+        # 组合前先压缩已有的键（保留 -1），避免多列组合后整数溢出
+        previous = np.concatenate([left_codes, right_codes])
+        combined = np.where(previous < 0, -1, pd.factorize(previous)[0])
+        width = int(codes.max(initial=-1)) + 1
+        combined = np.where((combined < 0) | (codes < 0), -1, combined * width + codes)
+        left_codes, right_codes = combined[:n_left], combined[n_left:]
+    return left_codes, right_codes
+
+
+def _join_index(left_codes, right_codes, how="inner"):
+    """
+    按整数键做等值连接，返回 (左行号, 右行号)。
+    结果按左表顺序排列，同一左行内按右表原顺序排列，与嵌套循环的遍历顺序一致。
+    how="left" 时未匹配的左行保留一行，右行号为 -1。
+    """
+    order = np.argsort(right_codes, kind="stable")
+    sorted_codes = right_codes[order]
+    starts = np.searchsorted(sorted_codes, left_codes, side="left")
+    counts = np.searchsorted(sorted_codes, left_codes, side="right") - starts
+    counts[left_codes < 0] = 0
+    matched = counts > 0
+    if how == "left":
+        counts = np.where(matched, counts, 1)
+    total = int(counts.sum())
+    left_idx = np.repeat(np.arange(len(left_codes)), counts)
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    right_idx = np.full(total, -1, dtype=np.int64)
+    hit = np.repeat(matched, counts)
+    right_idx[hit] = order[(np.repeat(starts, counts) + within)[hit]]
+    return left_idx, right_idx
+
+
+def _group_codes(columns):
+    """将（多列）分组键编码为整数；与 == 比较不同，空值在这里视为一个独立的取值。"""
+    codes = np.zeros(len(columns[0]), dtype=np.int64)
+    for col in columns:
+        col = _names(col)
+        if isinstance(col, pd.Categorical):
+            col_codes, width = col.codes.astype(np.int64) + 1, len(col.categories) + 1
+        else:
+            col_codes, uniques = pd.factorize(np.asarray(col, dtype=object), use_na_sentinel=False)
+            width = len(uniques) + 1
+        codes, _ = pd.factorize(codes * width + col_codes)
+    return codes
+
+
+def _top_k_rank(codes, cost, k):
+    """
+    每组按费用从低到高选出前 k 行（空值视为无穷大，同价时原顺序在前的优先），返回各行的组内名次（从 0 开始），
+    未入选的行为 -1。采用 k 轮逐组取最小值的部分选择，每轮为线性扫描，不对全部记录排序。
+    """
+    cost = pd.to_numeric(pd.Series(cost, dtype=object), errors="coerce").to_numpy(dtype=float)
+    cost = np.where(np.isnan(cost), np.inf, cost)
+    codes = np.asarray(codes, dtype=np.int64)
+    n = len(codes)
+    rank = np.full(n, -1, dtype=np.int64)
+    if n == 0:
+        return rank
+    n_groups = int(codes.max()) + 1
+    rows = np.arange(n)
+    for r in range(k):
+        if not len(rows):
+            break
+        best = np.full(n_groups, np.inf)
+        np.minimum.at(best, codes[rows], cost[rows])
+        hit = rows[cost[rows] == best[codes[rows]]]
+        first = np.full(n_groups, n)
+        np.minimum.at(first, codes[hit], hit)
+        chosen = first[first < n]
+        rank[chosen] = r
+        rows = rows[rank[rows] < 0]
+    return rank
+
+
+def _first_k(codes, cost, k):
+    """每组保留费用最低的前 k 行，返回保留行的行号（按原顺序）。"""
+    return np.flatnonzero(_top_k_rank(codes, cost, k) >= 0)
+
+
+def _first_min(codes, cost):
+    """每组保留费用最低的第一行（空值视为无穷大），返回保留行的行号（按原顺序）。"""
+    return _first_k(codes, cost, 1)
+
+
+def _finite_cost(cost):
+    """各行费用是否为有限数值（空值、非数值与无穷大均为 False）。"""
+    cost = np.asarray(cost)
+    if cost.dtype.kind not in "biuf":
+        cost = pd.to_numeric(pd.Series(cost, dtype=object), errors="coerce").to_numpy(dtype=float)
+    return np.isfinite(cost)
+
+
+def _prune_rows(codes, cost, k):
+    """
+    剪枝用的 _first_k：每组在费用为有限数值的行中保留最低的前 k 行，费用不是有限数值的行全部保留。
+    后者组成的候选记录总费用为空值或无穷大，在 PART C 中彼此同名次、按原顺序取舍，不能由费用更低的行代替。
+    """
+    finite = _finite_cost(cost)
+    if finite.all():
+        return _first_k(codes, cost, k)
+    rows = np.flatnonzero(finite)
+    kept = rows[_first_k(np.asarray(codes)[rows], np.asarray(cost)[rows], k)]
+    return np.sort(np.concatenate([kept, np.flatnonzero(~finite)]))
+
+
+def _ship_tables(df_gangkou, df_haiyun, df_duandao):
+    """拆分港口基础信息，并预先取出 PART B 需要的各列数组（列不存在时按逐行实现中的默认值填充）。"""
+    return _with_duandao(_port_tables(df_gangkou, df_haiyun), df_duandao)
+
+
+def _port_tables(df_gangkou, df_haiyun):
+    """_ship_tables 中只依赖港口基础信息与海运费的部分。"""
+    df_fahuo  = df_gangkou[df_gangkou["港口类型"]=="发货港"]
+    df_xiehuo = df_gangkou[df_gangkou["港口类型"]=="卸货港"]
+    unload_way = pd.Series(_column(df_fahuo, "卸运方式", None), dtype=object)
+    blank = unload_way.isna() | (unload_way.astype(str).str.strip() == "")
+    # 输出用的卸运方式：空值写为 ""（已编码时保持编码）
+    if "卸运方式" in df_fahuo.columns and isinstance(df_fahuo["卸运方式"].dtype, pd.CategoricalDtype):
+        way_out = df_fahuo["卸运方式"].array.fillna("")
+    else:
+        way_out = np.where(pd.notna(unload_way), unload_way, "")
+    return {
+        "fahuo": df_fahuo,
+        "xiehuo": df_xiehuo,
+        "haiyun": df_haiyun,
+        "unload_way": way_out,
+        "rail_ok": (blank | unload_way.isin(RAIL_UNLOAD_WAYS)).to_numpy(),
+        "road_ok": (blank | unload_way.isin(ROAD_UNLOAD_WAYS)).to_numpy(),
+        "fahuo_pcj": _column(df_fahuo, "平仓价", 0),
+        "fahuo_fee": _column(df_fahuo, "码头费", 0),
+        "xiehuo_fee": _column(df_xiehuo, "码头费", 0),
+    }
+
+
+def _with_duandao(port_tables, df_duandao):
+    """在港口部分的基础上加入短倒费各列（返回新的字典，不修改 port_tables，便于缓存复用）。"""
+    if len(df_duandao):
+        target_col = "附加终端" if "附加终端" in df_duandao.columns else "附加终点"
+        add_target = _names(df_duandao[target_col])
+        if not isinstance(add_target, pd.Categorical):
+            add_target = np.asarray(add_target, dtype=object)
+        add_price = df_duandao["附加价格"].to_numpy()
+    else:
+        add_target = _constant_names("", 0, port_tables["fahuo"]["港口名称"])
+        add_price = np.empty(0, dtype=np.int64)
+    return dict(port_tables, duandao=df_duandao, add_target=add_target, add_price=add_price)
+
+
+def _ship_legs(tables):
+    """
+    生成与矿山无关的“发货码头 → 海运 → 卸货码头”组合，按（发货码头, 海运费行, 卸货码头）的原顺序排列。
+    返回各组合在发货港信息、海运费、卸货港信息中的行号。
+    """
+    df_fahuo, df_xiehuo, df_haiyun = tables["fahuo"], tables["xiehuo"], tables["haiyun"]
+    hai_ok = np.flatnonzero(pd.notna(df_haiyun["海运船吨数"].to_numpy()))
+    hai_matou = _names(df_haiyun["发货码头"])[hai_ok]
+    hai_named = hai_ok[pd.notna(hai_matou)]
+    hai_any   = hai_ok[pd.isna(hai_matou)]
+
+    # 海运费中发货码头为空的记录适用于该发货港的所有码头
+    f1, h1 = _join_index(*_key_codes(
+        [df_fahuo["港口名称"], df_fahuo["码头名称"]],
+        [_names(df_haiyun["发货港"])[hai_named], _names(df_haiyun["发货码头"])[hai_named]]))
+    f2, h2 = _join_index(*_key_codes([df_fahuo["港口名称"]], [_names(df_haiyun["发货港"])[hai_any]]))
+    f_idx = np.concatenate([f1, f2])
+    h_idx = np.concatenate([hai_named[h1], hai_any[h2]])
+    order = np.lexsort((h_idx, f_idx))
+    f_idx, h_idx = f_idx[order], h_idx[order]
+
+    pair, x_idx = _join_index(*_key_codes(
+        [_names(df_haiyun["卸货港"])[h_idx], _names(df_haiyun["卸货码头"])[h_idx]],
+        [df_xiehuo["港口名称"], df_xiehuo["码头名称"]]))
+    f_idx, h_idx = f_idx[pair], h_idx[pair]
+
+    # 吨位校验：两端码头吨位均需有效，且船舶吨数不超过两端码头的最大吨位
+    fahuo_tonnage  = pd.to_numeric(pd.Series(_column(df_fahuo, "最大吨位（万吨)", math.inf)), errors="coerce").to_numpy()[f_idx]
+    xiehuo_tonnage = pd.to_numeric(pd.Series(_column(df_xiehuo, "最大吨位（万吨)", math.inf)), errors="coerce").to_numpy()[x_idx]
+    ship_tonnage   = df_haiyun["海运船吨数"].to_numpy()[h_idx]
+    with np.errstate(invalid="ignore"):
+        feasible = (pd.notna(fahuo_tonnage) & pd.notna(xiehuo_tonnage)
+                    & (ship_tonnage <= fahuo_tonnage) & (ship_tonnage <= xiehuo_tonnage))
+    return f_idx[feasible], h_idx[feasible], x_idx[feasible]
+
+
+def _attach_duandao(tables, f_leg, h_leg, x_leg, duan_rows):
+    """
+    为海运组合连接短倒费（仅使用 duan_rows 指定的短倒费行），按（海运组合, 短倒费行）的原顺序排列。
+    返回 (发货码头, 海运费, 卸货码头, 短倒费) 行号；卸货码头没有短倒费时短倒费行号为 -1。
+    """
+    df_haiyun, df_duandao = tables["haiyun"], tables["duandao"]
+    leg, d = _join_index(*_key_codes(
+        [_names(df_haiyun["卸货码头"])[h_leg]], [_names(df_duandao["卸货码头"])[duan_rows]]), how="left")
+    d_leg = np.where(d >= 0, duan_rows[np.maximum(d, 0)], -1) if len(duan_rows) else d
+    return f_leg[leg], h_leg[leg], x_leg[leg], d_leg
+
+
+def _with_all_duandao(tables, legs):
+    """撤销 _prepare_ship 的短倒费剪枝：海运组合改为连接全部短倒费行，顺序同 _attach_duandao。"""
+    f_leg, h_leg, x_leg, d_leg = legs
+    if not len(f_leg) or not len(tables["duandao"]):
+        return legs
+    # 海运组合按（发货码头, 海运费, 卸货码头）排列，各组合的第一行即为去掉短倒费后的组合
+    first = np.concatenate([[True], (np.diff(f_leg) != 0) | (np.diff(h_leg) != 0) | (np.diff(x_leg) != 0)])
+    return _attach_duandao(tables, f_leg[first], h_leg[first], x_leg[first], np.arange(len(tables["duandao"])))
+
+
+def _interleave(values_a, values_b, pos_a, pos_b, total):
+    """
+    按给定位置合并模式 A 与模式 B 的列值；两部分均为数值时保留数值类型，
+    均为同一名称表编码的 Categorical 时只合并编码，否则为 object。
+    """
+    if isinstance(values_a, pd.Categorical) and isinstance(values_b, pd.Categorical) \
+            and values_a.dtype == values_b.dtype:
+        codes = _interleave(values_a.codes, values_b.codes, pos_a, pos_b, total)
+        return pd.Categorical.from_codes(codes, dtype=values_a.dtype)
+    values_a = np.asarray(values_a)
+    if len(pos_b) == 0:
+        return values_a
+    values_b = np.asarray(values_b)
+    if len(pos_a) == 0:
+        return values_b
+    if values_a.dtype.kind in "biuf" and values_b.dtype.kind in "biuf":
+        dtype = np.result_type(values_a, values_b)
+    else:
+        dtype = object
+    out = np.empty(total, dtype=dtype)
+    out[pos_a] = values_a
+    out[pos_b] = values_b
+    return out
+
+
+def _leg_values(tables, f_idx, h_idx, x_idx, d_idx):
+    """按行号取出发货码头、海运费、卸货码头、短倒费相关的列（模式 A 与模式 B 共用）。"""
+    df_haiyun = tables["haiyun"]
+    # 短倒费：无匹配记录时附加终点为空、附加费用为 0
+    has_duan = d_idx >= 0
+    if len(tables["add_price"]):
+        add_target = _take_names(tables["add_target"], d_idx, "")
+        add_price = np.where(has_duan, tables["add_price"][np.where(has_duan, d_idx, 0)], 0)
+    else:
+        add_target = _constant_names("", len(d_idx), tables["add_target"])
+        add_price = np.zeros(len(d_idx), dtype=np.int64)
+    return {
+        "发货港": _names(tables["fahuo"]["港口名称"])[f_idx],
+        "发货码头": _names(tables["fahuo"]["码头名称"])[f_idx],
+        "卸运方式": tables["unload_way"][f_idx],
+        "发货码头费": tables["fahuo_fee"][f_idx],
+        "卸货港": _names(df_haiyun["卸货港"])[h_idx],
+        "卸货码头": _names(df_haiyun["卸货码头"])[h_idx],
+        "卸货码头费": tables["xiehuo_fee"][x_idx],
+        "海运船吨数": df_haiyun["海运船吨数"].to_numpy()[h_idx],
+        "海运费": df_haiyun["海运费"].to_numpy()[h_idx],
+        "附加终点": add_target,
+        "附加费用": add_price,
+        "平仓价": tables["fahuo_pcj"][f_idx],
+    }
+
+
+def _candidate_frame(df_mine_to_sea, tables, m_idx, legs_a, legs_b, pos_a, pos_b):
+    """
+    生成候选记录表：模式 A 记录由矿山→海港行号 m_idx 与海运组合 legs_a 组成，模式 B（平仓）记录由 legs_b 组成，
+    两者分别放在 pos_a、pos_b 指定的位置上。
+    """
+    n_a, n_b = len(m_idx), len(legs_b[0])
+    total = n_a + n_b
+    if total == 0:
+        return pd.DataFrame([], columns=OUTPUT_COLUMNS)
+    leg_a = _leg_values(tables, *legs_a)
+    leg_b = _leg_values(tables, *legs_b)
+
+    def ms(name):
+        return _names(df_mine_to_sea[name])[m_idx]
+
+    price_to_sea = ms("到海港价格")
+    # 模式 A（非平仓）：总费用 = 到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
+    total_a = price_to_sea + leg_a["发货码头费"] + leg_a["卸货码头费"] + leg_a["海运费"] + leg_a["附加费用"]
+    # 模式 B（平仓）：总费用 = 平仓价 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
+    total_b = leg_b["平仓价"] + leg_b["发货码头费"] + leg_b["卸货码头费"] + leg_b["海运费"] + leg_b["附加费用"]
+    part_a = {
+        "采购价": ms("采购价"), "矿山": ms("矿山"), "运输方式1": ms("运输方式1"), "汽运价格": ms("汽运价格"),
+        "铁路港": ms("铁路港"), "运输方式2": ms("运输方式2"), "铁路价格": ms("铁路价格"), "海港": ms("海港"),
+        "到海港价格": price_to_sea, "平仓价": "", "是否平仓价发货": "否",
+        "总费用": total_a,
+    }
+    part_b = {
+        "采购价": "", "矿山": "", "运输方式1": "", "汽运价格": 0, "铁路港": "", "运输方式2": "", "铁路价格": 0,
+        "海港": "", "到海港价格": "", "平仓价": leg_b["平仓价"], "是否平仓价发货": "是",
+        "总费用": total_b,
+    }
+    # 名称已编码时，名称列中的固定取值（如模式 B 的空矿山、“是否平仓价发货”）也写为编码
+    names = _names(tables["fahuo"]["港口名称"])
+    columns = {}
+    for name in OUTPUT_COLUMNS:
+        values_a = part_a[name] if name in part_a else leg_a[name]
+        values_b = part_b[name] if name in part_b else leg_b[name]
+        named = isinstance(names, pd.Categorical) and all(
+            isinstance(values, (str, pd.Categorical)) for values in (values_a, values_b))
+        if np.ndim(values_a) == 0:
+            values_a = _constant_names(values_a, n_a, names) if named else \
+                np.full(n_a, values_a, dtype=object if isinstance(values_a, str) else None)
+        if np.ndim(values_b) == 0:
+            values_b = _constant_names(values_b, n_b, names) if named else \
+                np.full(n_b, values_b, dtype=object if isinstance(values_b, str) else None)
+        columns[name] = _interleave(values_a, values_b, pos_a, pos_b, total)
+    return pd.DataFrame(columns, columns=OUTPUT_COLUMNS)
+
+
+def _port_legs(df_gangkou, df_haiyun):
+    """只依赖港口基础信息与海运费的阶段：港口各列数组，以及满足吨位要求的（发货码头, 海运费, 卸货码头）组合。"""
+    port_tables = _port_tables(df_gangkou, df_haiyun)
+    return port_tables, _ship_legs(port_tables)
+
+
+def _prepare_ship(df_gangkou, df_haiyun, df_duandao, prune=False, pruned=None, top_k=1, port=None):
+    """
+    准备与矿山无关的海运部分：港口信息各列数组，以及（发货码头, 海运费, 卸货码头, 短倒费）组合的行号。
+    port 为已算好的 _port_legs 结果（此时不再使用 df_gangkou、df_haiyun）。
+    """
+    port_tables, (f_leg, h_leg, x_leg) = port if port is not None else _port_legs(df_gangkou, df_haiyun)
+    tables = _with_duandao(port_tables, df_duandao)
+
+    # 短倒费剪枝：同一卸货码头只有附加价格最低的 top_k 条可能进入各组前 top_k
+    duan_rows = np.arange(len(df_duandao))
+    if prune and len(df_duandao):
+        duan_rows = _prune_rows(_group_codes([df_duandao["卸货码头"]]), tables["add_price"], top_k)
+    if pruned is not None:
+        pruned["短倒费"] = len(df_duandao) - len(duan_rows)
+    legs = _attach_duandao(tables, f_leg, h_leg, x_leg, duan_rows)
+    if len(duan_rows) < len(df_duandao):
+        # 码头费、海运费或平仓价不是有限数值的海运组合，连接任何短倒费行的总费用都不是有限数值，
+        # 同价时按短倒费行的原顺序取舍，因此连接全部短倒费行；合并后仍按（海运组合, 短倒费行）的原顺序排列
+        pcj = tables["fahuo_pcj"][f_leg]
+        has_b = np.asarray(pd.notna(pcj) & (pcj != 0), dtype=bool)
+        open_leg = ~(_finite_cost(tables["fahuo_fee"][f_leg]) & _finite_cost(tables["xiehuo_fee"][x_leg])
+                     & _finite_cost(tables["haiyun"]["海运费"].to_numpy()[h_leg]) & (~has_b | _finite_cost(pcj)))
+        if open_leg.any():
+            closed = _attach_duandao(tables, f_leg[~open_leg], h_leg[~open_leg], x_leg[~open_leg], duan_rows)
+            opened = _attach_duandao(tables, f_leg[open_leg], h_leg[open_leg], x_leg[open_leg],
+                                     np.arange(len(df_duandao)))
+            legs = tuple(np.concatenate(pair) for pair in zip(closed, opened))
+            order = np.lexsort(legs[::-1])
+            legs = tuple(idx[order] for idx in legs)
+    return tables, legs
+
+
+def _candidates_vectorized(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, prune=False, pruned=None, ship=None,
+                          top_k=1):
+    if df_mine_to_sea.empty:
+        return pd.DataFrame([], columns=OUTPUT_COLUMNS)
+    if ship is None:
+        ship = _prepare_ship(df_gangkou, df_haiyun, df_duandao, prune=prune, pruned=pruned, top_k=top_k)
+    tables, legs = ship
+    if not prune:
+        return _candidate_frame(df_mine_to_sea, tables, *_candidate_index(df_mine_to_sea, tables, legs))
+    price_to_sea = df_mine_to_sea["到海港价格"].to_numpy()
+    if not _finite_cost(price_to_sea).all():
+        # 到海港价格不是有限数值的行与任何短倒费行组合的总费用都不是有限数值，不能使用剪枝后的短倒费；
+        # 其余行中被剪掉的短倒费组合仍会在下面的海运组合剪枝中去掉
+        legs = _with_all_duandao(tables, legs)
+    f_leg, h_leg, x_leg, d_leg = legs
+
+    seaport_leg = _names(tables["fahuo"]["港口名称"])[f_leg]
+    rail_leg = tables["rail_ok"][f_leg]
+    road_leg = tables["road_ok"][f_leg]
+    pcj_leg = tables["fahuo_pcj"][f_leg]
+    has_b = np.asarray(pd.notna(pcj_leg) & (pcj_leg != 0), dtype=bool)
+    used_rail = ((df_mine_to_sea["运输方式1"]=="铁路") | (df_mine_to_sea["运输方式2"]=="铁路")).to_numpy()
+    seaport_ms = _names(df_mine_to_sea["海港"])
+
+    # 矿山→海港剪枝：同一【矿山, 海港, 是否使用铁路】下只有到海港价格最低的 top_k 条可能进入各组前 top_k
+    # （剪枝只比较有限数值的费用，见 _prune_rows）
+    m_rows = _prune_rows(_group_codes([df_mine_to_sea["矿山"], seaport_ms, used_rail]), price_to_sea, top_k)
+    if pruned is not None:
+        pruned["矿山→海港"] = len(df_mine_to_sea) - len(m_rows)
+
+    # 海运组合剪枝：按铁路/汽运两类分别展开，同一【发货港, 类别, 卸货码头】下只有（码头费 + 海运费 + 附加费用）最低的 top_k 条可能胜出
+    values = _leg_values(tables, f_leg, h_leg, x_leg, d_leg)
+    leg_cost = values["发货码头费"] + values["卸货码头费"] + values["海运费"] + values["附加费用"]
+    class_legs, class_flags, usable_legs, usable_flags = [], [], [], []
+    for flag, usable in ((True, rail_leg), (False, road_leg)):
+        rows = np.flatnonzero(usable)
+        kept = rows[_prune_rows(_group_codes([seaport_leg[rows], values["卸货码头"][rows]]), leg_cost[rows], top_k)]
+        class_legs.append(kept)
+        class_flags.append(np.full(len(kept), flag))
+        usable_legs.append(rows)
+        usable_flags.append(np.full(len(rows), flag))
+    class_legs = np.concatenate(class_legs)
+    class_flags = np.concatenate(class_flags)
+    usable_legs = np.concatenate(usable_legs)
+    usable_flags = np.concatenate(usable_flags)
+    if pruned is not None:
+        pruned["海运组合"] = len(usable_legs) - len(class_legs)
+
+    # 非平仓：矿山→海港组合按【海港, 是否使用铁路】连接同类别的海运组合
+    def pair(ms_rows, leg_rows, flags):
+        m_idx, j = _join_index(*_key_codes([seaport_ms[ms_rows], used_rail[ms_rows]], [seaport_leg[leg_rows], flags]))
+        return ms_rows[m_idx], leg_rows[j]
+
+    m_idx, leg = pair(m_rows, class_legs, class_flags)
+    # 费用不是有限数值的矿山→海港行与海运组合，组成的候选记录总费用都不是有限数值，同价时按原顺序取舍：
+    # 这些行与所有可连接的行（包括被剪掉的）组合，合并后按（矿山→海港行, 海运组合）的原顺序排列
+    open_ms = np.flatnonzero(~_finite_cost(price_to_sea))
+    open_leg = ~_finite_cost(leg_cost[usable_legs])
+    if len(open_ms) or open_leg.any():
+        extra = [pair(open_ms, usable_legs, usable_flags),
+                 pair(np.arange(len(df_mine_to_sea)), usable_legs[open_leg], usable_flags[open_leg])]
+        codes = np.unique(np.concatenate([m_idx * len(f_leg) + leg] + [m * len(f_leg) + l for m, l in extra]))
+        m_idx, leg = codes // len(f_leg), codes % len(f_leg)
+
+    # 平仓：每个海运组合只生成一条记录（不再随每个矿山重复），
+    # 按其在完整展开中首次出现的位置（首个可用该码头的矿山→海港行）排序，保证同价时的取舍不变
+    first_ms = _first_min(_group_codes([seaport_ms, used_rail]), np.zeros(len(seaport_ms)))
+    first_pos = np.full(len(f_leg), np.inf)
+    n_dup = np.zeros(len(f_leg), dtype=np.int64)
+    for flag, usable in ((True, rail_leg), (False, road_leg)):
+        li, ri = _join_index(*_key_codes(
+            [seaport_leg, np.full(len(f_leg), flag)], [seaport_ms[first_ms], used_rail[first_ms]]), how="left")
+        pos = np.where(ri >= 0, first_ms[np.maximum(ri, 0)], np.inf) if len(first_ms) else np.full(len(f_leg), np.inf)
+        first_pos = np.where(usable, np.minimum(first_pos, pos), first_pos)
+        counts = np.bincount(_join_index(*_key_codes(
+            [seaport_leg, np.full(len(f_leg), flag)], [seaport_ms[m_rows], used_rail[m_rows]]))[0], minlength=len(f_leg))
+        n_dup += np.where(usable, counts, 0)
+    ping = np.flatnonzero(has_b & np.isfinite(first_pos))
+    ping = ping[np.lexsort((ping, first_pos[ping]))]
+    if pruned is not None:
+        pruned["平仓"] = int(np.maximum(n_dup[ping] - 1, 0).sum())
+
+    legs_a = (f_leg[leg], h_leg[leg], x_leg[leg], d_leg[leg])
+    legs_b = (f_leg[ping], h_leg[ping], x_leg[ping], d_leg[ping])
+    pos_a = np.arange(len(leg))
+    pos_b = len(leg) + np.arange(len(ping))
+    return _candidate_frame(df_mine_to_sea, tables, m_idx, legs_a, legs_b, pos_a, pos_b)
+
+
+def _candidate_index(df_mine_to_sea, tables, legs):
+    """
+    不剪枝时的全部候选记录结构，返回 _candidate_frame 所需的 (m_idx, legs_a, legs_b, pos_a, pos_b)。
+    只包含行号，不取出任何价格，因此可在不同价格下重复使用（见 scenario.py）。
+    """
+    f_leg, h_leg, x_leg, d_leg = legs
+    seaport_leg = _names(tables["fahuo"]["港口名称"])[f_leg]
+    pcj_leg = tables["fahuo_pcj"][f_leg]
+    has_b = np.asarray(pd.notna(pcj_leg) & (pcj_leg != 0), dtype=bool)
+    used_rail = ((df_mine_to_sea["运输方式1"]=="铁路") | (df_mine_to_sea["运输方式2"]=="铁路")).to_numpy()
+
+    # 矿山→海港组合与海运组合按海港连接，并按是否使用铁路筛选发货码头的卸运方式
+    m_idx, leg = _join_index(*_key_codes([df_mine_to_sea["海港"]], [seaport_leg]))
+    keep = np.where(used_rail[m_idx], tables["rail_ok"][f_leg][leg], tables["road_ok"][f_leg][leg])
+    m_idx, leg = m_idx[keep], leg[keep]
+    # 平仓价非空且非 0 时，紧随模式 A 记录之后追加一条模式 B 记录
+    b = np.flatnonzero(has_b[leg])
+    pos_a = np.arange(len(leg)) + np.concatenate([[0], np.cumsum(has_b[leg])[:-1]]).astype(np.int64)
+    pos_b = pos_a[b] + 1
+    legs_a = (f_leg[leg], h_leg[leg], x_leg[leg], d_leg[leg])
+    legs_b = tuple(idx[b] for idx in legs_a)
+    return m_idx, legs_a, legs_b, pos_a, pos_b
+
+
+# ---------------- PART C：分组仅保留最优记录 ----------------
+# 非平仓记录以【矿山, 卸货码头】为分组依据；平仓记录以【发货港, 卸货码头】为分组依据
+NON_PING_KEYS = ["矿山", "卸货码头"]
+PING_KEYS = ["发货港", "卸货码头"]
+# top_k > 1 时追加的组内名次列（1 为最优）
+RANK_COLUMN = "组内排名"
+
+
+def _group_best(df, keys, top_k=1):
+    """
+    每组保留总费用最低的 top_k 整行（不同行的字段不会混在一起），按分组键及组内名次排列。
+    同价时保留候选记录中靠前的一条，因此剪枝与否不影响取舍；分组键为空值的记录不参与输出。
+    top_k > 1 时完全相同的平仓记录（同一海运组合随不同矿山重复生成）只保留一条，并追加 RANK_COLUMN 列。
+    """
+    df = df.dropna(subset=keys)
+    if top_k > 1 and keys == PING_KEYS:
+        df = df.drop_duplicates(subset=OUTPUT_COLUMNS, keep="first")
+    rank = _top_k_rank(_group_codes([df[key] for key in keys]), df["总费用"].to_numpy(), top_k) if len(df) else \
+        np.zeros(0, dtype=np.int64)
+    best = df[rank >= 0]
+    if top_k == 1:
+        return best.sort_values(keys, kind="stable")
+    best = best.assign(**{RANK_COLUMN: rank[rank >= 0] + 1})
+    return best.sort_values(keys + [RANK_COLUMN], kind="stable")
+
+
+def _check_top_k(top_k):
+    if isinstance(top_k, bool) or not isinstance(top_k, (int, np.integer)) or top_k < 1:
+        raise ValueError("top_k 必须为正整数: " + str(top_k))
+
+
+def select_optimal(df_final, top_k=1):
+    """PART C：按分组仅保留总费用最低的 top_k 条记录（默认 1 条），并按总费用排序输出。"""
+    _check_top_k(top_k)
+    df_non = df_final[df_final["是否平仓价发货"]=="否"]
+    df_ping = df_final[df_final["是否平仓价发货"]=="是"]
+    return _assemble_optimal([
+        _group_best(df_non, NON_PING_KEYS, top_k) if not df_non.empty else None,
+        _group_best(df_ping, PING_KEYS, top_k) if not df_ping.empty else None,
+    ], top_k)
+
+
+def _assemble_optimal(parts, top_k=1):
+    """合并非平仓与平仓的分组最优记录，按总费用排序输出。"""
+    columns = OUTPUT_COLUMNS + ([RANK_COLUMN] if top_k > 1 else [])
+    parts = [part for part in parts if part is not None and not part.empty]
+    if not parts:
+        return pd.DataFrame(columns=columns)
+    df_opt = pd.concat(parts, ignore_index=True)
+    df_opt = df_opt.sort_values("总费用", kind="stable")
+    # 重新按照 OUTPUT_COLUMNS 顺序排序，确保“卸货码头”位于“卸货港”之后
+    return df_opt[columns]
+
+
+# ---------------- 分块流式计算 ----------------
+def _mine_chunks(df_mine_to_sea, chunk_size):
+    """按矿山切分矿山→海港组合（同一矿山的连续记录不拆开），每块最多包含 chunk_size 个矿山，保持原顺序。"""
+    if df_mine_to_sea.empty:
+        return
+    names = _names(df_mine_to_sea["矿山"])
+    names = names.codes if isinstance(names, pd.Categorical) else names
+    block = np.concatenate([[0], np.cumsum(names[1:] != names[:-1])])
+    bounds = np.searchsorted(block, np.arange(0, block[-1] + 1, chunk_size))
+    for start, stop in zip(bounds, np.append(bounds[1:], len(names))):
+        yield df_mine_to_sea.iloc[start:stop]
+
+
+def _fold_best(running, df_part, keys, top_k=1):
+    """将本块候选的分组前 top_k 并入累计表；同价时保留先出现的记录（即累计表中的记录）。"""
+    if df_part.empty:
+        return running
+    best = _group_best(df_part, keys, top_k)
+    if running is None:
+        return best
+    return _group_best(pd.concat([running, best], ignore_index=True), keys, top_k)
+
+
+def stream_optimal(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, chunk_size, prune=True, pruned=None,
+                   top_k=1, progress=None, ship=None):
+    """
+    分块流式计算 PART B + PART C：每次只为 chunk_size 个矿山生成候选，随即按【矿山, 卸货码头】和
+    【发货港, 卸货码头】并入累计最优表后丢弃。峰值内存取决于分组数量与单块大小，而不是全部候选的数量。
+    各块按原顺序处理，同价取舍与一次性计算相同，因此结果与 select_optimal(compute_candidates(...)) 一致。
+    progress 见 process_files：PART B 与 PART C 交替进行，合为一个阶段 "PART B–C（分块）"，
+    每处理完一块报告一次累计的候选记录数，完成时报告最优记录数。ship 为已准备好的 _prepare_ship 结果。
+    """
+    if not isinstance(chunk_size, (int, np.integer)) or chunk_size < 1:
+        raise ValueError("chunk_size 必须为正整数: " + str(chunk_size))
+    _check_top_k(top_k)
+    _report(progress, "PART B–C（分块）", "running", 0)
+    if ship is None:
+        ship = _prepare_ship(df_gangkou, df_haiyun, df_duandao, prune=prune, pruned=pruned, top_k=top_k)
+    best_non, best_ping = None, None
+    n_candidates = 0
+    for df_chunk in _mine_chunks(df_mine_to_sea, chunk_size):
+        chunk_pruned = {}
+        df_final = _candidates_vectorized(df_chunk, df_gangkou, df_haiyun, df_duandao,
+                                          prune=prune, pruned=chunk_pruned, ship=ship, top_k=top_k)
+        if pruned is not None:
+            for stage, count in chunk_pruned.items():
+                pruned[stage] = pruned.get(stage, 0) + count
+        n_candidates += len(df_final)
+        _report(progress, "PART B–C（分块）", "running", n_candidates)
+        best_non = _fold_best(best_non, df_final[df_final["是否平仓价发货"]=="否"], NON_PING_KEYS, top_k)
+        best_ping = _fold_best(best_ping, df_final[df_final["是否平仓价发货"]=="是"], PING_KEYS, top_k)
+    df_opt = _assemble_optimal([best_non, best_ping], top_k)
+    _report(progress, "PART B–C（分块）", "done", len(df_opt))
+    return df_opt
+
+
+# ---------------- 多进程并行计算 ----------------
+# 子进程在启动时通过 initializer 收到一次只读的查询表（前置运输、海运组合），之后每个任务只传入自己的那块数据
+_WORKER_STATE = {}
+
+
+def _init_worker(df_qianzhi, ship, prune, top_k):
+    _WORKER_STATE.update(df_qianzhi=df_qianzhi, ship=ship, prune=prune, top_k=top_k)
+
+
+def _parallel_task(df_block, with_part_a):
+    """
+    子进程任务：（with_part_a 时先由采购价块计算矿山→海港组合）生成该块的候选记录，并只返回各组的前 top_k。
+    返回 (矿山→海港记录数, 候选记录数, 剪枝数量, 非平仓分组最优, 平仓分组最优)。
+    """
+    state = _WORKER_STATE
+    df_mine_to_sea = compute_mine_to_sea(df_block, state["df_qianzhi"]) if with_part_a else df_block
+    if df_mine_to_sea.empty:
+        return 0, 0, {}, None, None
+    task_pruned = {}
+    df_final = _candidates_vectorized(df_mine_to_sea, None, None, None, prune=state["prune"], pruned=task_pruned,
+                                      ship=state["ship"], top_k=state["top_k"])
+    best_non = _fold_best(None, df_final[df_final["是否平仓价发货"]=="否"], NON_PING_KEYS, state["top_k"])
+    best_ping = _fold_best(None, df_final[df_final["是否平仓价发货"]=="是"], PING_KEYS, state["top_k"])
+    return len(df_mine_to_sea), len(df_final), task_pruned, best_non, best_ping
+
+
+def _pool_context():
+    # 避免在已有线程（如 Web 后台任务）的进程中 fork；Windows 上只有 spawn
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def parallel_optimal(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao, workers, chunk_size=None,
+                     prune=True, pruned=None, top_k=1, progress=None, ship=None, df_mine_to_sea=None):
+    """
+    多进程计算 PART A + PART B + PART C：按矿山把采购价切成连续的块（同一矿山的连续记录不拆开），
+    由 workers 个子进程分别计算矿山→海港组合与候选记录，各块只返回分组前 top_k，最后按块的原顺序合并。
+    同价取舍与单进程计算相同，因此结果与 select_optimal(compute_candidates(...)) 一致。
+    chunk_size 为每块的矿山数，默认把矿山大致均分为 workers 的 4 倍块数以平衡负载。
+    传入 df_mine_to_sea（已算好的 PART A）时改为切分矿山→海港组合，子进程只计算 PART B。
+    ship 为已准备好的 _prepare_ship 结果。progress 见 process_files：各阶段在子进程中交替进行，
+    合为一个阶段 "PART A–C（并行）"（传入 df_mine_to_sea 时为 "PART B–C（并行）"），
+    每完成一块报告一次累计的候选记录数，完成时报告最优记录数。
+    """
+    if isinstance(workers, bool) or not isinstance(workers, (int, np.integer)) or workers < 1:
+        raise ValueError("workers 必须为正整数: " + str(workers))
+    if chunk_size is not None and (not isinstance(chunk_size, (int, np.integer)) or chunk_size < 1):
+        raise ValueError("chunk_size 必须为正整数: " + str(chunk_size))
+    _check_top_k(top_k)
+    with_part_a = df_mine_to_sea is None
+    stage_name = "PART A–C（并行）" if with_part_a else "PART B–C（并行）"
+    _report(progress, stage_name, "running", 0)
+    if ship is None:
+        ship = _prepare_ship(df_gangkou, df_haiyun, df_duandao, prune=prune, pruned=pruned, top_k=top_k)
+    df_split = df_caigoujia if with_part_a else df_mine_to_sea
+    if chunk_size is None and not df_split.empty:
+        names = _names(df_split["矿山"])
+        names = names.codes if isinstance(names, pd.Categorical) else names
+        n_mines = 1 + int(np.count_nonzero(names[1:] != names[:-1]))
+        chunk_size = max(1, math.ceil(n_mines / (workers * 4)))
+    blocks = list(_mine_chunks(df_split, chunk_size))
+
+    best_non, best_ping = [], []
+    n_mine_to_sea = n_candidates = 0
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context(), initializer=_init_worker,
+                             initargs=(df_qianzhi if with_part_a else None, ship, prune, top_k)) as pool:
+        # map 按提交顺序返回结果，合并时各块的先后与单进程一致
+        for n_rows, n_final, task_pruned, part_non, part_ping in pool.map(
+                _parallel_task, blocks, [with_part_a] * len(blocks)):
+            n_mine_to_sea += n_rows
+            n_candidates += n_final
+            if pruned is not None:
+                for stage, count in task_pruned.items():
+                    pruned[stage] = pruned.get(stage, 0) + count
+            best_non.append(part_non)
+            best_ping.append(part_ping)
+            _report(progress, stage_name, "running", n_candidates)
+    df_opt = _assemble_optimal([_merge_best(best_non, NON_PING_KEYS, top_k),
+                                _merge_best(best_ping, PING_KEYS, top_k)], top_k)
+    _report(progress, stage_name, "done", len(df_opt))
+    return df_opt
+
+
+def _merge_best(parts, keys, top_k=1):
+    """按块的原顺序合并各块的分组前 top_k，与依次 _fold_best 的结果相同。"""
+    parts = [part for part in parts if part is not None and not part.empty]
+    if not parts:
+        return None
+    return _group_best(pd.concat(parts, ignore_index=True), keys, top_k)
+
+
+# ==================== 业务逻辑函数 ====================
+def _report(progress, stage, status, rows=None):
+    if progress is not None:
+        progress(stage, status, rows)
+
+
+def process_files(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao,
+                  engine="vectorized", prune=True, stats=None, max_hops=2, chunk_size=None, top_k=1,
+                  progress=None, stage_cache=None, workers=None, database=None):
+    """
+    业务逻辑说明：
+    1. 从“路径规划-采购价.xlsx”和“路径规划-前置运输.xlsx”中计算出各矿山到海港的“到海港价格”
+       （支持矿山直达海港以及经铁路港中转）。
+    2. 再结合“路径规划-港口基础信息.xlsx”、“路径规划-海运费.xlsx”和“路径规划-短倒费.xlsx”，计算
+       各发货港/发货码头到卸货港/卸货码头组合的费用：
+         - 非平仓模式：总费用 = 到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
+         - 平仓模式：总费用 = 平仓价 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用
+       注意：无论矿山直达还是中转，发货相关费用均根据匹配到的候选发货港记录填入（即“发货港”、“发货码头”、“卸运方式”等）。
+    3. 输出时：
+         - 对非平仓记录（“是否平仓价发货”为“否”），以【矿山, 卸货码头】为分组，仅保留总费用最低的一条；
+         - 对平仓记录（“是否平仓价发货”为“是”），以【发货港, 卸货码头】为分组，仅保留总费用最低的一条。
+    五个文件参数可以是 Excel 文件路径或快照标识（见 snapshot.py），传入快照标识时不再解析 Excel。
+    engine 取值见 ENGINES：默认 "vectorized"；"reference" 保留原始逐行循环实现，用于核对结果。
+    prune=True 时在各阶段之间剔除不可能胜出的部分路径（仅 vectorized 实现），不改变最终结果；
+    传入 stats 字典时，stats["pruned"] 记录各阶段剪掉的候选数量。
+    max_hops 为前置运输的最大段数（仅 graph 实现可调整，其他实现固定为 2）。
+    chunk_size 不为 None 时（仅 vectorized 实现）按每块 chunk_size 个矿山流式计算，内存占用只与分组数量相关，结果不变。
+    top_k 为每组保留的记录条数（按总费用从低到高），用于给出备选路线；大于 1 时输出追加“组内排名”列，
+    top_k=1 时与只保留最优记录的输出完全一致。graph 实现只支持 top_k=1。
+    progress 为可选的进度回调 progress(阶段, 状态, 行数)：阶段依次为 "读取输入"、"PART A"、"PART B"、"PART C"
+    （graph 实现为 "读取输入"、"图求解"），状态为 "running" 或 "done"，行数为该阶段已产生的记录数（未知时为 None）。
+    分块或并行计算时各阶段交替进行、无法分别计时，合为一个阶段报告：chunk_size 时 PART B、PART C 为
+    "PART B–C（分块）"，workers 时 PART A 至 PART C 为 "PART A–C（并行）"。
+    使用 stage_cache 时海运组合单独报告为 "海运组合"，并行时只并行 PART B、PART C（"PART B–C（并行）"），
+    最优结果命中缓存时只报告 "最优结果"。
+    stage_cache 为 result_cache.StageCache（仅 vectorized 实现），按各阶段实际依赖的输入文件内容哈希缓存中间结果：
+      - PART A（矿山→海港组合）依赖采购价、前置运输；
+      - 海运组合（发货码头→海运→卸货码头）依赖港口基础信息、海运费；
+      - 加入短倒费并分组取优依赖以上两者与短倒费。
+    只更换其中一个文件时，只重新计算其下游的阶段，未用到的输入文件也不会被读取。
+    workers 大于 1 时（仅 vectorized 实现）按矿山分块交给 workers 个子进程并行计算 PART A、PART B 与各块的分组最优，
+    结果与单进程完全一致；此时 chunk_size 为每个任务的矿山数（见 parallel_optimal）。与 stage_cache 同时使用时
+    PART A 仍按缓存计算，只并行 PART B。
+    vectorized 实现在计算前把各表的名称列（矿山、港口、码头等）编码为同一份排好序的 Categorical 名称表，
+    连接与分组都只比较整数编码；返回前解码，输出与未编码时完全相同。
+    engine="sql" 时候选记录的连接、剪枝与分组取优都在 SQLite 中完成，中间结果可写入磁盘，输出与 vectorized 实现相同；
+    database 为所用的数据库文件路径（仅 sql 实现，默认使用计算后即删除的临时文件）。
+    """
+    if engine not in ENGINES:
+        raise ValueError("未知的运算实现: " + str(engine))
+    if engine != "graph" and max_hops != 2:
+        raise ValueError("max_hops 仅适用于 graph 实现")
+    if engine != "vectorized" and chunk_size is not None:
+        raise ValueError("chunk_size 仅适用于 vectorized 实现")
+    if engine != "sql" and database is not None:
+        raise ValueError("database 仅适用于 sql 实现")
+    _check_top_k(top_k)
+    if engine == "graph" and top_k != 1:
+        raise ValueError("graph 实现仅支持 top_k=1")
+    if workers is not None:
+        if isinstance(workers, bool) or not isinstance(workers, (int, np.integer)) or workers < 1:
+            raise ValueError("workers 必须为正整数: " + str(workers))
+        if engine != "vectorized" and workers > 1:
+            raise ValueError("workers 仅适用于 vectorized 实现")
+        if workers == 1:
+            workers = None
+    if stage_cache is not None:
+        if engine != "vectorized":
+            raise ValueError("stage_cache 仅适用于 vectorized 实现")
+        pruned = {}
+        if stats is not None:
+            stats["pruned"] = pruned
+        return _staged_optimal((file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao),
+                               stage_cache, prune, pruned, top_k, chunk_size, progress, workers)
+    # 读取各个 Excel 文件
+    _report(progress, "读取输入", "running")
+    df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao = load_inputs(
+        file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao)
+    _report(progress, "读取输入", "done", len(df_caigoujia) + len(df_qianzhi) + len(df_gangkou)
+            + len(df_haiyun) + len(df_duandao))
+
+    if engine == "graph":
+        from route_graph import build_route_graph, solve_routes
+        _report(progress, "图求解", "running")
+        graph = build_route_graph(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao)
+        df_opt = solve_routes(graph, max_hops=max_hops)
+        _report(progress, "图求解", "done", len(df_opt))
+        return df_opt
+    if engine == "sql":
+        from route_sql import sql_optimal
+        return sql_optimal(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao, top_k=top_k,
+                           database=database, progress=progress)
+    if engine == "vectorized":
+        # 名称统一编码后再计算，返回前解码
+        inputs = (df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao)
+        df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao = encode_names(name_dtype(*inputs), *inputs)
+
+    pruned = {}
+    if stats is not None:
+        stats["pruned"] = pruned
+    if workers is not None:
+        # ---------------- PART A + PART B + PART C：各子进程按矿山分块计算，最后合并分组最优 ----------------
+        df_opt = parallel_optimal(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao, workers,
+                                  chunk_size=chunk_size, prune=prune, pruned=pruned, top_k=top_k, progress=progress)
+        return decode_names(df_opt)
+
+    # ---------------- PART A: 计算矿山→海港组合（得“到海港价格”） ----------------
+    _report(progress, "PART A", "running")
+    df_mine_to_sea = compute_mine_to_sea(df_caigoujia, df_qianzhi, engine=engine)
+    _report(progress, "PART A", "done", len(df_mine_to_sea))
+
+    if chunk_size is not None:
+        # ---------------- PART B + PART C：分块生成候选并累计分组最优 ----------------
+        df_opt = stream_optimal(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao, chunk_size,
+                                prune=prune, pruned=pruned, top_k=top_k, progress=progress)
+        return decode_names(df_opt)
+
+    # ---------------- PART B: 结合港口信息、海运费与短倒费 ----------------
+    _report(progress, "PART B", "running")
+    df_final = compute_candidates(df_mine_to_sea, df_gangkou, df_haiyun, df_duandao,
+                                  engine=engine, prune=prune, pruned=pruned, top_k=top_k)
+    _report(progress, "PART B", "done", len(df_final))
+
+    # ---------------- PART C：分组仅保留最优记录 ----------------
+    _report(progress, "PART C", "running")
+    df_opt = select_optimal(df_final, top_k=top_k)
+    _report(progress, "PART C", "done", len(df_opt))
+    return decode_names(df_opt)
+
+
+def _staged_optimal(files, stage_cache, prune, pruned, top_k, chunk_size, progress, workers=None):
+    """
+    按阶段缓存的计算流程（见 process_files 的 stage_cache 参数），结果与不使用缓存时相同。
+    各阶段按自己读到的输入编码名称后缓存，合并前再统一对应到包含全部名称的共享名称表。
+    """
+    file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao = files
+    key_a = (source_hash(file_caigoujia), source_hash(file_qianzhi))
+    key_port = (source_hash(file_gangkou), source_hash(file_haiyun))
+    key_final = (key_a, key_port, source_hash(file_duandao), prune, top_k, chunk_size)
+
+    cached = stage_cache.get("最优结果", key_final)
+    if cached is not None:
+        df_opt, cached_pruned = cached
+        pruned.update(cached_pruned)
+        _report(progress, "最优结果", "done", len(df_opt))
+        return df_opt
+
+    # 只读取未命中缓存的阶段所需的输入
+    df_mine_to_sea = stage_cache.get("PART A", key_a)
+    port = stage_cache.get("海运组合", key_port)
+    _report(progress, "读取输入", "running")
+    inputs_a = (read_table(file_caigoujia), read_table(file_qianzhi)) if df_mine_to_sea is None else ()
+    inputs_port = (_read_gangkou(file_gangkou), _read_haiyun(file_haiyun)) if port is None else ()
+    df_duandao = read_table(file_duandao)
+    _report(progress, "读取输入", "done", sum(len(df) for df in inputs_a + inputs_port) + len(df_duandao))
+
+    # ---------------- PART A: 计算矿山→海港组合（得“到海港价格”） ----------------
+    if df_mine_to_sea is None:
+        _report(progress, "PART A", "running")
+        df_mine_to_sea = compute_mine_to_sea(*encode_names(name_dtype(*inputs_a), *inputs_a))
+        stage_cache.put("PART A", key_a, df_mine_to_sea)
+    _report(progress, "PART A", "done", len(df_mine_to_sea))
+
+    # ---------------- 海运组合：只依赖港口基础信息与海运费，再加入短倒费 ----------------
+    _report(progress, "海运组合", "running")
+    if port is None:
+        port = _port_legs(*encode_names(name_dtype(*inputs_port), *inputs_port))
+        stage_cache.put("海运组合", key_port, port)
+    dtype = name_dtype(df_mine_to_sea, port[0]["fahuo"], port[0]["haiyun"], df_duandao)
+    df_mine_to_sea, df_duandao = encode_names(dtype, df_mine_to_sea, df_duandao)
+    port = _recode_ship(port, dtype)
+    ship = _prepare_ship(None, None, df_duandao, prune=prune, pruned=pruned, top_k=top_k, port=port)
+    _report(progress, "海运组合", "done")
+
+    if workers is not None:
+        df_opt = parallel_optimal(None, None, None, None, df_duandao, workers, chunk_size=chunk_size, prune=prune,
+                                  pruned=pruned, top_k=top_k, progress=progress, ship=ship,
+                                  df_mine_to_sea=df_mine_to_sea)
+    elif chunk_size is not None:
+        df_opt = stream_optimal(df_mine_to_sea, None, None, df_duandao, chunk_size, prune=prune, pruned=pruned,
+                                top_k=top_k, progress=progress, ship=ship)
+    else:
+        # ---------------- PART B: 结合海运组合与短倒费生成候选记录 ----------------
+        _report(progress, "PART B", "running")
+        df_final = _candidates_vectorized(df_mine_to_sea, None, None, df_duandao, prune=prune, pruned=pruned,
+                                          ship=ship, top_k=top_k)
+        _report(progress, "PART B", "done", len(df_final))
+        # ---------------- PART C：分组仅保留最优记录 ----------------
+        _report(progress, "PART C", "running")
+        df_opt = select_optimal(df_final, top_k=top_k)
+        _report(progress, "PART C", "done", len(df_opt))
+    df_opt = decode_names(df_opt)
+    stage_cache.put("最优结果", key_final, (df_opt, dict(pruned)))
+    return df_opt
@@ -0,0 +1,314 @@
+import heapq
+import math
+import numpy as np
+import pandas as pd
+
+from route_engine import (
+    _attach_duandao, _candidate_frame, _group_codes, _leg_values, _prune_rows, _ship_legs, _ship_tables,
+    select_optimal,
+)
+
+# ==================== 路径规划费用图 ====================
+# 将五张输入表编译为带类型的费用图，再用多源 Dijkstra 一次求出所有矿山到所有卸货码头的最便宜路径。
+# 前置运输的跳数（经过的前置运输段数）可配置：max_hops=2 时路线形状与 PART A 相同
+# （矿山→海港、矿山→铁路港→海港），结果与 process_files 的其他实现一致。
+
+# 节点类型
+NODE_MINE = "矿山"
+NODE_RAIL = "铁路港"
+NODE_SEA  = "海港"
+
+
+def _order_key(cost):
+    """用于比较的费用：空值视为无穷大（与排序时空值排在最后一致）。"""
+    return math.inf if pd.isna(cost) else cost
+
+
+def _open_costs(cost):
+    """逐行判断费用是否为空值或正无穷大，即 _order_key 为无穷大、比较时彼此同名次的费用。"""
+    cost = np.asarray(cost)
+    if cost.dtype.kind not in "biuf":
+        cost = pd.to_numeric(pd.Series(cost, dtype=object), errors="coerce").to_numpy(dtype=float)
+    return np.isnan(cost) | (cost == np.inf)
+
+
+def _add(cost, increments):
+    """按“到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用”的顺序逐项相加，与 PART B 的数值完全一致。"""
+    for value in increments:
+        cost = cost + value
+    return cost
+
+
+def build_route_graph(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao):
+    """
+    将输入表编译为费用图：
+      - 节点：(矿山, 名称)、(铁路港, 名称)、(海港, 名称)，以及以卸货码头名称表示的终点；
+      - 前置运输边：起点类型为矿山/铁路港、终点类型为铁路港/海港的每一行，记录运输方式与价格；
+      - 海运边：(海港, 是否使用铁路) → 卸货码头。由发货码头、海运费、卸货码头与短倒费组合而成，与矿山无关，
+        卸运方式与吨位约束在此处理，并预先按【发货港, 铁路/汽运, 卸货码头】只保留费用为有限数值中最便宜的一条，
+        费用不是有限数值的全部保留（同 route_engine._prune_rows）；
+      - 平仓边：平仓价非空且非 0 的发货码头 → 卸货码头。
+    """
+    sources = []
+    for i, (name, price) in enumerate(zip(df_caigoujia["矿山"].to_numpy(), df_caigoujia["采购价"].to_numpy())):
+        if pd.notna(name):
+            sources.append((i, name, price))
+
+    pre_edges = {}
+    rows = zip(df_qianzhi["起点"].to_numpy(), df_qianzhi["起点类型"].to_numpy(), df_qianzhi["终点"].to_numpy(),
+               df_qianzhi["终点类型"].to_numpy(), df_qianzhi["运输方式"].to_numpy(), df_qianzhi["运输价格"].to_numpy())
+    for j, (start, start_type, end, end_type, way, price) in enumerate(rows):
+        if pd.isna(start) or pd.isna(end):
+            continue
+        if start_type not in (NODE_MINE, NODE_RAIL) or end_type not in (NODE_RAIL, NODE_SEA):
+            continue
+        pre_edges.setdefault((start_type, start), []).append((j, way, price, (end_type, end)))
+    # 是否存在到海港价格为空值或无穷大的前置运输路径
+    open_paths = any(_order_key(price) == math.inf for _, _, price in sources) or any(
+        way in ("汽运", "铁路") and _order_key(price) == math.inf
+        for edges in pre_edges.values() for _, way, price, _ in edges)
+
+    tables = _ship_tables(df_gangkou, df_haiyun, df_duandao)
+    f_leg, h_leg, x_leg = _ship_legs(tables)
+    f_leg, h_leg, x_leg, d_leg = _attach_duandao(tables, f_leg, h_leg, x_leg, np.arange(len(df_duandao)))
+    values = _leg_values(tables, f_leg, h_leg, x_leg, d_leg)
+    increments = list(zip(values["发货码头费"], values["卸货码头费"], values["海运费"], values["附加费用"]))
+    leg_cost = values["发货码头费"] + values["卸货码头费"] + values["海运费"] + values["附加费用"]
+    seaport_leg = values["发货港"]
+    terminal_leg = values["卸货码头"]
+
+    # first_legs / open_legs：每个【发货港, 铁路/汽运, 卸货码头】行号最小的海运组合 / 费用为空值或无穷大的海运组合，
+    # 供 solve_routes 找出总费用为空值或无穷大的候选记录
+    leg_open = _open_costs(leg_cost)
+    sea_edges, first_legs, open_legs = {}, {}, {}
+    for flag, usable in ((True, tables["rail_ok"][f_leg]), (False, tables["road_ok"][f_leg])):
+        rows = np.flatnonzero(usable)
+        for leg in rows[_prune_rows(_group_codes([seaport_leg[rows], terminal_leg[rows]]), leg_cost[rows], 1)]:
+            sea_edges.setdefault((seaport_leg[leg], flag), []).append(leg)
+        for target, subset in ((first_legs, rows), (open_legs, rows[leg_open[rows]])):
+            if len(subset) == 0:
+                continue
+            _, first = np.unique(_group_codes([seaport_leg[subset], terminal_leg[subset]]), return_index=True)
+            for leg in subset[np.sort(first)]:
+                target.setdefault((seaport_leg[leg], flag), []).append(leg)
+
+    pcj = values["平仓价"]
+    ping_legs = np.flatnonzero(np.asarray(pd.notna(pcj) & (pcj != 0), dtype=bool))
+
+    return {
+        "caigoujia": df_caigoujia,
+        "qianzhi": df_qianzhi,
+        "tables": tables,
+        "sources": sources,
+        "pre_edges": pre_edges,
+        "sea_edges": sea_edges,
+        "first_legs": first_legs,
+        "open_legs": open_legs,
+        "open_paths": open_paths,
+        "ping_legs": ping_legs,
+        "legs": (f_leg, h_leg, x_leg, d_leg),
+        "increments": increments,
+        "seaport_leg": seaport_leg,
+        "terminal_leg": terminal_leg,
+        "pcj_leg": pcj,
+    }
+
+
+def solve_routes(graph, max_hops=2):
+    """
+    多源 Dijkstra：所有矿山同时作为起点放入同一个优先队列，一次遍历求出每个【矿山, 卸货码头】的最便宜路径；
+    再为平仓价发货求出每个【发货港, 卸货码头】的最便宜路径。返回与 process_files 相同格式的最优记录表。
+
+    状态为（矿山, 节点, 是否使用铁路, 已用跳数），前置运输段数不超过 max_hops。
+    费用相同时按路径在完整展开中的先后（采购价行、各前置运输行、海运组合的行号）取舍，与其他实现一致；
+    总费用为空值或无穷大的记录彼此同名次，取完整展开中最先出现的一条，由 _earliest_paths 另行求出。
+    """
+    if not isinstance(max_hops, (int, np.integer)) or max_hops < 1:
+        raise ValueError("max_hops 必须为不小于 1 的整数: " + str(max_hops))
+    pre_edges = graph["pre_edges"]
+    sea_edges = graph["sea_edges"]
+    increments = graph["increments"]
+    terminal_leg = graph["terminal_leg"]
+
+    # 标签：(比较用费用, 路径行号元组, 矿山, 节点, 是否使用铁路, 跳数, 采购价, 汽运累计, 铁路累计)
+    heap = [(_order_key(price), (i,), name, (NODE_MINE, name), False, 0, price, 0, 0)
+            for i, name, price in graph["sources"]]
+    heapq.heapify(heap)
+    settled = set()
+    best = {}
+    while heap:
+        _, path, mine, node, used_rail, hops, mine_price, qiyun, tielu = heapq.heappop(heap)
+        at_sea = node[0] == NODE_SEA
+        state = (mine, node, used_rail, None if at_sea else hops)
+        if state in settled:
+            continue
+        settled.add(state)
+
+        if at_sea:
+            # 海运边的终点（卸货码头）没有出边，直接松弛即可，无需再进入队列
+            to_sea_price = mine_price + qiyun + tielu
+            for leg in sea_edges.get((node[1], used_rail), ()):
+                key = (mine, terminal_leg[leg])
+                label = (_order_key(_add(to_sea_price, increments[leg])), path + (leg,))
+                if key not in best or label < best[key]:
+                    best[key] = label
+            continue
+
+        for j, way, price, next_node in pre_edges.get(node, ()):
+            # 剩余跳数不足以从铁路港到达海港时不再扩展
+            if hops + 1 > max_hops or (next_node[0] == NODE_RAIL and hops + 1 >= max_hops):
+                continue
+            seg_qiyun, seg_tielu = qiyun, tielu
+            if way == "汽运":
+                seg_qiyun = price if hops == 0 else seg_qiyun + price
+            elif way == "铁路":
+                seg_tielu = price if hops == 0 else seg_tielu + price
+            heapq.heappush(heap, (_order_key(mine_price + seg_qiyun + seg_tielu), path + (j,), mine, next_node,
+                                  used_rail or way == "铁路", hops + 1, mine_price, seg_qiyun, seg_tielu))
+
+    # 总费用为空值或无穷大的候选记录来自费用为空值或无穷大的前置运输路径（与任一海运组合），
+    # 或费用为空值或无穷大的海运组合（与任一前置运输路径）。Dijkstra 只沿每个状态最便宜的路径松弛，
+    # 这里按完整展开中的先后补上两类记录中最先出现的一条
+    if graph["open_legs"] or graph["open_paths"]:
+        for (mine, seaport, used_rail), (first, first_open) in _earliest_paths(graph, max_hops).items():
+            extra = [(first, leg) for leg in graph["open_legs"].get((seaport, used_rail), ())]
+            if first_open is not None:
+                extra += [(first_open, leg) for leg in graph["first_legs"].get((seaport, used_rail), ())]
+            for path, leg in extra:
+                key = (mine, terminal_leg[leg])
+                label = (math.inf, path + (leg,))
+                if key not in best or label < best[key]:
+                    best[key] = label
+
+    # 平仓：该海港存在可用该发货码头的矿山路径时才生成；同价时按完整展开中首次出现的位置取舍
+    first_paths = _first_paths(graph, max_hops)
+    f_leg = graph["legs"][0]
+    rail_ok, road_ok = graph["tables"]["rail_ok"], graph["tables"]["road_ok"]
+    ping_best = {}
+    for leg in graph["ping_legs"]:
+        seaport = graph["seaport_leg"][leg]
+        firsts = [first_paths[(seaport, flag)] for flag, ok in ((True, rail_ok[f_leg[leg]]), (False, road_ok[f_leg[leg]]))
+                  if ok and (seaport, flag) in first_paths]
+        if not firsts:
+            continue
+        key = (seaport, terminal_leg[leg])
+        label = (_order_key(_add(graph["pcj_leg"][leg], increments[leg])), (min(firsts), leg))
+        if key not in ping_best or label < ping_best[key]:
+            ping_best[key] = label
+
+    winners = [path for _, path in best.values()]
+    ping = np.array([path[1] for _, path in ping_best.values()], dtype=np.int64)
+    df_ms = _paths_to_mine_to_sea(graph, [path[:-1] for path in winners])
+    legs_a = np.array([path[-1] for path in winners], dtype=np.int64)
+    legs = graph["legs"]
+    df_final = _candidate_frame(
+        df_ms, graph["tables"], np.arange(len(winners)),
+        tuple(idx[legs_a] for idx in legs), tuple(idx[ping] for idx in legs),
+        np.arange(len(winners)), len(winners) + np.arange(len(ping)))
+    return select_optimal(df_final)
+
+
+def _first_paths(graph, max_hops):
+    """按跳数逐层求每个【海港, 是否使用铁路】在完整展开中最先出现的前置运输路径（路径行号元组最小者）。"""
+    layer = {}
+    for i, name, _ in graph["sources"]:
+        state = ((NODE_MINE, name), False)
+        layer[state] = min(layer.get(state, (i,)), (i,))
+    first = {}
+    for hops in range(1, max_hops + 1):
+        next_layer = {}
+        for (node, used_rail), path in layer.items():
+            for j, way, _, next_node in graph["pre_edges"].get(node, ()):
+                state = (next_node, used_rail or way == "铁路")
+                candidate = path + (j,)
+                if next_node[0] == NODE_SEA:
+                    key = (next_node[1], state[1])
+                    first[key] = min(first.get(key, candidate), candidate)
+                elif hops < max_hops:
+                    next_layer[state] = min(next_layer.get(state, candidate), candidate)
+        layer = next_layer
+    return first
+
+
+def _earliest_paths(graph, max_hops):
+    """
+    按跳数逐层求每个【矿山, 海港, 是否使用铁路】在完整展开中最先出现的前置运输路径，
+    以及其中到海港价格为空值或无穷大的最先路径（没有时为 None）。
+    到海港价格由采购价与各段汽运、铁路价格相加，其中任一项为空值或无穷大时结果也是。
+    """
+    layer = {}
+    for i, name, price in graph["sources"]:
+        state = (name, (NODE_MINE, name), False, _order_key(price) == math.inf)
+        layer[state] = min(layer.get(state, (i,)), (i,))
+    earliest = {}
+    for hops in range(1, max_hops + 1):
+        next_layer = {}
+        for (mine, node, used_rail, is_open), path in layer.items():
+            for j, way, price, next_node in graph["pre_edges"].get(node, ()):
+                rail = used_rail or way == "铁路"
+                path_open = is_open or (way in ("汽运", "铁路") and _order_key(price) == math.inf)
+                candidate = path + (j,)
+                if next_node[0] == NODE_SEA:
+                    first, first_open = earliest.get((mine, next_node[1], rail), (candidate, None))
+                    if path_open:
+                        first_open = candidate if first_open is None else min(first_open, candidate)
+                    earliest[(mine, next_node[1], rail)] = (min(first, candidate), first_open)
+                elif hops < max_hops:
+                    state = (mine, next_node, rail, path_open)
+                    next_layer[state] = min(next_layer.get(state, candidate), candidate)
+        layer = next_layer
+    return earliest
+
+
+def _paths_to_mine_to_sea(graph, paths):
+    """
+    将（采购价行, 前置运输行...）路径还原为 PART A 格式的矿山→海港记录。
+    多于两段时，“铁路港”依次列出途经的铁路港，“运输方式2”依次列出第二段起的运输方式，以“→”连接。
+    """
+    df_caigoujia, df_qianzhi = graph["caigoujia"], graph["qianzhi"]
+    mine_names = df_caigoujia["矿山"].to_numpy()
+    mine_prices = df_caigoujia["采购价"].to_numpy()
+    ends = df_qianzhi["终点"].to_numpy()
+    ways = df_qianzhi["运输方式"].to_numpy()
+    prices = df_qianzhi["运输价格"].to_numpy()
+    columns = {name: [] for name in ("采购价", "矿山", "运输方式1", "汽运价格", "铁路港", "运输方式2", "铁路价格", "海港", "到海港价格")}
+    for path in paths:
+        i, legs = path[0], path[1:]
+        qiyun, tielu = 0, 0
+        for k, j in enumerate(legs):
+            if ways[j] == "汽运":
+                qiyun = prices[j] if k == 0 else qiyun + prices[j]
+            elif ways[j] == "铁路":
+                tielu = prices[j] if k == 0 else tielu + prices[j]
+        if len(legs) == 1:
+            rail_port, way2 = "", ""
+        elif len(legs) == 2:
+            rail_port, way2 = ends[legs[0]], ways[legs[1]]
+        else:
+            rail_port = "→".join(str(ends[j]) for j in legs[:-1])
+            way2 = "→".join("" if pd.isna(ways[j]) else str(ways[j]) for j in legs[1:])
+        columns["采购价"].append(mine_prices[i])
+        columns["矿山"].append(mine_names[i])
+        columns["运输方式1"].append(ways[legs[0]])
+        columns["汽运价格"].append(qiyun)
+        columns["铁路港"].append(rail_port)
+        columns["运输方式2"].append(way2)
+        columns["铁路价格"].append(tielu)
+        columns["海港"].append(ends[legs[-1]])
+        columns["到海港价格"].append(mine_prices[i] + qiyun + tielu)
+
+    # 数值列沿用输入列的类型，与 PART A 的输出保持一致
+    price_dtype = df_qianzhi["运输价格"].dtype
+    mine_dtype = df_caigoujia["采购价"].dtype
+
+    def typed(values, *dtypes):
+        if all(isinstance(dtype, np.dtype) and dtype.kind in "biuf" for dtype in dtypes):
+            return np.asarray(values, dtype=np.result_type(*dtypes))
+        return np.asarray(values, dtype=object)
+
+    frame = {name: np.asarray(values, dtype=object) for name, values in columns.items()}
+    frame["采购价"] = typed(columns["采购价"], mine_dtype)
+    frame["汽运价格"] = typed(columns["汽运价格"], price_dtype)
+    frame["铁路价格"] = typed(columns["铁路价格"], price_dtype)
+    frame["到海港价格"] = typed(columns["到海港价格"], mine_dtype, price_dtype)
+    return pd.DataFrame(frame)
@@ -0,0 +1,112 @@
+import threading
+import time
+import numpy as np
+import pandas as pd
+from route_engine import NON_PING_KEYS, PING_KEYS, RANK_COLUMN
+
+# ==================== 最优路线索引 ====================
+# 把一次运算的结果按分组键放入内存字典，供点查询直接返回：
+#   非平仓：（矿山, 卸货码头）→ 最低到岸成本的路线；平仓：（发货港, 卸货码头）→ 最优的平仓发货路线。
+# 结果含“组内排名”列（top_k > 1）时，每个键下按名次保存全部备选路线。
+# 索引建好后不再修改；RouteIndexStore 只在新索引完整建好后整体替换引用，查询方不会看到建到一半的索引。
+
+
+class RouteIndex:
+    """只读的路线索引。lookup 的 key 为 (矿山, 卸货码头) 或 (发货港, 卸货码头)，见 build_route_index。"""
+
+    def __init__(self, mine_routes, ping_routes, result_key=None, alternatives=1, generation=0):
+        self._mine_routes = mine_routes
+        self._ping_routes = ping_routes
+        self.result_key = result_key
+        self.alternatives = alternatives
+        self.generation = generation
+        self.built_at = time.time()
+
+    def __len__(self):
+        return len(self._mine_routes) + len(self._ping_routes)
+
+    def lookup_mine(self, mine, terminal, limit=1):
+        """矿山到卸货码头的最优（及备选）非平仓路线，按总费用从低到高，最多 limit 条；没有时返回空列表。"""
+        return self._mine_routes.get((mine, terminal), [])[:limit]
+
+    def lookup_origin(self, origin, terminal, limit=1):
+        """发货港到卸货码头的最优（及备选）平仓路线，按总费用从低到高，最多 limit 条；没有时返回空列表。"""
+        return self._ping_routes.get((origin, terminal), [])[:limit]
+
+    def info(self):
+        return {"result_key": self.result_key, "mine_keys": len(self._mine_routes),
+                "origin_keys": len(self._ping_routes), "alternatives": self.alternatives, "built_at": self.built_at}
+
+    def patched(self, removed, added, result_key=None, generation=0):
+        """
+        返回替换了部分分组的新索引（本索引不变）：removed 为这些分组原有的记录，added 为重新计算后的记录
+        （见 incremental.IncrementalRoutes.apply）。只复制字典、重建受影响的键，不重新转换其余记录。
+        """
+        routes = []
+        for old, flag, keys in ((self._mine_routes, "否", NON_PING_KEYS), (self._ping_routes, "是", PING_KEYS)):
+            new = dict(old)
+            dropped = removed[removed["是否平仓价发货"]==flag].dropna(subset=keys)
+            for key in zip(*(dropped[key].astype(str).to_numpy() for key in keys)):
+                new.pop(key, None)
+            new.update(_group_routes(added[added["是否平仓价发货"]==flag].dropna(subset=keys), keys))
+            routes.append(new)
+        return RouteIndex(*routes, result_key=result_key, alternatives=self.alternatives, generation=generation)
+
+
+def _json_records(df):
+    """DataFrame 转为可直接 JSON 序列化的记录列表（numpy 数值转为 Python 数值，空值转为 None）。"""
+    values = df.astype(object).where(pd.notna(df), None)
+    return [{col: (value.item() if isinstance(value, np.generic) else value) for col, value in record.items()}
+            for record in values.to_dict("records")]
+
+
+def _group_routes(df, keys):
+    """按分组键（取值转为字符串）收集记录，同组内按名次（无名次列时按原顺序）排列。"""
+    routes = {}
+    if df.empty:
+        return routes
+    if RANK_COLUMN in df.columns:
+        df = df.sort_values(RANK_COLUMN, kind="stable")
+    key_values = zip(*(df[key].astype(str).to_numpy() for key in keys))
+    for key, record in zip(key_values, _json_records(df)):
+        routes.setdefault(key, []).append(record)
+    return routes
+
+
+def build_route_index(df_result, result_key=None, generation=0):
+    """由 process_files 的输出建立 RouteIndex；查询时的矿山、发货港、卸货码头均按字符串匹配。"""
+    df_non = df_result[df_result["是否平仓价发货"]=="否"].dropna(subset=NON_PING_KEYS)
+    df_ping = df_result[df_result["是否平仓价发货"]=="是"].dropna(subset=PING_KEYS)
+    alternatives = int(df_result[RANK_COLUMN].max()) if RANK_COLUMN in df_result.columns and len(df_result) else 1
+    return RouteIndex(_group_routes(df_non, NON_PING_KEYS), _group_routes(df_ping, PING_KEYS),
+                      result_key=result_key, alternatives=alternatives, generation=generation)
+
+
+class RouteIndexStore:
+    """
+    当前生效的路线索引。publish 以新索引整体替换旧索引（引用赋值，读者要么看到旧索引，要么看到新索引）；
+    各次运算开始时按顺序领取 generation，先开始、后完成的运算不会覆盖较新的索引。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._index = None
+        self._generation = 0
+
+    @property
+    def current(self):
+        return self._index
+
+    def next_generation(self):
+        """运算开始时领取一个序号，完成后随索引一起 publish。"""
+        with self._lock:
+            self._generation += 1
+            return self._generation
+
+    def publish(self, index):
+        """发布新索引；若当前索引来自更晚开始的运算则忽略本次发布并返回 False。"""
+        with self._lock:
+            if self._index is not None and self._index.generation > index.generation:
+                return False
+            self._index = index
+            return True
@@ -0,0 +1,251 @@
+import os
+import sqlite3
+import tempfile
+import numpy as np
+import pandas as pd
+from route_engine import (_mine_to_sea_routes, _mine_to_sea_frame, _ship_tables, _column, _candidate_frame,
+                          select_optimal, _report)
+
+# ==================== SQL 执行后端 ====================
+# 候选记录（矿山→海港组合 × 海运组合）放不进内存时使用：五张输入表写入磁盘上的 SQLite 数据库，
+# PART A、PART B、PART C 均以连接与窗口函数（ROW_NUMBER 取各组最小值）表示，
+# 连接与排序的中间结果由 SQLite 按需写入临时文件，内存占用只受页缓存上限限制。
+# 只取回各组胜出记录的行号，再按行号用 vectorized 实现的函数生成输出行，输出与 process_files 的其他实现相同。
+#
+# 各表中的 _i、_j、_f、_h、_x、_d 为行号（与 vectorized 实现中的行号相同），用于同价时按原顺序取舍：
+#   caigoujia(_i)、qianzhi(_j)：输入表的行号；
+#   fahuo(_f)、xiehuo(_x)：港口基础信息中发货港、卸货港部分的行号；haiyun(_h)、duandao(_d)：输入表的行号，无短倒费时 _d 为 -1。
+# 费用按与 vectorized 实现相同的加法顺序计算；排序时空值按无穷大处理（IFNULL(费用, 9e999)，9e999 在 SQLite 中即为无穷大），
+# 与正无穷大同名次、排在最后。
+
+# SQLite 页缓存上限（KiB），超过后排序与连接的中间结果写入临时文件
+SQL_CACHE_KIB = 256 * 1024
+
+_SCHEMA = {
+    "caigoujia": ["_i", "矿山", "采购价"],
+    "qianzhi": ["_j", "起点", "起点类型", "终点", "终点类型", "运输方式", "运输价格"],
+    "fahuo": ["_f", "港口名称", "码头名称", "rail_ok", "road_ok", "平仓价", "码头费", "最大吨位", "卸运方式"],
+    "xiehuo": ["_x", "港口名称", "码头名称", "码头费", "最大吨位"],
+    "haiyun": ["_h", "发货港", "发货码头", "卸货港", "卸货码头", "海运船吨数", "海运费"],
+    "duandao": ["_d", "卸货码头", "附加终点", "附加价格"],
+}
+
+_INDEXES = [
+    "CREATE INDEX qianzhi_start ON qianzhi (起点, 起点类型)",
+    "CREATE INDEX haiyun_port ON haiyun (发货港)",
+    "CREATE INDEX xiehuo_terminal ON xiehuo (港口名称, 码头名称)",
+    "CREATE INDEX duandao_terminal ON duandao (卸货码头)",
+]
+
+# ---------------- PART A：矿山→海港组合 ----------------
+# rail 为是否使用铁路（决定可用的发货码头卸运方式）；_m 为组合在完整 PART A 输出中的位置
+_MINE_TO_SEA = """
+CREATE TABLE m2s AS
+SELECT ROW_NUMBER() OVER (ORDER BY _i, _j, _k) - 1 AS _m, * FROM (
+    SELECT c._i, q._j, -1 AS _k, c.矿山, q.终点 AS 海港,
+           c.采购价 + (CASE WHEN q.运输方式 = '汽运' THEN q.运输价格 ELSE 0 END)
+                    + (CASE WHEN q.运输方式 = '铁路' THEN q.运输价格 ELSE 0 END) AS 到海港价格,
+           (CASE WHEN q.运输方式 = '铁路' THEN 1 ELSE 0 END) AS rail
+    FROM caigoujia c JOIN qianzhi q ON q.起点 = c.矿山 AND q.起点类型 = '矿山' AND q.终点类型 = '海港'
+    UNION ALL
+    SELECT c._i, q1._j, q2._j, c.矿山, q2.终点,
+           c.采购价 + (CASE WHEN q2.运输方式 = '汽运'
+                            THEN (CASE WHEN q1.运输方式 = '汽运' THEN q1.运输价格 ELSE 0 END) + q2.运输价格
+                            ELSE (CASE WHEN q1.运输方式 = '汽运' THEN q1.运输价格 ELSE 0 END) END)
+                    + (CASE WHEN q2.运输方式 = '铁路'
+                            THEN (CASE WHEN q1.运输方式 = '铁路' THEN q1.运输价格 ELSE 0 END) + q2.运输价格
+                            ELSE (CASE WHEN q1.运输方式 = '铁路' THEN q1.运输价格 ELSE 0 END) END),
+           (CASE WHEN q1.运输方式 = '铁路' OR q2.运输方式 = '铁路' THEN 1 ELSE 0 END)
+    FROM caigoujia c
+    JOIN qianzhi q1 ON q1.起点 = c.矿山 AND q1.起点类型 = '矿山' AND q1.终点类型 = '铁路港'
+    JOIN qianzhi q2 ON q2.起点 = q1.终点 AND q2.起点类型 = '铁路港' AND q2.终点类型 = '海港'
+)
+"""
+
+# ---------------- PART B：与矿山无关的海运组合（发货码头 → 海运 → 卸货码头 → 短倒费） ----------------
+# 海运费中发货码头为空的记录适用于该发货港的所有码头；两端码头吨位均需有效且不小于船舶吨数
+_SHIP_LEGS = """
+CREATE TABLE legs AS
+SELECT f._f, h._h, x._x, COALESCE(d._d, -1) AS _d, f.港口名称 AS 发货港, h.卸货码头, f.rail_ok, f.road_ok,
+       f.平仓价, f.码头费 AS 发货码头费, x.码头费 AS 卸货码头费, h.海运费,
+       (CASE WHEN d._d IS NULL THEN 0 ELSE d.附加价格 END) AS 附加费用,
+       f.码头名称 AS 发货码头, f.卸运方式, h.卸货港, h.海运船吨数,
+       (CASE WHEN d._d IS NULL THEN '' ELSE d.附加终点 END) AS 附加终点
+FROM fahuo f
+JOIN haiyun h ON h.发货港 = f.港口名称 AND (h.发货码头 = f.码头名称 OR h.发货码头 IS NULL)
+JOIN xiehuo x ON x.港口名称 = h.卸货港 AND x.码头名称 = h.卸货码头
+LEFT JOIN duandao d ON d.卸货码头 = h.卸货码头
+WHERE h.海运船吨数 IS NOT NULL AND f.最大吨位 IS NOT NULL AND x.最大吨位 IS NOT NULL
+  AND h.海运船吨数 <= f.最大吨位 AND h.海运船吨数 <= x.最大吨位
+"""
+
+# ---------------- PART B + PART C：非平仓 ----------------
+# 先剔除被支配的部分路径（同 vectorized 实现的剪枝）：同一【矿山, 海港, 是否使用铁路】只保留到海港价格最低的前 k 条，
+# 同一【发货港, 铁路/汽运, 卸货码头】只保留码头费、海运费与附加费用之和最低的前 k 条；再连接并按【矿山, 卸货码头】取前 k 条。
+# 剪枝只比较有限数值的费用（open 为费用是空值或无穷大）：这类行全部保留，并与所有可连接的行（包括被剪掉的）组合，
+# 因为组成的候选记录总费用同样不是有限数值，同价时按原顺序取舍（见 route_engine._prune_rows）。
+# 三部分互不重叠：保留行 × 保留行、open 的矿山→海港行 × 被剪掉的海运组合、被剪掉的矿山→海港行 × open 的海运组合
+_NON_PING = """
+WITH mr AS (
+    SELECT *, rn <= :k OR open AS kept FROM (
+        SELECT _m, 矿山, 海港, rail, 到海港价格, open,
+               ROW_NUMBER() OVER (PARTITION BY 矿山, 海港, rail ORDER BY open, 到海港价格, _m) AS rn
+        FROM (SELECT *, 到海港价格 IS NULL OR abs(到海港价格) = 9e999 AS open FROM m2s))
+), lr AS (
+    SELECT *, rn <= :k OR open AS kept FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY 发货港, rail, 卸货码头 ORDER BY open, cost, _f, _h, _x, _d) AS rn
+        FROM (SELECT *, cost IS NULL OR abs(cost) = 9e999 AS open FROM (
+                  SELECT *, 发货码头费 + 卸货码头费 + 海运费 + 附加费用 AS cost FROM (
+                      SELECT _f, _h, _x, _d, 发货港, 卸货码头, 发货码头费, 卸货码头费, 海运费, 附加费用, 1 AS rail
+                      FROM legs WHERE rail_ok
+                      UNION ALL
+                      SELECT _f, _h, _x, _d, 发货港, 卸货码头, 发货码头费, 卸货码头费, 海运费, 附加费用, 0 AS rail
+                      FROM legs WHERE road_ok))))
+), pairs AS (
+    SELECT m._m, m.矿山, m.到海港价格, l.* FROM mr m JOIN lr l ON l.发货港 = m.海港 AND l.rail = m.rail
+    WHERE m.kept AND l.kept
+    UNION ALL
+    SELECT m._m, m.矿山, m.到海港价格, l.* FROM mr m JOIN lr l ON l.发货港 = m.海港 AND l.rail = m.rail
+    WHERE m.open AND NOT l.kept
+    UNION ALL
+    SELECT m._m, m.矿山, m.到海港价格, l.* FROM mr m JOIN lr l ON l.发货港 = m.海港 AND l.rail = m.rail
+    WHERE NOT m.kept AND l.open
+)
+SELECT p._m, p._f, p._h, p._x, p._d, s._i, s._j, s._k FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY 矿山, 卸货码头
+                                 ORDER BY IFNULL(total, 9e999), _m, _f, _h, _x, _d) AS rank
+    FROM (SELECT _m, 矿山, 卸货码头, _f, _h, _x, _d,
+                 到海港价格 + 发货码头费 + 卸货码头费 + 海运费 + 附加费用 AS total FROM pairs)
+) p JOIN m2s s ON s._m = p._m
+WHERE p.rank <= :k
+ORDER BY p._m, p._f, p._h, p._x, p._d
+"""
+
+# ---------------- PART B + PART C：平仓 ----------------
+# 平仓记录与矿山无关，每个海运组合只生成一条，其先后为首个可用该码头的矿山→海港组合的位置（first_m）；
+# 完全相同的记录只保留第一条，再按【发货港, 卸货码头】取前 k 条
+_PING = """
+WITH firsts AS (
+    SELECT 海港, rail, MIN(_m) AS first_m FROM m2s GROUP BY 海港, rail
+), b AS (
+    SELECT g.*, MIN(fm.first_m) AS first_m,
+           g.平仓价 + g.发货码头费 + g.卸货码头费 + g.海运费 + g.附加费用 AS total
+    FROM legs g JOIN firsts fm ON fm.海港 = g.发货港
+         AND ((fm.rail = 1 AND g.rail_ok) OR (fm.rail = 0 AND g.road_ok))
+    WHERE g.平仓价 IS NOT NULL AND g.平仓价 != 0
+    GROUP BY g._f, g._h, g._x, g._d
+), unique_b AS (
+    SELECT * FROM (
+        SELECT *, ROW_NUMBER() OVER (PARTITION BY 平仓价, 发货港, 发货码头, 卸运方式, 发货码头费, 卸货港, 卸货码头,
+                                                  卸货码头费, 海运船吨数, 海运费, 附加终点, 附加费用, total
+                                     ORDER BY first_m, _f, _h, _x, _d) AS dup FROM b)
+    WHERE dup = 1
+)
+SELECT _f, _h, _x, _d FROM (
+    SELECT *, ROW_NUMBER() OVER (PARTITION BY 发货港, 卸货码头
+                                 ORDER BY IFNULL(total, 9e999), first_m, _f, _h, _x, _d) AS rank
+    FROM unique_b)
+WHERE rank <= :k
+ORDER BY first_m, _f, _h, _x, _d
+"""
+
+
+def _values(values):
+    """数组转为可写入 SQLite 的取值列表（numpy 数值转为 Python 数值，空值转为 NULL）。"""
+    values = pd.Series(np.asarray(values), dtype=object)
+    return values.where(values.notna(), None).tolist()
+
+
+def _load_table(conn, name, columns):
+    """建表并写入各列（columns 为与 _SCHEMA 中列名顺序相同的数组）。"""
+    conn.execute("CREATE TABLE " + name + " (" + ", ".join(_SCHEMA[name]) + ")")
+    placeholders = ", ".join("?" * len(columns))
+    conn.executemany("INSERT INTO " + name + " VALUES (" + placeholders + ")", zip(*(_values(col) for col in columns)))
+
+
+def _load_inputs(conn, df_caigoujia, df_qianzhi, df_haiyun, df_duandao, tables):
+    """写入五张输入表中 PART A、B、C 用到的列；港口基础信息取自 _ship_tables（卸运方式与缺省列的处理与内存实现相同）。"""
+    _load_table(conn, "caigoujia", [np.arange(len(df_caigoujia)), df_caigoujia["矿山"], df_caigoujia["采购价"]])
+    _load_table(conn, "qianzhi", [np.arange(len(df_qianzhi))] + [df_qianzhi[col] for col in _SCHEMA["qianzhi"][1:]])
+    df_fahuo, df_xiehuo = tables["fahuo"], tables["xiehuo"]
+    _load_table(conn, "fahuo", [
+        np.arange(len(df_fahuo)), df_fahuo["港口名称"], df_fahuo["码头名称"], tables["rail_ok"], tables["road_ok"],
+        tables["fahuo_pcj"], tables["fahuo_fee"], _tonnage(df_fahuo), tables["unload_way"]])
+    _load_table(conn, "xiehuo", [
+        np.arange(len(df_xiehuo)), df_xiehuo["港口名称"], df_xiehuo["码头名称"], tables["xiehuo_fee"], _tonnage(df_xiehuo)])
+    _load_table(conn, "haiyun", [np.arange(len(df_haiyun))] + [df_haiyun[col] for col in _SCHEMA["haiyun"][1:]])
+    _load_table(conn, "duandao", [np.arange(len(df_duandao)), df_duandao["卸货码头"] if len(df_duandao) else [],
+                                  tables["add_target"], tables["add_price"]])
+    for statement in _INDEXES:
+        conn.execute(statement)
+
+
+def _tonnage(df):
+    """码头最大吨位（与 _ship_tables 相同：列不存在时不限，无法转为数值时为空值）。"""
+    return pd.to_numeric(pd.Series(_column(df, "最大吨位（万吨)", np.inf)), errors="coerce").to_numpy()
+
+
+def _connect(database):
+    conn = sqlite3.connect(database)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = FILE")
+    conn.execute("PRAGMA cache_size = -" + str(SQL_CACHE_KIB))
+    return conn
+
+
+def _winning_routes(df_caigoujia, df_qianzhi, keys):
+    """
+    由胜出记录的（采购价行, 第一段行, 第二段行）生成矿山→海港组合表：只对用到的采购价行调用 PART A 的内存实现，
+    返回组合表与各胜出记录在其中的行号。
+    """
+    rows = np.unique(keys[:, 0])
+    routes = _mine_to_sea_routes(df_caigoujia.iloc[rows], df_qianzhi)
+    routes["_i"] = rows[routes["_i"].to_numpy()]
+    index = pd.MultiIndex.from_arrays([routes["_i"].to_numpy(), routes["_j"].to_numpy(), routes["_k"].to_numpy()])
+    m_idx = index.get_indexer(pd.MultiIndex.from_arrays([keys[:, 0], keys[:, 1], keys[:, 2]]))
+    return _mine_to_sea_frame(routes), m_idx
+
+
+def sql_optimal(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao, top_k=1, database=None, progress=None):
+    """
+    以 SQLite 计算各分组的最优记录，输出与 process_files(engine="vectorized", top_k=top_k) 相同。
+    database 为数据库文件路径（已存在时覆盖）；None 时使用临时文件，计算完成后删除。
+    """
+    remove = database is None
+    if remove:
+        handle, database = tempfile.mkstemp(suffix=".sqlite")
+        os.close(handle)
+    elif os.path.exists(database):
+        os.remove(database)
+    conn = _connect(database)
+    try:
+        tables = _ship_tables(df_gangkou, df_haiyun, df_duandao)
+        _load_inputs(conn, df_caigoujia, df_qianzhi, df_haiyun, df_duandao, tables)
+
+        _report(progress, "PART A", "running")
+        conn.execute(_MINE_TO_SEA)
+        conn.execute("CREATE INDEX m2s_row ON m2s (_m)")
+        _report(progress, "PART A", "done", conn.execute("SELECT COUNT(*) FROM m2s").fetchone()[0])
+
+        _report(progress, "PART B", "running")
+        conn.execute(_SHIP_LEGS)
+        _report(progress, "PART B", "done")
+
+        _report(progress, "PART C", "running")
+        best = np.array(conn.execute(_NON_PING, {"k": top_k}).fetchall(), dtype=np.int64).reshape(-1, 8)
+        ping = np.array(conn.execute(_PING, {"k": top_k}).fetchall(), dtype=np.int64).reshape(-1, 4)
+    finally:
+        conn.close()
+        if remove:
+            os.remove(database)
+
+    # 按行号生成胜出的非平仓记录与候选平仓记录（顺序同 vectorized 实现的候选记录），再分组取优并排序
+    df_mine_to_sea, m_idx = _winning_routes(df_caigoujia, df_qianzhi, best[:, 5:])
+    legs_a = tuple(best[:, col] for col in range(1, 5))
+    legs_b = tuple(ping[:, col] for col in range(4))
+    df_final = _candidate_frame(df_mine_to_sea, tables, m_idx, legs_a, legs_b,
+                                np.arange(len(best)), len(best) + np.arange(len(ping)))
+    df_opt = select_optimal(df_final, top_k=top_k)
+    _report(progress, "PART C", "done", len(df_opt))
+    return df_opt
@@ -0,0 +1,319 @@
+import numpy as np
+import pandas as pd
+from route_engine import (OUTPUT_COLUMNS, load_inputs, name_dtype, encode_names, decode_names, _report,
+                          _mine_to_sea_routes, _mine_to_sea_frame, _port_legs, _prepare_ship, _candidate_index,
+                          _candidate_frame, _group_codes, _first_min)
+
+# ==================== 批量情景测算 ====================
+# 对采购价、运输价格、码头费、平仓价、海运费、附加价格做乘法或加法调整，一次性求出多个情景下各组的最优路线。
+# 路线结构（哪些矿山→海港→卸货码头组合可行）与价格无关，只构建一次；各情景的价格沿情景轴广播后统一计算总费用。
+#
+# 情景格式：{"name": 名称（可省略）, "adjustments": [调整, ...]}，调整格式：
+#   {"column": "海运费", "multiply": 1.08}
+#   {"column": "平仓价", "add": -5, "where": {"港口名称": "某港"}}
+# where 为 {列名: 取值或取值列表}，只调整该表中满足全部条件的行，列名为该价格所在输入表的列。
+# 平仓价只调整已有平仓价（非空且非 0）的码头，调整后仍按平仓记录处理，不改变路线结构。
+
+SCENARIO_COLUMN = "场景"
+
+# 可调整的价格列 → 所在的价格槽（码头费同时作用于发货码头与卸货码头）
+ADJUSTABLE_COLUMNS = {
+    "采购价": ("caigoujia",),
+    "运输价格": ("qianzhi",),
+    "码头费": ("fahuo_fee", "xiehuo_fee"),
+    "平仓价": ("fahuo_pcj",),
+    "海运费": ("haiyun",),
+    "附加价格": ("add_price",),
+}
+ADJUST_MODES = ("multiply", "add")
+
+# 单次广播计算的（情景数 × 候选记录数）上限，超出时按情景分批
+BLOCK_CELLS = 1 << 23
+
+
+def parse_scenarios(scenarios):
+    """校验情景列表并补全名称，返回同样格式的 [{"name", "adjustments"}]；格式错误时抛出 ValueError。"""
+    if not isinstance(scenarios, list) or not scenarios:
+        raise ValueError("scenarios 必须为非空列表")
+    parsed, names = [], set()
+    for n, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict):
+            raise ValueError("第 " + str(n + 1) + " 个情景格式错误")
+        name = str(scenario.get("name") or "情景" + str(n + 1))
+        if name in names:
+            raise ValueError("情景名称重复: " + name)
+        names.add(name)
+        adjustments = scenario.get("adjustments", [])
+        if not isinstance(adjustments, list):
+            raise ValueError("情景 " + name + " 的 adjustments 必须为列表")
+        checked = []
+        for adjustment in adjustments:
+            if not isinstance(adjustment, dict) or adjustment.get("column") not in ADJUSTABLE_COLUMNS:
+                raise ValueError("情景 " + name + " 含有不支持的调整: " + str(adjustment))
+            modes = [mode for mode in ADJUST_MODES if mode in adjustment]
+            if len(modes) != 1:
+                raise ValueError("情景 " + name + " 的每项调整必须且只能指定 multiply 或 add 之一")
+            value = adjustment[modes[0]]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+                raise ValueError("情景 " + name + " 的调整值必须为数值: " + str(value))
+            where = adjustment.get("where") or {}
+            if not isinstance(where, dict):
+                raise ValueError("情景 " + name + " 的 where 必须为 {列名: 取值}")
+            checked.append({"column": adjustment["column"], modes[0]: value, "where": where})
+        parsed.append({"name": name, "adjustments": checked})
+    return parsed
+
+
+def build_routes(df_caigoujia, df_qianzhi, df_gangkou, df_haiyun, df_duandao):
+    """
+    构建与价格无关的路线结构：全部（不剪枝的）候选记录在各输入表中的行号，以及各价格槽的原始取值。
+    平仓记录只保留每个海运组合首次出现的一条（其余为完全相同的重复记录，不影响分组最优）。
+    """
+    routes = _mine_to_sea_routes(df_caigoujia, df_qianzhi)
+    df_mine_to_sea = _mine_to_sea_frame(routes) if not routes.empty else pd.DataFrame(columns=OUTPUT_COLUMNS)
+    tables, legs = _prepare_ship(None, None, df_duandao, port=_port_legs(df_gangkou, df_haiyun))
+    if df_mine_to_sea.empty:
+        empty = np.zeros(0, dtype=np.int64)
+        m_idx, legs_a, legs_b = empty, (empty,) * 4, (empty,) * 4
+    else:
+        m_idx, legs_a, legs_b, _, _ = _candidate_index(df_mine_to_sea, tables, legs)
+    if len(legs_b[0]):
+        first = _first_min(_group_codes(list(legs_b)), np.zeros(len(legs_b[0])))
+        legs_b = tuple(idx[first] for idx in legs_b)
+
+    # 分组键为空值的候选记录不参与输出，预先剔除
+    mine = df_mine_to_sea["矿山"].to_numpy()[m_idx] if len(m_idx) else np.zeros(0, dtype=object)
+    xiehuo_a = df_haiyun["卸货码头"].to_numpy()[legs_a[1]]
+    keep_a = pd.notna(mine) & pd.notna(xiehuo_a)
+    m_idx, legs_a = m_idx[keep_a], tuple(idx[keep_a] for idx in legs_a)
+    fahuo_b = tables["fahuo"]["港口名称"].to_numpy()[legs_b[0]]
+    keep_b = pd.notna(fahuo_b) & pd.notna(df_haiyun["卸货码头"].to_numpy()[legs_b[1]])
+    legs_b = tuple(idx[keep_b] for idx in legs_b)
+
+    qz_way = df_qianzhi["运输方式"].to_numpy()
+    way1 = qz_way[routes["_j"].to_numpy()] if len(routes) else np.zeros(0, dtype=object)
+    k = routes["_k"].to_numpy() if len(routes) else np.zeros(0, dtype=np.int64)
+    way2 = np.where(k >= 0, qz_way[np.maximum(k, 0)], "") if len(qz_way) else np.full(len(k), "", dtype=object)
+    return {
+        "mine_to_sea": df_mine_to_sea,
+        "route_i": routes["_i"].to_numpy() if len(routes) else np.zeros(0, dtype=np.int64),
+        "route_j": routes["_j"].to_numpy() if len(routes) else np.zeros(0, dtype=np.int64),
+        "route_k": k,
+        "way1": way1,
+        "way2": way2,
+        "tables": tables,
+        "m_idx": m_idx,
+        "legs_a": legs_a,
+        "legs_b": legs_b,
+        "groups_a": _sorted_groups([mine[keep_a], xiehuo_a[keep_a]]),
+        "groups_b": _sorted_groups([fahuo_b[keep_b], df_haiyun["卸货码头"].to_numpy()[legs_b[1]]]),
+        # 各价格槽：(价格所在的表, 原始价格数组)
+        "slots": {
+            "caigoujia": (df_caigoujia, df_caigoujia["采购价"].to_numpy()),
+            "qianzhi": (df_qianzhi, df_qianzhi["运输价格"].to_numpy()),
+            "fahuo_fee": (tables["fahuo"], tables["fahuo_fee"]),
+            "xiehuo_fee": (tables["xiehuo"], tables["xiehuo_fee"]),
+            "fahuo_pcj": (tables["fahuo"], tables["fahuo_pcj"]),
+            "haiyun": (df_haiyun, df_haiyun["海运费"].to_numpy()),
+            "add_price": (tables["duandao"], tables["add_price"]),
+        },
+    }
+
+
+def _sorted_groups(columns):
+    """
+    按分组编码稳定排序候选记录，返回 (排序后的行号, 各组起点, 各组按分组键取值排序的名次)，同组内保持原顺序。
+    名次与 select_optimal 中 sort_values(分组键) 的输出顺序一致。
+    """
+    empty = np.zeros(0, dtype=np.int64)
+    if not len(columns[0]):
+        return empty, empty, empty
+    codes = _group_codes(columns)
+    order = np.argsort(codes, kind="stable")
+    starts = np.flatnonzero(np.concatenate([[True], codes[order][1:] != codes[order][:-1]]))
+    keys = pd.DataFrame({n: np.asarray(col, dtype=object)[order[starts]] for n, col in enumerate(columns)})
+    rank = np.empty(len(starts), dtype=np.int64)
+    rank[keys.sort_values(list(keys.columns), kind="stable").index.to_numpy()] = np.arange(len(starts))
+    return order, starts, rank
+
+
+def _slot_prices(routes, slot, scenarios):
+    """
+    某价格槽在各情景下的价格矩阵（情景数 × 行数，浮点），以及受调整的情景编号集合。
+    未被任何情景调整的价格槽只返回一行，计算时沿情景轴广播。
+    """
+    frame, base = routes["slots"][slot]
+    column = next(name for name, slots in ADJUSTABLE_COLUMNS.items() if slot in slots)
+    values = pd.to_numeric(pd.Series(base, dtype=object), errors="coerce").to_numpy(dtype=float)
+    touched = set()
+    prices = None
+    for s, scenario in enumerate(scenarios):
+        for adjustment in scenario["adjustments"]:
+            if adjustment["column"] != column:
+                continue
+            mask = np.ones(len(values), dtype=bool)
+            for col, wanted in adjustment["where"].items():
+                if col not in frame.columns:
+                    raise ValueError(column + " 的调整条件中含有不存在的列: " + str(col))
+                wanted = wanted if isinstance(wanted, list) else [wanted]
+                mask &= frame[col].isin(wanted).to_numpy()
+            if slot == "fahuo_pcj":
+                mask &= pd.notna(base) & (base != 0)
+            if prices is None:
+                prices = np.repeat(values[None, :], len(scenarios), axis=0)
+            if "multiply" in adjustment:
+                prices[s, mask] *= adjustment["multiply"]
+            else:
+                prices[s, mask] += adjustment["add"]
+            touched.add(s)
+    return (prices if prices is not None else values[None, :]), touched
+
+
+def _mine_to_sea_costs(routes, prices):
+    """各情景下矿山→海港组合的汽运价格、铁路价格与到海港价格（与 PART A 相同的加法顺序）。"""
+    k = routes["route_k"]
+    leg1 = prices["qianzhi"][:, routes["route_j"]]
+    leg2 = np.where(k >= 0, prices["qianzhi"][:, np.maximum(k, 0)], 0) if len(k) else leg1
+    qiyun = np.where(routes["way1"] == "汽运", leg1, 0) + np.where(routes["way2"] == "汽运", leg2, 0)
+    tielu = np.where(routes["way1"] == "铁路", leg1, 0) + np.where(routes["way2"] == "铁路", leg2, 0)
+    return qiyun, tielu, prices["caigoujia"][:, routes["route_i"]] + qiyun + tielu
+
+
+def _group_winners(costs, groups):
+    """
+    每个情景、每组总费用最低的第一条候选记录（空值视为无穷大），
+    返回（情景数 × 组数）的候选行号与对应的总费用。
+    """
+    order, starts, _ = groups
+    costs = np.where(np.isnan(costs[:, order]), np.inf, costs[:, order])
+    best = np.minimum.reduceat(costs, starts, axis=1)
+    counts = np.diff(np.append(starts, len(order)))
+    position = np.where(costs == np.repeat(best, counts, axis=1), np.arange(len(order)), len(order))
+    return order[np.minimum.reduceat(position, starts, axis=1)], best
+
+
+def _block_winners(totals, groups, n_block):
+    if not len(groups[0]):
+        return np.zeros((n_block, 0), dtype=np.int64), np.zeros((n_block, 0))
+    return _group_winners(np.broadcast_to(totals, (n_block, totals.shape[1])), groups)
+
+
+def evaluate_scenarios(routes, scenarios, progress=None, block_cells=BLOCK_CELLS):
+    """
+    在 build_routes 的路线结构上计算各情景下每组的最优路线（与 select_optimal 的取舍规则相同），
+    返回首列为 SCENARIO_COLUMN 的结果表，各情景内按总费用排序、按情景顺序拼接。
+    progress 为可选的进度回调 progress("情景测算", 状态, 已完成的情景数)。
+    """
+    scenarios = parse_scenarios(scenarios)
+    _report(progress, "情景测算", "running", 0)
+    prices, touched = {}, {}
+    for slot in routes["slots"]:
+        prices[slot], touched[slot] = _slot_prices(routes, slot, scenarios)
+    # 无短倒费的候选记录（行号 -1）取末尾追加的 0
+    prices["add_price"] = np.concatenate([prices["add_price"], np.zeros((len(prices["add_price"]), 1))], axis=1)
+    qiyun, tielu, to_sea = _mine_to_sea_costs(routes, prices)
+
+    m_idx, legs_a, legs_b = routes["m_idx"], routes["legs_a"], routes["legs_b"]
+    n_scen = len(scenarios)
+    step = max(1, block_cells // max(1, len(m_idx) + len(legs_b[0])))
+    win_a, win_b = [], []
+    for lo in range(0, n_scen, step):
+        block = slice(lo, min(lo + step, n_scen))
+
+        def rows(matrix):
+            return matrix[block] if len(matrix) > 1 else matrix
+
+        # 总费用与 PART B 相同的加法顺序；未调整的价格槽只有一行，沿情景轴广播
+        f, h, x, d = legs_a
+        total_a = (rows(to_sea)[:, m_idx] + rows(prices["fahuo_fee"])[:, f] + rows(prices["xiehuo_fee"])[:, x]
+                   + rows(prices["haiyun"])[:, h] + rows(prices["add_price"])[:, d])
+        f, h, x, d = legs_b
+        total_b = (rows(prices["fahuo_pcj"])[:, f] + rows(prices["fahuo_fee"])[:, f]
+                   + rows(prices["xiehuo_fee"])[:, x] + rows(prices["haiyun"])[:, h] + rows(prices["add_price"])[:, d])
+        n_block = block.stop - block.start
+        win_a.append(_block_winners(total_a, routes["groups_a"], n_block))
+        win_b.append(_block_winners(total_b, routes["groups_b"], n_block))
+        _report(progress, "情景测算", "running", block.stop)
+
+    df_opt = _scenario_frame(routes, scenarios, prices, touched, (qiyun, tielu, to_sea),
+                             [np.concatenate(part) for part in zip(*win_a)],
+                             [np.concatenate(part) for part in zip(*win_b)])
+    _report(progress, "情景测算", "done", n_scen)
+    return df_opt
+
+
+def _scenario_frame(routes, scenarios, prices, touched, mine_costs, win_a, win_b):
+    """
+    只为各情景胜出的候选记录生成输出行：按（情景, 总费用, 分组键）排列，与逐个情景调用 select_optimal 的顺序相同；
+    被调整过的价格列改为各情景调整后的取值。
+    """
+    (cand_a, best_a), (cand_b, best_b) = win_a, win_b
+    n_scen, n_ga = cand_a.shape
+    n_gb = cand_b.shape[1]
+    scen = np.concatenate([np.repeat(np.arange(n_scen), n_ga), np.repeat(np.arange(n_scen), n_gb)])
+    group_rank = np.concatenate([np.tile(routes["groups_a"][2], n_scen), n_ga + np.tile(routes["groups_b"][2], n_scen)])
+    total = np.concatenate([best_a.ravel(), best_b.ravel()])
+    total = np.where(np.isinf(total), np.nan, total)
+    # select_optimal：各组按分组键排列（非平仓在前），再按总费用稳定排序
+    order = np.lexsort((group_rank, total, scen))
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    # 两部分各自按输出位置排列（_candidate_frame 在只有一部分时直接按原顺序输出）
+    n_a = n_scen * n_ga
+    by_a, by_b = np.argsort(position[:n_a]), n_a + np.argsort(position[n_a:])
+    pos_a, pos_b = position[by_a], position[by_b]
+    cand_a, cand_b = cand_a.ravel()[by_a], cand_b.ravel()[by_b - n_a]
+    scen_a, scen_b = scen[by_a], scen[by_b]
+
+    m_idx = routes["m_idx"][cand_a]
+    legs_a = tuple(idx[cand_a] for idx in routes["legs_a"])
+    legs_b = tuple(idx[cand_b] for idx in routes["legs_b"])
+    df_opt = _candidate_frame(routes["mine_to_sea"], routes["tables"], m_idx, legs_a, legs_b, pos_a, pos_b)
+
+    def take(matrix, scen_rows, cols):
+        return matrix[scen_rows if len(matrix) > 1 else 0, cols]
+
+    def overwrite(name, pos, values):
+        column = df_opt[name].to_numpy()
+        column = column.astype(float) if column.dtype.kind in "biu" else column.copy()
+        column[pos] = values
+        df_opt[name] = column
+
+    # 未被任何情景调整的价格列保持原值（数据类型与 process_files 一致）
+    qiyun, tielu, to_sea = mine_costs
+    if touched["caigoujia"]:
+        overwrite("采购价", pos_a, take(prices["caigoujia"], scen_a, routes["route_i"][m_idx]))
+    if touched["qianzhi"]:
+        overwrite("汽运价格", pos_a, take(qiyun, scen_a, m_idx))
+        overwrite("铁路价格", pos_a, take(tielu, scen_a, m_idx))
+    if touched["caigoujia"] or touched["qianzhi"]:
+        overwrite("到海港价格", pos_a, take(to_sea, scen_a, m_idx))
+    if touched["fahuo_pcj"]:
+        overwrite("平仓价", pos_b, take(prices["fahuo_pcj"], scen_b, legs_b[0]))
+    for name, slot, leg in (("发货码头费", "fahuo_fee", 0), ("卸货码头费", "xiehuo_fee", 2), ("海运费", "haiyun", 1),
+                            ("附加费用", "add_price", 3)):
+        if touched[slot]:
+            overwrite(name, pos_a, take(prices[slot], scen_a, legs_a[leg]))
+            overwrite(name, pos_b, take(prices[slot], scen_b, legs_b[leg]))
+    if any(touched.values()):
+        df_opt["总费用"] = total[order]
+    df_opt.insert(0, SCENARIO_COLUMN, np.array([scenario["name"] for scenario in scenarios], dtype=object)[scen[order]])
+    return df_opt
+
+
+def process_scenarios(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao, scenarios,
+                      progress=None):
+    """
+    读取五个输入（Excel 文件路径或快照标识），构建一次路线结构后批量计算各情景下的最优路线。
+    不含调整的情景与 process_files（默认参数）的输出相同。
+    progress 见 process_files，阶段依次为 "读取输入"、"路线结构"、"情景测算"。
+    """
+    scenarios = parse_scenarios(scenarios)
+    _report(progress, "读取输入", "running")
+    inputs = load_inputs(file_caigoujia, file_qianzhi, file_gangkou, file_haiyun, file_duandao)
+    inputs = encode_names(name_dtype(*inputs), *inputs)
+    _report(progress, "读取输入", "done", sum(len(df) for df in inputs))
+    _report(progress, "路线结构", "running")
+    routes = build_routes(*inputs)
+    _report(progress, "路线结构", "done", len(routes["m_idx"]) + len(routes["legs_b"][0]))
+    return decode_names(evaluate_scenarios(routes, scenarios, progress=progress))
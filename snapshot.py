@@ -0,0 +1,217 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import pandas as pd
+
+# ==================== 输入表列式快照 ====================
+# 上传的 Excel 只解析一次，转存为列式快照（优先 Parquet，未安装 pyarrow 时退回 pickle），
+# 以文件内容的 SHA-256 为键：内容相同的重复上传共用同一份快照，重复运算时不再解析 Excel。
+# 上传时只流式写盘并登记源文件（register_upload），快照可在后台生成；读取尚未生成的快照时按登记的源文件当场生成。
+# 上传的文件按内容哈希命名（save_stream），同名的不同文件不会互相覆盖，登记的源文件内容总与快照键一致。
+
+SNAPSHOT_FOLDER = os.path.join(os.getcwd(), "snapshots")
+SNAPSHOT_PREFIX = "snapshot:"
+
+# 需要转换为数值的列（与 route_engine.load_inputs 中的转换一致）
+NUMERIC_COLUMNS = ["最大吨位（万吨)", "海运船吨数"]
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+_FORMATS = (".parquet", ".pkl")
+_SOURCE_EXT = ".src"
+
+# 同一快照同时只生成一次
+_build_locks = {}
+_build_locks_guard = threading.Lock()
+
+try:
+    import pyarrow
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+def save_stream(stream, folder, filename, block_size=1 << 20):
+    """
+    将上传的文件流按块写入 folder，同时计算内容的 SHA-256；文件以 <哈希><filename 的扩展名> 命名，
+    返回 (文件路径, 哈希)。先写入独占的临时文件再改名，并发上传同名文件时互不影响。
+    """
+    digest = hashlib.sha256()
+    handle, tmp = tempfile.mkstemp(suffix=".part", dir=folder)
+    try:
+        with os.fdopen(handle, "wb") as f:
+            for block in iter(lambda: stream.read(block_size), b""):
+                digest.update(block)
+                f.write(block)
+        key = digest.hexdigest()
+        filepath = os.path.join(folder, key + os.path.splitext(filename)[1].lower())
+        os.replace(tmp, filepath)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return filepath, key
+
+
+def content_hash(filepath, block_size=1 << 20):
+    """按块计算文件内容的 SHA-256。"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_snapshot_handle(source):
+    return isinstance(source, str) and source.startswith(SNAPSHOT_PREFIX)
+
+
+def source_hash(source):
+    """输入表的内容哈希：快照标识直接取其中的哈希，文件路径则计算文件内容的 SHA-256。"""
+    if is_snapshot_handle(source):
+        return _snapshot_key(source)
+    return content_hash(source)
+
+
+def _snapshot_key(handle):
+    key = handle[len(SNAPSHOT_PREFIX):]
+    if not _HASH_RE.match(key):
+        raise ValueError("无效的快照标识: " + str(handle))
+    return key
+
+
+def _snapshot_path(key, folder):
+    for ext in _FORMATS:
+        path = os.path.join(folder, key + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _coerce_numeric(df):
+    for col in NUMERIC_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def _write_snapshot(df, key, folder):
+    """写入快照（先写临时文件再改名，避免并发读到半个文件）。Parquet 无法原样保存时（如混合类型列）改用 pickle。"""
+    os.makedirs(folder, exist_ok=True)
+    if HAS_PARQUET:
+        path = os.path.join(folder, key + ".parquet")
+        tmp = path + ".tmp-" + str(os.getpid())
+        try:
+            df.to_parquet(tmp, index=False)
+            if pd.read_parquet(tmp).equals(df):
+                os.replace(tmp, path)
+                return path
+        except Exception:
+            pass
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    path = os.path.join(folder, key + ".pkl")
+    tmp = path + ".tmp-" + str(os.getpid())
+    df.to_pickle(tmp)
+    os.replace(tmp, path)
+    return path
+
+
+def _read_snapshot(path):
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def create_snapshot(filepath, folder=None):
+    """
+    为上传的 Excel 文件建立快照，返回 (快照标识, DataFrame)。
+    相同内容的文件已有快照时直接读取快照，不再解析 Excel。
+    """
+    handle = register_upload(filepath, folder=folder)
+    return handle, load_snapshot(handle, folder)
+
+
+def register_upload(filepath, key=None, folder=None):
+    """
+    登记上传的源文件并返回快照标识，不解析 Excel（快照由 build_snapshot 生成，或在首次读取时生成）。
+    key 为已算好的内容哈希（如 save_stream 的返回值），为 None 时重新计算。
+    """
+    folder = folder or SNAPSHOT_FOLDER
+    key = key or content_hash(filepath)
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, key + _SOURCE_EXT), "w", encoding="utf-8") as f:
+        f.write(os.path.abspath(filepath))
+    return SNAPSHOT_PREFIX + key
+
+
+def build_snapshot(handle, folder=None):
+    """生成快照（已存在时直接返回），返回快照文件路径。"""
+    folder = folder or SNAPSHOT_FOLDER
+    key = _snapshot_key(handle)
+    with _build_locks_guard:
+        lock = _build_locks.setdefault(key, threading.Lock())
+    with lock:
+        path = _snapshot_path(key, folder)
+        if path is not None:
+            return path
+        source = os.path.join(folder, key + _SOURCE_EXT)
+        if not os.path.exists(source):
+            raise ValueError("快照不存在，请重新上传文件: " + str(handle))
+        with open(source, encoding="utf-8") as f:
+            filepath = f.read().strip()
+        if not os.path.exists(filepath):
+            raise ValueError("快照的源文件已不存在，请重新上传文件: " + str(handle))
+        # 源文件内容已与快照键不符（如被覆盖）时不生成，避免快照中保存其他文件的数据
+        if content_hash(filepath) != key:
+            raise ValueError("快照的源文件内容已改变，请重新上传文件: " + str(handle))
+        return _write_snapshot(_coerce_numeric(pd.read_excel(filepath)), key, folder)
+
+
+def load_snapshot(handle, folder=None):
+    """按快照标识读取输入表；快照尚未生成时按登记的源文件生成。"""
+    folder = folder or SNAPSHOT_FOLDER
+    path = _snapshot_path(_snapshot_key(handle), folder)
+    if path is None:
+        path = build_snapshot(handle, folder)
+    return _read_snapshot(path)
+
+
+def read_table(source, folder=None):
+    """读取一张输入表：source 为快照标识时读取快照，否则按 Excel 文件解析。"""
+    if is_snapshot_handle(source):
+        return load_snapshot(source, folder)
+    return pd.read_excel(source)
+
+
+def preview_table(filepath, n_rows=50):
+    """
+    读取 Excel 第一个工作表的前 n_rows 行用于预览，不解析整个文件。
+    返回 {"df": 前 n_rows 行, "columns": 列名, "row_count": 数据行数（不含表头）, "dimensions": 工作表范围}。
+    xlsx 使用 openpyxl 只读模式流式读取；其他格式退回 pd.read_excel(nrows=...)，此时行数未知（None）。
+    """
+    try:
+        from openpyxl import load_workbook
+        wb = load_workbook(filepath, read_only=True, data_only=True)
+    except Exception:
+        df = pd.read_excel(filepath, nrows=n_rows)
+        return {"df": df, "columns": [str(col) for col in df.columns], "row_count": None, "dimensions": None}
+    try:
+        ws = wb.worksheets[0]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, ())
+        data = [row for _, row in zip(range(n_rows), rows)]
+        if ws.max_row is None:
+            # 文件中没有记录工作表范围时逐行计数（只读模式下仍为流式读取）
+            ws.reset_dimensions()
+            max_row = sum(1 for _ in ws.iter_rows(values_only=True))
+            dimensions = None
+        else:
+            max_row = ws.max_row
+            dimensions = ws.calculate_dimension()
+    finally:
+        wb.close()
+    columns = [str(col) if col is not None else "Unnamed: " + str(i) for i, col in enumerate(header)]
+    width = len(columns)
+    df = pd.DataFrame([list(row[:width]) + [None] * (width - len(row)) for row in data], columns=columns)
+    return {"df": df, "columns": columns, "row_count": max(max_row - 1, 0), "dimensions": dimensions}